@@ -4,6 +4,8 @@
 // 注意：在 Docker 容器中，后端和前端同源（都在 localhost:5000 上由 Flask 提供），所以可以直接用相对路径。
 // 如果是前后端分离部署，则需要配置具体的 API 基础 URL。
 const API_BASE_URL = '/api';
+// 轮询后台任务的最长时间（毫秒）；执行任务的进程退出后服务端约一分钟内会把任务标记为失败
+const JOB_POLL_TIMEOUT_MS = 30 * 60 * 1000;
 
 // --- DOM 元素获取 ---
 const form = document.getElementById('reminder-form');
@@ -17,6 +19,7 @@ const showFormBtn = document.getElementById('show-form-btn');
 const exportCsvBtn = document.getElementById('export-csv-btn');
 const importCsvFileInput = document.getElementById('import-csv-file');
 const importCsvBtn = document.getElementById('import-csv-btn');
+const loadMoreBtn = document.getElementById('load-more-btn');
 
 // --- 新增：登录相关 DOM 元素获取 ---
 const loginSection = document.getElementById('login-section');
@@ -60,6 +63,17 @@ const expiredCountElement = document.getElementById('expired-count');
 let isEditing = false;
 let currentEditId = null;
 
+// 分页状态：已加载的提醒项和下一页游标
+const PAGE_SIZE = 100;
+let loadedReminders = [];
+let nextPageToken = null;
+// 已同步到的数据版本号，用于增量同步（/reminders/changes）
+let dataVersion = null;
+// 增量同步串行执行，避免并发合并同一批变更
+let syncQueue = Promise.resolve();
+// 实时更新连接（/events）的中止控制器
+let changeStreamController = null;
+
 // --- 初始化 ---
 document.addEventListener('DOMContentLoaded', () => {
     // 确保初始密码已设置
@@ -69,6 +83,7 @@ document.addEventListener('DOMContentLoaded', () => {
     if (checkLoginStatus()) {
         showApp(); // 显示主应用
         loadReminders(); // 加载数据
+        connectChangeStream(); // 订阅实时更新
         setupEventListeners(); // 设置事件监听器
         setupEmailEventListeners(); // <-- 新增
         fetchEmailConfig(); // <-- 新增：登录后获取邮箱配置
@@ -146,6 +161,9 @@ function setupEventListeners() {
     // --- 自动续期按钮事件监听 ---
     const autoRenewBtn = document.getElementById('auto-renew-btn');
     addEventListenerOnce(autoRenewBtn, 'click', handleAutoRenew);
+
+    // --- 分页加载更多 ---
+    addEventListenerOnce(loadMoreBtn, 'click', loadMoreReminders);
 }
 
 /**
@@ -340,28 +358,27 @@ function getFetchOptions(options = {}) {
     return options;
 }
 
-// 从后端获取所有提醒项
-async function fetchReminders() {
-    showLoadingSpinner(); // <-- 新增：开始加载时显示
+// 从后端分页获取提醒项，返回 { items, next_page_token }
+// params 支持 limit、page_token、sort、order、status、type、handler、certifier 以及日期范围筛选
+async function fetchReminderPage(params = {}) {
+    showLoadingSpinner();
     try {
-        const response = await fetch(`${API_BASE_URL}/reminders`, getFetchOptions());
+        const query = new URLSearchParams({ limit: PAGE_SIZE, ...params });
+        const response = await fetch(`${API_BASE_URL}/reminders?${query}`, getFetchOptions());
         if (!response.ok) {
-            // 检查是否是认证错误
             if (response.status === 401) {
-                // 会话过期，跳转到登录页
                 handleSessionExpired();
-                return [];
+                return { items: [], next_page_token: null };
             }
             throw new Error(`HTTP error! status: ${response.status}`);
         }
-        const reminders = await response.json();
-        return reminders;
+        return await response.json();
     } catch (error) {
         console.error('获取提醒项失败:', error);
         alert('获取数据失败，请检查服务器连接。');
-        return []; // 返回空数组
+        return { items: [], next_page_token: null };
     } finally {
-        hideLoadingSpinner(); // <-- 新增：无论成功失败都隐藏
+        hideLoadingSpinner();
     }
 }
 
@@ -403,7 +420,7 @@ async function addReminder(reminder) {
         console.log('添加成功:', newReminder);
         form.reset();
         hideForm();
-        loadReminders(); // 重新加载列表以显示新项
+        syncReminderChanges(); // 增量同步列表以显示新项
     } catch (error) {
         console.error('添加提醒项失败:', error);
         alert(`添加失败: ${error.message}`); // 显示具体错误信息
@@ -455,7 +472,7 @@ async function updateReminder(id, updatedReminder) {
         form.reset();
         hideForm();
         toggleEditUI(false);
-        loadReminders(); // 重新加载列表以显示更新
+        syncReminderChanges(); // 增量同步列表以显示更新
     } catch (error) {
         console.error('更新提醒项失败:', error);
         alert(`更新失败: ${error.message}`); // 显示具体错误信息
@@ -503,7 +520,7 @@ async function deleteReminder(id) {
             cancelEdit();
             hideForm();
         }
-        loadReminders(); // 重新加载列表
+        syncReminderChanges(); // 增量同步列表
     } catch (error) {
         console.error('删除提醒项失败:', error);
         alert(`删除失败: ${error.message}`); // 显示具体错误信息
@@ -514,37 +531,35 @@ async function deleteReminder(id) {
 
 // --- 编辑和取消编辑 ---
 function editReminder(id) {
-    // 注意：为了简单起见，我们在这里再次从后端获取单个项的数据
-    // 更高效的做法是在 loadReminders 时将数据缓存起来
-    fetchReminders().then(reminders => {
-        const reminder = reminders.find(item => item.id === id);
-        if (reminder) {
-            document.getElementById('edit-id').value = reminder.id; // 虽然没直接用，但保留以示完整
-            document.getElementById('name').value = reminder.name;
-            document.getElementById('type').value = reminder.type;
-            document.getElementById('certifier').value = reminder.certifier || '';
-            document.getElementById('handler').value = reminder.handler || '';
-            document.getElementById('period').value = reminder.period || '';
-            document.getElementById('startDate').value = reminder.start_date || ''; // 注意字段名映射
-            document.getElementById('endDate').value = reminder.end_date;
-            document.getElementById('advanceDays').value = reminder.advance_days || 0;
-            document.getElementById('actualReminderDate').value = reminder.actual_reminder_date || '';
-            
-            // 自动续期相关字段
-            const autoRenewCheckbox = document.getElementById('autoRenew');
-            const renewPeriodGroup = document.getElementById('renewPeriodGroup');
-            const renewPeriodInput = document.getElementById('renewPeriod');
-            
-            if (autoRenewCheckbox && renewPeriodGroup && renewPeriodInput) {
-                autoRenewCheckbox.checked = reminder.auto_renew === 1 || reminder.auto_renew === true;
-                renewPeriodGroup.style.display = autoRenewCheckbox.checked ? 'block' : 'none';
-                renewPeriodInput.value = reminder.renew_period || 365;
-            }
+    // 编辑按钮只会出现在已加载的行上，直接从已加载的数据中查找
+    const reminder = loadedReminders.find(item => item.id === id);
+    if (!reminder) {
+        return;
+    }
+    document.getElementById('edit-id').value = reminder.id; // 虽然没直接用，但保留以示完整
+    document.getElementById('name').value = reminder.name;
+    document.getElementById('type').value = reminder.type;
+    document.getElementById('certifier').value = reminder.certifier || '';
+    document.getElementById('handler').value = reminder.handler || '';
+    document.getElementById('period').value = reminder.period || '';
+    document.getElementById('startDate').value = reminder.start_date || ''; // 注意字段名映射
+    document.getElementById('endDate').value = reminder.end_date;
+    document.getElementById('advanceDays').value = reminder.advance_days || 0;
+    document.getElementById('actualReminderDate').value = reminder.actual_reminder_date || '';
+    
+    // 自动续期相关字段
+    const autoRenewCheckbox = document.getElementById('autoRenew');
+    const renewPeriodGroup = document.getElementById('renewPeriodGroup');
+    const renewPeriodInput = document.getElementById('renewPeriod');
+    
+    if (autoRenewCheckbox && renewPeriodGroup && renewPeriodInput) {
+        autoRenewCheckbox.checked = reminder.auto_renew === 1 || reminder.auto_renew === true;
+        renewPeriodGroup.style.display = autoRenewCheckbox.checked ? 'block' : 'none';
+        renewPeriodInput.value = reminder.renew_period || 365;
+    }
 
-            toggleEditUI(true, id);
-            showForm();
-        }
-    });
+    toggleEditUI(true, id);
+    showForm();
 }
 
 function cancelEdit() {
@@ -568,239 +583,341 @@ function toggleEditUI(editing, id = null) {
 }
 
 // --- 数据加载和渲染 ---
+// 重新加载第一页（排序、筛选都在后端完成）
 function loadReminders() {
-    fetchReminders().then(reminders => {
-        renderReminders(reminders);
+    updateStats();
+    fetchReminderPage().then(page => {
+        loadedReminders = page.items;
+        nextPageToken = page.next_page_token;
+        dataVersion = page.version ?? null;
+        renderReminders(loadedReminders);
+        // 页面加载时检查提醒
+        if (!isEditing) {
+            checkAndAlertUpcomingReminders();
+        }
     });
 }
 
-// 检查并提醒即将到期的项目 (前端逻辑)
-function checkAndAlertUpcomingReminders(reminders) {
+// 加载下一页并追加到列表末尾
+function loadMoreReminders() {
+    if (!nextPageToken) {
+        return;
+    }
+    fetchReminderPage({ page_token: nextPageToken }).then(page => {
+        loadedReminders = loadedReminders.concat(page.items);
+        nextPageToken = page.next_page_token;
+        renderReminders(page.items, true);
+    });
+}
+
+// 列表的默认排序：实际提醒日期（空值在前）、ID，与后端的排序键一致
+function compareReminders(a, b) {
+    const keyA = a.actual_reminder_date || '';
+    const keyB = b.actual_reminder_date || '';
+    if (keyA !== keyB) {
+        return keyA < keyB ? -1 : 1;
+    }
+    return a.id - b.id;
+}
+
+// 增量同步：只取回上次同步之后新增、修改、删除的提醒项并合并到当前列表
+// refreshStats 为 false 时不重新获取统计（实时更新事件已带有统计）
+function syncReminderChanges(refreshStats = true) {
+    syncQueue = syncQueue.then(() => doSyncReminderChanges(refreshStats));
+    return syncQueue;
+}
+
+async function doSyncReminderChanges(refreshStats) {
+    if (dataVersion === null) {
+        loadReminders();
+        return;
+    }
+    try {
+        const response = await fetch(`${API_BASE_URL}/reminders/changes?since=${dataVersion}`, getFetchOptions());
+        if (!response.ok) {
+            if (response.status === 401) {
+                handleSessionExpired();
+                return;
+            }
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const changes = await response.json();
+        if (changes.reset) {
+            loadReminders();
+            return;
+        }
+        applyReminderChanges(changes);
+        dataVersion = changes.version;
+        if (refreshStats) {
+            updateStats();
+        }
+    } catch (error) {
+        console.error('同步提醒项变更失败:', error);
+        loadReminders();
+    }
+}
+
+// 把变更合并到 loadedReminders，并只更新受影响的表格行
+function applyReminderChanges(changes) {
     const today = new Date();
     today.setHours(0, 0, 0, 0);
 
-    let upcomingReminders = [];
-    reminders.forEach(reminder => {
-        // 假设后端返回的日期是 'YYYY-MM-DD' 格式的字符串
-        const actualReminderDate = new Date(reminder.actual_reminder_date);
-        const endDate = new Date(reminder.end_date);
-        
-        if (actualReminderDate <= today && endDate >= today) {
-            upcomingReminders.push(reminder.name);
+    const removeLoaded = id => {
+        const index = loadedReminders.findIndex(item => item.id === id);
+        if (index !== -1) {
+            loadedReminders.splice(index, 1);
+        }
+        const row = remindersList.querySelector(`tr[data-id="${id}"]`);
+        if (row) {
+            row.remove();
+        }
+    };
+
+    changes.deleted.forEach(removeLoaded);
+
+    changes.changed.forEach(reminder => {
+        removeLoaded(reminder.id);
+        // 还有未加载的页时，排在已加载范围之后的项目留给“加载更多”
+        const last = loadedReminders[loadedReminders.length - 1];
+        if (nextPageToken && last && compareReminders(reminder, last) > 0) {
+            return;
+        }
+        let index = loadedReminders.findIndex(item => compareReminders(reminder, item) < 0);
+        if (index === -1) {
+            index = loadedReminders.length;
+        }
+        const nextItem = loadedReminders[index];
+        loadedReminders.splice(index, 0, reminder);
+        const nextRow = nextItem ? remindersList.querySelector(`tr[data-id="${nextItem.id}"]`) : null;
+        remindersList.insertBefore(createReminderRow(reminder, today), nextRow);
+    });
+
+    noDataMessage.style.display = loadedReminders.length === 0 ? 'block' : 'none';
+}
+
+// --- 实时更新 ---
+// 通过 fetch 读取 Server-Sent Events（EventSource 不能携带登录 header），断线后指数退避重连
+async function connectChangeStream(retryDelay = 1000) {
+    if (changeStreamController || !checkLoginStatus()) {
+        return;
+    }
+    const controller = new AbortController();
+    changeStreamController = controller;
+    try {
+        const headers = {};
+        if (dataVersion !== null) {
+            headers['Last-Event-ID'] = String(dataVersion);
+        }
+        const response = await fetch(`${API_BASE_URL}/events`, getFetchOptions({ headers, signal: controller.signal }));
+        if (!response.ok) {
+            if (response.status === 401) {
+                changeStreamController = null;
+                handleSessionExpired();
+                return;
+            }
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        retryDelay = 1000;
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += value;
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                handleChangeStreamFrame(frame);
+            }
+        }
+    } catch (error) {
+        if (controller.signal.aborted) {
+            return;
+        }
+        console.warn('实时更新连接中断:', error);
+    } finally {
+        if (changeStreamController === controller) {
+            changeStreamController = null;
+        }
+    }
+    if (!controller.signal.aborted && checkLoginStatus()) {
+        setTimeout(() => connectChangeStream(Math.min(retryDelay * 2, 30000)), retryDelay);
+    }
+}
+
+function disconnectChangeStream() {
+    if (changeStreamController) {
+        changeStreamController.abort();
+        changeStreamController = null;
+    }
+}
+
+// 处理一条 SSE 消息（事件 ID 即数据版本号，重连时用 dataVersion 作为 Last-Event-ID）
+function handleChangeStreamFrame(frame) {
+    let eventType = 'message';
+    const dataLines = [];
+    frame.split('\n').forEach(line => {
+        if (line.startsWith(':')) {
+            return; // 心跳注释
+        }
+        const separator = line.indexOf(':');
+        const field = separator === -1 ? line : line.slice(0, separator);
+        const value = separator === -1 ? '' : line.slice(separator + 1).replace(/^ /, '');
+        if (field === 'event') {
+            eventType = value;
+        } else if (field === 'data') {
+            dataLines.push(value);
         }
     });
+    if (dataLines.length === 0) {
+        return;
+    }
+
+    const event = JSON.parse(dataLines.join('\n'));
+    if (eventType === 'stats') {
+        // 服务端合并后推送的统计，只更新计数
+        totalCountElement.textContent = event.stats.total;
+        warningCountElement.textContent = event.stats.warning;
+        expiredCountElement.textContent = event.stats.expired;
+        return;
+    }
+    // 自己的写入已经同步过时版本号相同，不再重复请求；
+    // reminders 事件之后会有 stats 事件，只有范围未知的 resync 需要重新获取统计
+    if (eventType === 'resync' || event.version === undefined || dataVersion === null || event.version > dataVersion) {
+        syncReminderChanges(eventType === 'resync');
+    }
+}
+
+// 检查并提醒即将到期的项目（由后端按状态筛选，不依赖当前已加载的页）
+async function checkAndAlertUpcomingReminders() {
+    const page = await fetchReminderPage({ status: 'warning', limit: 1000 });
+    const upcomingReminders = page.items.map(reminder => reminder.name);
 
     if (upcomingReminders.length > 0) {
         let message = '以下项目即将到期:\n';
         upcomingReminders.forEach(name => {
             message += `- ${name}\n`;
         });
+        if (page.next_page_token) {
+            message += '……\n';
+        }
         alert(message);
     }
 }
 
-// 渲染提醒项列表和状态统计
-function renderReminders(reminders) {
-    // 更新状态统计
-    updateStats(reminders);
+// 根据日期计算提醒项状态
+function getReminderStatus(reminder, today) {
+    const actualReminderDate = new Date(reminder.actual_reminder_date);
+    const endDate = new Date(reminder.end_date);
+
+    if (endDate < today) {
+        return {
+            status: '已过期',
+            statusClass: 'status-expired',
+            statusIcon: '<i class="fas fa-exclamation-circle"></i>', // 过期图标
+            rowClass: 'row-expired'
+        };
+    } else if (actualReminderDate <= today) {
+        return {
+            status: '即将到期',
+            statusClass: 'status-warning',
+            statusIcon: '<i class="fas fa-clock"></i>', // 即将到期图标
+            rowClass: 'row-warning'
+        };
+    }
+    return {
+        status: '正常',
+        statusClass: 'status-normal',
+        statusIcon: '<i class="fas fa-check-circle"></i>', // 默认正常图标
+        rowClass: ''
+    };
+}
+
+// 渲染提醒项列表
+// append 为 true 时只把 reminders 追加到现有列表（加载更多）
+function renderReminders(reminders, append = false) {
+    if (!append) {
+        // 清空现有列表
+        remindersList.innerHTML = '';
+    }
 
-    // 清空现有列表
-    remindersList.innerHTML = '';
+    // 还有下一页时显示“加载更多”按钮
+    if (loadMoreBtn) {
+        loadMoreBtn.style.display = nextPageToken ? 'inline-block' : 'none';
+    }
 
-    if (reminders.length === 0) {
+    if (loadedReminders.length === 0) {
         noDataMessage.style.display = 'block';
-        // 页面加载时检查提醒
-        if (!isEditing) { 
-             checkAndAlertUpcomingReminders(reminders); 
-        }
         return;
     }
 
     noDataMessage.style.display = 'none';
-    
-    // 按实际提醒日期排序（临近的在前）
-    // 注意：排序应在后端做更合适，这里为了简化仍在前端做
-    reminders.sort((a, b) => {
-        return new Date(a.actual_reminder_date) - new Date(b.actual_reminder_date);
-    });
+
+    // 列表已由后端按实际提醒日期排序（临近的在前）
 
     const today = new Date();
     today.setHours(0, 0, 0, 0);
 
     // 遍历并添加到表格
     reminders.forEach(reminder => {
-        const row = document.createElement('tr');
-
-        let status = '正常';
-        let statusClass = 'status-normal';
-        let statusIcon = '<i class="fas fa-check-circle"></i>'; // 默认正常图标
-        let rowClass = '';
-        const actualReminderDate = new Date(reminder.actual_reminder_date);
-        const endDate = new Date(reminder.end_date);
-
-        if (endDate < today) {
-            status = '已过期';
-            statusClass = 'status-expired';
-            statusIcon = '<i class="fas fa-exclamation-circle"></i>'; // 过期图标
-            rowClass = 'row-expired';
-        } else if (actualReminderDate <= today) {
-            status = '即将到期';
-            statusClass = 'status-warning';
-            statusIcon = '<i class="fas fa-clock"></i>'; // 即将到期图标
-            rowClass = 'row-warning';
-        }
-
-        row.className = rowClass;
-
-        // 格式化日期显示 (字段名从 snake_case 映射为 camelCase)
-        const startDateStr = reminder.start_date ? reminder.start_date : '-';
-        const periodStr = reminder.period ? reminder.period : '-';
-
-        row.innerHTML = `
-            <td>${reminder.name}</td>
-            <td>${reminder.type}</td>
-            <td>${reminder.certifier || '-'}</td>
-            <td>${reminder.handler || '-'}</td>
-            <td>${periodStr}</td>
-            <td>${startDateStr}</td>
-            <td>${reminder.end_date}</td>
-            <td>${reminder.advance_days}</td>
-            <td>${reminder.actual_reminder_date}</td>
-            <td class="${statusClass}">${statusIcon} ${status}</td>
-            <td class="action-buttons">
-                <button class="btn btn-sm btn-outline-primary edit-btn" data-id="${reminder.id}"><i class="fas fa-edit"></i> 编辑</button>
-                <button class="btn btn-sm btn-outline-danger delete-btn" data-id="${reminder.id}"><i class="fas fa-trash"></i> 删除</button>
-            </td>
-        `;
-
-        remindersList.appendChild(row);
+        remindersList.appendChild(createReminderRow(reminder, today));
     });
+}
 
-    // 页面加载时检查提醒
-    if (!isEditing) { 
-        checkAndAlertUpcomingReminders(reminders); 
-    }
+// 生成一条提醒项的表格行
+function createReminderRow(reminder, today) {
+    const row = document.createElement('tr');
+    const { status, statusClass, statusIcon, rowClass } = getReminderStatus(reminder, today);
+
+    row.className = rowClass;
+    row.dataset.id = reminder.id;
+
+    // 格式化日期显示 (字段名从 snake_case 映射为 camelCase)
+    const startDateStr = reminder.start_date ? reminder.start_date : '-';
+    const periodStr = reminder.period ? reminder.period : '-';
+
+    row.innerHTML = `
+        <td>${reminder.name}</td>
+        <td>${reminder.type}</td>
+        <td>${reminder.certifier || '-'}</td>
+        <td>${reminder.handler || '-'}</td>
+        <td>${periodStr}</td>
+        <td>${startDateStr}</td>
+        <td>${reminder.end_date}</td>
+        <td>${reminder.advance_days}</td>
+        <td>${reminder.actual_reminder_date}</td>
+        <td class="${statusClass}">${statusIcon} ${status}</td>
+        <td class="action-buttons">
+            <button class="btn btn-sm btn-outline-primary edit-btn" data-id="${reminder.id}"><i class="fas fa-edit"></i> 编辑</button>
+            <button class="btn btn-sm btn-outline-danger delete-btn" data-id="${reminder.id}"><i class="fas fa-trash"></i> 删除</button>
+        </td>
+    `;
 
     // 为新添加的按钮绑定事件
-    document.querySelectorAll('.edit-btn').forEach(button => {
-        button.addEventListener('click', (e) => {
-            const id = parseInt(e.target.getAttribute('data-id'), 10); // ID 是数字
-            editReminder(id);
-        });
+    row.querySelector('.edit-btn').addEventListener('click', (e) => {
+        const id = parseInt(e.currentTarget.getAttribute('data-id'), 10); // ID 是数字
+        editReminder(id);
     });
-
-    document.querySelectorAll('.delete-btn').forEach(button => {
-        button.addEventListener('click', (e) => {
-            const id = parseInt(e.target.getAttribute('data-id'), 10); // ID 是数字
-            deleteReminder(id);
-        });
+    row.querySelector('.delete-btn').addEventListener('click', (e) => {
+        const id = parseInt(e.currentTarget.getAttribute('data-id'), 10); // ID 是数字
+        deleteReminder(id);
     });
+
+    return row;
 }
 
 /**
  * 检查并处理自动续期（仅在用户手动触发时执行）
+ * 续期在后端一次性完成：找出已过期的自动续期项目，跳过已经续期过的，并在一个事务中创建续期项目
  */
 async function handleAutoRenew() {
+    showLoadingSpinner();
     try {
-        // 从后端获取所有提醒项
-        const reminders = await fetchReminders();
-        
-        const today = new Date();
-        today.setHours(0, 0, 0, 0);
-        
-        // 找出需要续期的项目
-        const remindersToRenew = reminders.filter(reminder => {
-            // 检查是否启用了自动续期并且项目已过期
-            if (reminder.auto_renew && (reminder.auto_renew === 1 || reminder.auto_renew === true)) {
-                const endDate = new Date(reminder.end_date);
-                return endDate < today;
-            }
-            return false;
-        });
-        
-        // 如果没有需要续期的项目，直接返回
-        if (remindersToRenew.length === 0) {
-            console.log('没有需要自动续期的项目');
-            return;
-        }
-        
-        console.log(`找到 ${remindersToRenew.length} 个需要续期的项目`);
-        
-        // 逐个处理续期
-        for (const reminder of remindersToRenew) {
-            await createRenewedReminder(reminder);
-        }
-        
-        // 续期完成后重新加载列表
-        loadReminders();
-        alert(`自动续期完成，共处理了 ${remindersToRenew.length} 个项目`);
-    } catch (error) {
-        console.error('处理自动续期时出错:', error);
-        alert('处理自动续期时出错: ' + error.message);
-    }
-}
-
-/**
- * 创建续期后的提醒项
- * @param {Object} originalReminder - 原始提醒项
- */
-async function createRenewedReminder(originalReminder) {
-    // 检查是否已经存在相同名称且日期相近的续期项目，避免重复创建
-    const reminders = await fetchReminders();
-    const existingRenewed = reminders.find(r => 
-        r.name === originalReminder.name && 
-        r.auto_renew === originalReminder.auto_renew &&
-        // 检查是否在原项目结束日期之后的一年内已经存在续期项目
-        new Date(r.start_date) > new Date(originalReminder.end_date) &&
-        new Date(r.start_date) < new Date(new Date(originalReminder.end_date).setFullYear(new Date(originalReminder.end_date).getFullYear() + 1))
-    );
-    
-    if (existingRenewed) {
-        console.log(`项目 "${originalReminder.name}" 已经存在续期项目，跳过创建`);
-        return;
-    }
-    
-    // 计算新的开始日期和结束日期
-    const originalEndDate = new Date(originalReminder.end_date);
-    const newStartDate = new Date(originalEndDate);
-    newStartDate.setDate(newStartDate.getDate() + 1); // 新开始日期是原结束日期的第二天
-    
-    // 计算新的结束日期
-    const renewPeriod = originalReminder.renew_period || 365; // 默认续期周期为365天
-    const newEndDate = new Date(newStartDate);
-    newEndDate.setDate(newEndDate.getDate() + renewPeriod - 1);
-    
-    // 准备新提醒项的数据
-    const newReminder = {
-        name: originalReminder.name,
-        type: originalReminder.type,
-        certifier: originalReminder.certifier,
-        handler: originalReminder.handler,
-        period: originalReminder.period,
-        start_date: newStartDate.toISOString().split('T')[0], // 转换为 YYYY-MM-DD 格式
-        end_date: newEndDate.toISOString().split('T')[0], // 转换为 YYYY-MM-DD 格式
-        advance_days: originalReminder.advance_days,
-        actual_reminder_date: null, // 将由后端重新计算
-        auto_renew: originalReminder.auto_renew,
-        renew_period: originalReminder.renew_period
-    };
-    
-    // 计算实际提醒日期
-    if (newReminder.end_date && newReminder.advance_days !== undefined) {
-        const endDate = new Date(newReminder.end_date);
-        const reminderDate = new Date(endDate);
-        reminderDate.setDate(reminderDate.getDate() - newReminder.advance_days);
-        newReminder.actual_reminder_date = reminderDate.toISOString().split('T')[0];
-    }
-    
-    // 发送请求创建新的提醒项
-    try {
-        const response = await fetch(`${API_BASE_URL}/reminders`, getFetchOptions({
+        const response = await fetch(`${API_BASE_URL}/reminders/auto-renew`, getFetchOptions({
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(newReminder),
         }));
 
         if (!response.ok) {
@@ -824,63 +941,85 @@ async function createRenewedReminder(originalReminder) {
             throw new Error(errorMessage);
         }
 
-        const createdReminder = await response.json();
-        console.log('自动续期成功:', createdReminder);
-        return createdReminder;
+        const result = await response.json();
+        if (result.renewed === 0) {
+            console.log('没有需要自动续期的项目');
+            return;
+        }
+        
+        // 续期完成后增量同步列表
+        syncReminderChanges();
+        alert(result.message);
     } catch (error) {
-        console.error('自动续期失败:', error);
-        throw error; // 重新抛出错误，让调用者处理
+        console.error('处理自动续期时出错:', error);
+        alert('处理自动续期时出错: ' + error.message);
+    } finally {
+        hideLoadingSpinner();
     }
 }
 
-// 更新状态统计显示
-function updateStats(reminders) {
-    const today = new Date();
-    today.setHours(0, 0, 0, 0);
-
-    let totalCount = reminders.length;
-    let warningCount = 0;
-    let expiredCount = 0;
-
-    reminders.forEach(reminder => {
-        const actualReminderDate = new Date(reminder.actual_reminder_date);
-        const endDate = new Date(reminder.end_date);
-
-        if (endDate < today) {
-            expiredCount++;
-        } else if (actualReminderDate <= today) {
-            warningCount++;
+// 更新状态统计显示（由后端聚合统计，不依赖已加载的列表）
+async function updateStats() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/reminders/stats`, getFetchOptions());
+        if (!response.ok) {
+            if (response.status === 401) {
+                handleSessionExpired();
+                return;
+            }
+            throw new Error(`HTTP error! status: ${response.status}`);
         }
-    });
-
-    totalCountElement.textContent = totalCount;
-    warningCountElement.textContent = warningCount;
-    expiredCountElement.textContent = expiredCount;
+        const stats = await response.json();
+        totalCountElement.textContent = stats.total;
+        warningCountElement.textContent = stats.warning;
+        expiredCountElement.textContent = stats.expired;
+    } catch (error) {
+        console.error('获取统计数据失败:', error);
+    }
 }
 
 // --- 新增：导出提醒项到 CSV ---
 /**
- * 触发浏览器下载 CSV 文件
+ * 提交后台导出任务，完成后下载生成的 CSV 文件
  */
-function exportRemindersToCSV() {
-    // 构建导出 API 的 URL
-    const exportUrl = `${API_BASE_URL}/reminders/export`;
-    
-    // 创建一个临时的 <a> 元素
-    const link = document.createElement('a');
-    link.href = exportUrl;
-    // 设置 download 属性，建议文件名 (浏览器支持情况不一，但后端 Header 优先级更高)
-    link.download = 'reminders_export.csv'; 
-    link.style.display = 'none'; // 隐藏链接
-    
-    // 将链接添加到页面中
-    document.body.appendChild(link);
-    
-    // 触发点击事件，浏览器会开始下载
-    link.click();
-    
-    // 清理：从页面中移除临时链接
-    document.body.removeChild(link);
+async function exportRemindersToCSV() {
+    showLoadingSpinner();
+    try {
+        const response = await fetch(`${API_BASE_URL}/reminders/export`, getFetchOptions({ method: 'POST' }));
+        if (!response.ok) {
+            if (response.status === 401) {
+                handleSessionExpired();
+                return;
+            }
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+        }
+        const data = await response.json();
+        const job = await pollJob(data.job_id);
+        if (job.status !== 'succeeded') {
+            throw new Error(job.error || '导出任务未完成');
+        }
+
+        // 带登录头下载文件，再通过临时链接触发浏览器保存
+        const fileResponse = await fetch(`${API_BASE_URL}/jobs/${data.job_id}/download`, getFetchOptions());
+        if (!fileResponse.ok) {
+            throw new Error(`HTTP error! status: ${fileResponse.status}`);
+        }
+        const url = URL.createObjectURL(await fileResponse.blob());
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = 'reminders_export.csv';
+        link.style.display = 'none'; // 隐藏链接
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        URL.revokeObjectURL(url);
+    } catch (error) {
+        console.error('导出 CSV 失败:', error);
+        alert('导出 CSV 失败: ' + error.message);
+    } finally {
+        hideLoadingSpinner();
+    }
 }
 // --- 新增结束 ---
 
@@ -907,8 +1046,8 @@ async function importRemindersFromCSV(fileInput) {
     importCsvBtn.disabled = true;
 
     try {
-        // 3. 发送 POST 请求到后端 API
-        const response = await fetch(`${API_BASE_URL}/reminders/import`, getFetchOptions({
+        // 3. 发送 POST 请求到后端 API（后台导入，立即返回 import_id）
+        const response = await fetch(`${API_BASE_URL}/reminders/import?async=1`, getFetchOptions({
             method: 'POST',
             // 注意：不要设置 Content-Type header，让浏览器自动设置 multipart/form-data
             body: formData
@@ -917,14 +1056,7 @@ async function importRemindersFromCSV(fileInput) {
         // 4. 处理响应
         const data = await response.json();
         
-        if (response.ok) {
-            // 导入成功
-            alert(data.message); // 显示后端返回的成功信息
-            // 清空文件输入框
-            fileInput.value = '';
-            // 重新加载列表以显示新导入的数据
-            loadReminders();
-        } else {
+        if (!response.ok) {
             // 检查是否是认证错误
             if (response.status === 401) {
                 // 会话过期，跳转到登录页
@@ -935,7 +1067,33 @@ async function importRemindersFromCSV(fileInput) {
             // 导入失败
             console.error('导入失败:', data.error);
             alert(`导入失败: ${data.error}`);
+            return;
         }
+
+        // 5. 轮询导入进度，直到导入结束
+        const progress = await pollImportProgress(data.import_id, (current) => {
+            importCsvBtn.textContent = `导入中... 已解析 ${current.rows_parsed} 行`;
+        });
+
+        if (progress.status === 'completed') {
+            let message = `导入成功，共新增 ${progress.rows_inserted} 条记录。`;
+            if (progress.rows_skipped > 0) {
+                message += `\n跳过 ${progress.rows_skipped} 行：\n`;
+                message += progress.skipped.slice(0, 10)
+                    .map(item => `第 ${item.line} 行${item.reason}`)
+                    .join('\n');
+                if (progress.rows_skipped > 10) {
+                    message += '\n……';
+                }
+            }
+            alert(message);
+        } else {
+            alert(`导入失败: ${progress.error}（已导入 ${progress.rows_inserted} 条记录）`);
+        }
+        // 清空文件输入框
+        fileInput.value = '';
+        // 增量同步列表以显示新导入的数据（变更过多时自动整体重新加载）
+        syncReminderChanges();
     } catch (error) {
         // 网络错误或其他异常
         console.error('导入请求失败:', error);
@@ -948,6 +1106,60 @@ async function importRemindersFromCSV(fileInput) {
 }
 // --- 新增结束 ---
 
+/**
+ * 轮询 CSV 导入进度
+ * @param {string} importId - 导入 ID
+ * @param {Function} onProgress - 每次获取到进度后的回调
+ * @param {number} [timeoutMs] - 最长轮询时间，超过后抛出错误
+ * @returns {Promise<Object>} 导入结束时的进度
+ */
+async function pollImportProgress(importId, onProgress, timeoutMs = JOB_POLL_TIMEOUT_MS) {
+    const deadline = Date.now() + timeoutMs;
+    while (true) {
+        if (Date.now() > deadline) {
+            throw new Error('等待导入结果超时，请稍后刷新页面查看导入的数据');
+        }
+        const response = await fetch(`${API_BASE_URL}/reminders/import/${importId}`, getFetchOptions());
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const progress = await response.json();
+        onProgress(progress);
+        if (progress.status !== 'running') {
+            return progress;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+/**
+ * 轮询后台任务直到结束
+ * @param {string} jobId - 任务 ID
+ * @param {Function} [onProgress] - 每次获取到任务状态后的回调
+ * @param {number} [timeoutMs] - 最长轮询时间，超过后抛出错误
+ * @returns {Promise<Object>} 结束时的任务（status 为 succeeded、failed 或 cancelled）
+ */
+async function pollJob(jobId, onProgress, timeoutMs = JOB_POLL_TIMEOUT_MS) {
+    const deadline = Date.now() + timeoutMs;
+    while (true) {
+        if (Date.now() > deadline) {
+            throw new Error('等待任务结果超时，请稍后重试');
+        }
+        const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`, getFetchOptions());
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const job = await response.json();
+        if (onProgress) {
+            onProgress(job);
+        }
+        if (job.status !== 'queued' && job.status !== 'running') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // --- 新增：登录和密码管理函数 ---
 
 /**
@@ -1033,6 +1245,7 @@ async function handleLogin(e) {  // <-- 改为 async
                 sessionStorage.setItem(SESSION_KEY_LOGGED_IN, 'true');
                 showApp();
                 loadReminders(); // 登录后加载数据
+                connectChangeStream(); // 订阅实时更新
                 setupEventListeners(); // 登录后设置所有事件监听器
                 setupEmailEventListeners(); // <-- 新增
                 fetchEmailConfig(); // <-- 新增：登录后获取邮箱配置
@@ -1064,6 +1277,7 @@ async function handleLogin(e) {  // <-- 改为 async
  */
 function handleLogout() {
     sessionStorage.removeItem(SESSION_KEY_LOGGED_IN);
+    disconnectChangeStream();
     showLogin();
     // 可选：重置表单等
     if (form) form.reset();
@@ -1078,6 +1292,7 @@ function handleSessionExpired() {
     alert('登录会话已过期，请重新登录。');
     // 清除登录状态
     sessionStorage.removeItem(SESSION_KEY_LOGGED_IN);
+    disconnectChangeStream();
     // 显示登录界面
     showLogin();
 }
@@ -1402,8 +1617,13 @@ async function handleCheckAndSendEmail(isTest = false) {
             throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
         }
         
+        // 接口立即返回任务 ID，轮询任务直到检查和入队完成
         const data = await response.json();
-        alert(data.message || '邮件发送操作完成');
+        const job = await pollJob(data.job_id);
+        if (job.status !== 'succeeded') {
+            throw new Error(job.error || '检查任务未完成');
+        }
+        alert((job.result && job.result.message) || '邮件发送操作完成');
         console.log('邮件发送响应数据:', data);
         
     } catch (error) {
@@ -1446,8 +1666,13 @@ async function handleCheckAndSendDingtalk(isTest = false) {
             throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
         }
         
+        // 接口立即返回任务 ID，轮询任务直到检查和入队完成
         const data = await response.json();
-        alert(data.message || '钉钉消息发送操作完成');
+        const job = await pollJob(data.job_id);
+        if (job.status !== 'succeeded') {
+            throw new Error(job.error || '检查任务未完成');
+        }
+        alert((job.result && job.result.message) || '钉钉消息发送操作完成');
         console.log('钉钉消息发送响应数据:', data);
         
     } catch (error) {
@@ -1,38 +1,68 @@
 # app.py
 
-from flask import Flask, request, jsonify, send_from_directory, Response
-import sqlite3
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response
 import os
 import csv
 import io
 import json
 import logging
 import traceback
-import ssl # 添加 ssl 模块用于安全连接
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import datetime
 from functools import wraps
-import time
-import hmac
+import tempfile
+import shutil
 import hashlib
-import base64
-import urllib.parse
-import requests
 
+from db import get_db, get_pool_stats
+from settings_cache import settings_cache
+from notification_outbox import (
+    ensure_outbox_schema, list_outbox, outbox_counts, OUTBOX_STATUSES
+)
+from notification_routes import validate_route, list_routes, insert_route, delete_route
+from notification_state import delete_notification_state
+from reminder_engine import reminder_engine
+from email_utils import check_and_notify, check_and_notify_with_report
+from job_runner import job_runner, ensure_jobs_schema, get_job, list_jobs, JOB_STATUSES
+from change_events import change_events, ThrottledPublisher, TooManySubscribersError
+import data_version
+from data_version import ensure_data_version_schema, bump_data_version, get_data_version
+from reminder_changes import ensure_change_tracking_schema, record_tombstone, parse_since, fetch_reminder_changes
+import csv_import
+from auto_renew import ensure_auto_renew_schema, run_auto_renew
+from reminder_queries import (
+    create_reminder_indexes, normalize_reminder_dates,
+    find_malformed_date_reminders,
+    fetch_reminder_page, build_reminder_filters, PAGE_QUERY_PARAMS, SORT_KEYS, DEFAULT_SORT
+)
 
-app = Flask(__name__, static_folder='.')
 
-# 数据库文件路径
-DATABASE = 'reminders.db'
+app = Flask(__name__, static_folder='.')
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 提醒项表（row_version、renewed_from 等后来增加的列由各模块的 ensure_*_schema 添加）
+REMINDERS_TABLE_SQL = '''
+    CREATE TABLE reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        certifier TEXT,
+        handler TEXT,
+        period INTEGER,
+        start_date TEXT,
+        end_date TEXT NOT NULL,
+        advance_days INTEGER NOT NULL,
+        actual_reminder_date TEXT,
+        auto_renew BOOLEAN DEFAULT FALSE,
+        renew_period INTEGER
+    )
+'''
+
+
 def init_db():
     """初始化数据库表"""
-    with sqlite3.connect(DATABASE) as conn:
+    with get_db() as conn:
         cursor = conn.cursor()
         
         # 检查 reminders 表是否存在 auto_renew 字段
@@ -40,28 +70,16 @@ def init_db():
         columns = cursor.fetchall()
         column_names = [column[1] for column in columns]
         
-        if 'auto_renew' not in column_names:
+        if not column_names:
+            # 新数据库：直接创建表
+            cursor.execute(REMINDERS_TABLE_SQL)
+        elif 'auto_renew' not in column_names:
             # 如果没有 auto_renew 字段，需要重建表
             # 1. 重命名原表
             cursor.execute("ALTER TABLE reminders RENAME TO reminders_old")
             
             # 2. 创建新表
-            cursor.execute('''
-                CREATE TABLE reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    type TEXT NOT NULL,
-                    certifier TEXT,
-                    handler TEXT,
-                    period INTEGER,
-                    start_date TEXT,
-                    end_date TEXT NOT NULL,
-                    advance_days INTEGER NOT NULL,
-                    actual_reminder_date TEXT,
-                    auto_renew BOOLEAN DEFAULT FALSE,
-                    renew_period INTEGER
-                )
-            ''')
+            cursor.execute(REMINDERS_TABLE_SQL)
             
             # 3. 从旧表复制数据到新表
             cursor.execute('''
@@ -77,6 +95,21 @@ def init_db():
             # 4. 删除旧表
             cursor.execute("DROP TABLE reminders_old")
         
+        # --- 创建到期窗口查询使用的索引 ---
+        create_reminder_indexes(cursor)
+
+        # --- 自动续期使用的 renewed_from 列和索引 ---
+        ensure_auto_renew_schema(cursor)
+
+        # --- 增量同步使用的 row_version 列和墓碑表 ---
+        ensure_change_tracking_schema(cursor)
+
+        # --- 通知发件箱 ---
+        ensure_outbox_schema(cursor)
+
+        # --- 后台任务 ---
+        ensure_jobs_schema(cursor)
+        
         # --- 创建 settings 表 ---
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS settings (
@@ -85,6 +118,9 @@ def init_db():
             )
         ''')
         
+        # --- 创建 data_versions 表（ETag 使用的数据版本号） ---
+        ensure_data_version_schema(cursor)
+
         # --- 检查并初始化密码 ---
         cursor.execute("SELECT value FROM settings WHERE key = 'password'")
         row = cursor.fetchone()
@@ -134,250 +170,166 @@ init_db()
 
 # --- 工具函数 ---
 
-def send_reminder_email(upcoming_reminders):
+def get_cached_reminder_stats(version=None):
     """
-    发送即将到期提醒邮件
-    :param upcoming_reminders: 即将到期的提醒项列表
+    获取提醒项统计（来自 reminder_engine 当天的评估结果，数据版本号未变化时不执行查询）
+
+    :param version: 调用方已读取的 reminders 数据版本号，不传时查询数据库
     """
-    try:
-        # 1. 从数据库获取邮件配置
-        config = {}
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            for key in ['smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'recipient_email']:
-                cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-                row = cursor.fetchone()
-                config[key] = row[0] if row else ''
-
-        # 2. 验证配置是否完整
-        required_keys = ['smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'recipient_email']
-        # 注意：密码字段可能是空字符串（表示不修改），所以不强制要求
-        # 但其他字段必须提供
-        for key in required_keys:
-            if key != 'sender_password' and (key not in config or not config[key]):
-                 msg = f"警告: 邮件配置不完整，缺少字段: {key}"
-                 print(msg)
-                 logging.warning(msg)
-                 return False # 表示未发送
-
-        # 3. 准备邮件内容
-        subject = "证照即将到期提醒"
-        body = "您好，\n\n以下证照即将到期，请及时处理：\n\n"
-        for reminder in upcoming_reminders:
-            body += f"- {reminder['name']} (类型: {reminder['type']}, 到期日期: {reminder['end_date']})\n"
-        body += "\n请登录系统查看详情。\n\n谢谢！"
-
-        # 4. 创建 MIMEText 对象并处理多个收件人
-        recipient_string = config.get('recipient_email', '')
-        if not recipient_string:
-            logging.warning("邮件收件人未配置，无法发送邮件。")
-            return False
-            
-        # 将逗号分隔的字符串拆分为列表，并去除多余的空格
-        recipient_list = [email.strip() for email in recipient_string.split(',') if email.strip()]
-        if not recipient_list:
-            logging.warning("邮件收件人列表为空，无法发送邮件。")
-            return False
-
-        message = MIMEMultipart()
-        message["From"] = config['sender_email']
-        message["To"] = ", ".join(recipient_list) # 在邮件头中显示所有收件人
-        message["Subject"] = subject
-        message.attach(MIMEText(body, "plain", 'utf-8')) # 指定编码
-
-        # 5. 连接 SMTP 服务器并发送邮件
-        # 将端口号转换为整数
-        port = int(config['smtp_port'])
-        # 创建安全的 SSL 上下文
-        context = ssl.create_default_context()
-
-        # 根据端口号选择连接方式
-        if port == 465:
-            # 使用 SMTP_SSL 连接（适用于端口 465）
-            with smtplib.SMTP_SSL(config['smtp_server'], port, context=context) as server:
-                server.login(config['sender_email'], config['sender_password'])
-                text = message.as_string()
-                # sendmail 的第二个参数需要一个收件人列表
-                server.sendmail(config['sender_email'], recipient_list, text)
-        else:
-            # 使用普通 SMTP 连接并启动 TLS（适用于端口 587 等）
-            with smtplib.SMTP(config['smtp_server'], port) as server:
-                server.starttls(context=context) # 启用 TLS 加密
-                server.login(config['sender_email'], config['sender_password'])
-                text = message.as_string()
-                # sendmail 的第二个参数需要一个收件人列表
-                server.sendmail(config['sender_email'], recipient_list, text)
-
-        msg = f"邮件已成功发送至 {', '.join(recipient_list)}"
-        print(msg)
-        logging.info(msg)
-        return True # 表示发送成功
+    return reminder_engine.evaluate(version=version).stats
 
-    except Exception as e:
-        msg = f"发送邮件时发生错误: {e}"
-        print(msg)
-        logging.error(msg)
-        traceback.print_exc() # 打印堆栈跟踪，便于调试
-        return False # 表示发送失败
 
+# 统计事件的最短推送间隔（秒）：导入等连续写入期间最多每秒重新评估一次统计
+STATS_EVENT_INTERVAL = float(os.environ.get('REMINDER_STATS_EVENT_INTERVAL', '1'))
 
-def check_upcoming_reminders_for_email():
+
+def build_stats_event():
+    """生成实时更新推送的统计事件：当前数据版本号和各状态的计数"""
+    version = get_data_version(data_version.REMINDERS)
+    stats = get_cached_reminder_stats(version)
+    # 只推送状态计数，按类型/办事员的分布仍通过 /api/reminders/stats 获取
+    return {
+        'type': 'stats', 'version': version,
+        'stats': {key: stats[key] for key in ('total', 'normal', 'warning', 'expired')},
+    }
+
+
+# 统计需要评估整张表，不随每次写入计算，而是合并后在后台线程中推送
+stats_events = ThrottledPublisher(change_events, build_stats_event, STATS_EVENT_INTERVAL)
+
+
+def build_change_event(upserted, deleted, created):
+    """生成实时更新推送的变更事件：变更的 ID 和当前数据版本号（统计由 stats 事件单独推送）"""
+    version = get_data_version(data_version.REMINDERS)
+    event = {'type': 'reminders', 'version': version}
+    if upserted is None and deleted is None:
+        # 变更范围未知，客户端按版本号增量同步
+        event['type'] = 'resync'
+        return event
+    upserted_ids = [row['id'] for row in upserted or []]
+    if created is True:
+        created = upserted_ids
+    created = set(created or [])
+    event['created'] = [reminder_id for reminder_id in upserted_ids if reminder_id in created]
+    event['updated'] = [reminder_id for reminder_id in upserted_ids if reminder_id not in created]
+    event['deleted'] = list(deleted or [])
+    return event
+
+
+def format_sse(event, event_id=None):
+    """把事件字典编码为一条 Server-Sent Events 消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"event: {event['type']}")
+    lines.append('data: ' + json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def conditional_response(etag, build_response, headers=None):
     """
-    检查即将到期的项目并发送邮件 (供后端定时任务或 API 调用)
+    按 ETag 处理条件请求
+
+    请求头 If-None-Match 与 etag 一致时直接返回 304，不调用 build_response；
+    否则调用 build_response() 生成响应。两种情况都带上 ETag 头（以及 headers 中的附加头），
+    Cache-Control: no-cache 让浏览器每次都带 If-None-Match 重新验证。
     """
-    try:
-        with sqlite3.connect(DATABASE) as conn:
-            conn.row_factory = sqlite3.Row # 使行可以通过列名访问
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM reminders ORDER BY actual_reminder_date')
-            rows = cursor.fetchall()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = build_response()
+        if isinstance(response, tuple):
+            response, status = response
+            if status != 200:
+                return response, status
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+def make_etag(name, version, *parts):
+    """
+    由数据版本号生成 ETag；结果依赖查询参数或当前日期时把它们放在 parts 中
+    """
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:12]
+    return f'{name}-{version}-{digest}'
 
-        reminders = [dict(row) for row in rows] # 转换为字典列表
 
-        today = datetime.date.today()
-        upcoming_reminders = []
+# 提醒项变更的监听函数，签名为 listener(upserted, deleted)，例如提醒调度器
+reminder_change_listeners = []
 
-        for reminder in reminders:
-            # 将日期字符串转换为 date 对象进行比较
-            try:
-                actual_reminder_date = datetime.datetime.strptime(reminder['actual_reminder_date'], "%Y-%m-%d").date()
-                end_date = datetime.datetime.strptime(reminder['end_date'], "%Y-%m-%d").date()
-
-                # 检查实际提醒日期是否已到（<= 今天） 且 未过期 (结束日期 >= 今天)
-                if actual_reminder_date <= today and end_date >= today:
-                    upcoming_reminders.append(reminder)
-            except (ValueError, TypeError) as e:
-                msg = f"警告: 处理提醒项 ID {reminder.get('id', 'unknown')} 的日期时出错: {e}"
-                print(msg)
-                logging.warning(msg)
-
-        if upcoming_reminders:
-            print(f"发现 {len(upcoming_reminders)} 个即将到期的项目。")
-            success = send_reminder_email(upcoming_reminders)
-            if success:
-                print("已发送提醒邮件。")
-            else:
-                print("提醒邮件发送失败。")
-            return upcoming_reminders # 返回即将到期的列表
-        else:
-            print("当前没有即将到期的项目。")
-            return []
-    except Exception as e:
-        msg = f"检查即将到期项目时发生错误: {e}"
-        print(msg)
-        logging.error(msg)
-        traceback.print_exc()
-        return []
+
+def add_reminder_change_listener(listener):
+    """注册提醒项变更监听函数"""
+    reminder_change_listeners.append(listener)
 
 
-def send_dingtalk_message(message):
+def notify_reminders_changed(upserted=None, deleted=None, created=None):
     """
-    发送钉钉消息
-    :param message: 要发送的消息内容
+    提醒项数据发生变化（增、删、改、导入）后调用，使相关缓存失效、通知监听函数
+    并向实时更新的订阅者发布变更事件
+
+    :param upserted: 新增或修改后的提醒项（至少包含 id、actual_reminder_date、end_date 的字典）
+    :param deleted: 被删除的提醒项 ID 列表
+    :param created: upserted 中属于新建的 ID，为 True 表示全部是新建
+    upserted 和 deleted 都为 None 表示变更范围未知，监听函数应整体重新加载
     """
-    try:
-        # 1. 从数据库获取钉钉配置
-        config = {}
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            for key in ['dingtalk_webhook', 'dingtalk_secret']:
-                cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-                row = cursor.fetchone()
-                config[key] = row[0] if row else ''
-
-        webhook_url = config.get('dingtalk_webhook')
-        secret = config.get('dingtalk_secret')
-
-        if not webhook_url:
-            logging.warning("钉钉 Webhook URL 未配置，无法发送消息。")
-            return False
-
-        # 2. 如果有密钥，进行签名
-        if secret:
-            timestamp = str(round(time.time() * 1000))
-            secret_enc = secret.encode('utf-8')
-            string_to_sign = '{}\n{}'.format(timestamp, secret)
-            string_to_sign_enc = string_to_sign.encode('utf-8')
-            hmac_code = hmac.new(secret_enc, string_to_sign_enc, digestmod=hashlib.sha256).digest()
-            sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
-            final_webhook_url = f"{webhook_url}&timestamp={timestamp}&sign={sign}"
-        else:
-            final_webhook_url = webhook_url
-
-        # 3. 准备消息内容 (Markdown 格式)
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "title": "证照到期提醒",
-                "text": message
-            }
-        }
+    reminder_engine.invalidate()
 
-        # 4. 发送请求
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(final_webhook_url, data=json.dumps(payload), headers=headers)
-        response.raise_for_status()  # 如果请求失败，会抛出 HTTPError
+    if change_events.has_subscribers():
+        try:
+            change_events.publish(build_change_event(upserted, deleted, created))
+            stats_events.request()
+        except Exception as e:
+            logging.error(f"发布提醒项变更事件失败: {e}")
 
-        result = response.json()
-        if result.get("errcode") == 0:
-            logging.info("钉钉消息发送成功。")
-            return True
-        else:
-            logging.error(f"钉钉消息发送失败: {result.get('errmsg')}")
-            return False
+    for listener in reminder_change_listeners:
+        try:
+            listener(upserted, deleted)
+        except Exception as e:
+            logging.error(f"提醒项变更监听函数执行失败: {e}")
+            traceback.print_exc()
 
-    except Exception as e:
-        logging.error(f"发送钉钉消息时发生错误: {e}")
-        traceback.print_exc()
-        return False
 
-def check_upcoming_reminders_for_dingtalk():
+def auto_renew_reminders():
     """
-    检查即将到期的项目并发送钉钉消息
+    为已过期的自动续期项目生成下一周期 (供后端定时任务或 API 调用)
     """
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM reminders ORDER BY actual_reminder_date')
-            rows = cursor.fetchall()
+        if not reminder_engine.evaluate().renewable_ids:
+            # 当天的评估中没有需要续期的项目，不必获取写锁
+            return {'renewed': 0, 'passes': 0, 'new_ids': [], 'new_reminders': []}
+        result = run_auto_renew()
+        if result['renewed']:
+            notify_reminders_changed(upserted=result['new_reminders'], created=True)
+        return result
+    except Exception as e:
+        msg = f"自动续期时发生错误: {e}"
+        print(msg)
+        logging.error(msg)
+        traceback.print_exc()
+        raise
 
-        reminders = [dict(row) for row in rows]
 
-        today = datetime.date.today()
-        upcoming_reminders = []
+def check_upcoming_reminders_for_email():
+    """
+    检查即将到期的项目并将提醒邮件加入发送队列 (供后端定时任务或 API 调用)
 
-        for reminder in reminders:
-            try:
-                actual_reminder_date = datetime.datetime.strptime(reminder['actual_reminder_date'], "%Y-%m-%d").date()
-                end_date = datetime.datetime.strptime(reminder['end_date'], "%Y-%m-%d").date()
-
-                if actual_reminder_date <= today and end_date >= today:
-                    upcoming_reminders.append(reminder)
-            except (ValueError, TypeError) as e:
-                logging.warning(f"处理提醒项 ID {reminder.get('id', 'unknown')} 的日期时出错: {e}")
-
-        if upcoming_reminders:
-            message = "### 证照即将到期提醒\n\n"
-            for reminder in upcoming_reminders:
-                message += f"- **{reminder['name']}** (类型: {reminder['type']}, 到期日期: {reminder['end_date']})\n"
-            
-            message += "\n请登录系统查看详情。"
-            
-            success = send_dingtalk_message(message)
-            if success:
-                print("已发送钉钉提醒消息。")
-            else:
-                print("钉钉提醒消息发送失败。")
-            return upcoming_reminders
-        else:
-            print("当前没有即将到期的项目。")
-            return []
+    只选出需要发送新通知的项目（首次进入提醒窗口、距上次通知满一周、到期当天），
+    已经通知过的项目不会每天重复出现在邮件中。到期项目来自 reminder_engine 的评估结果。
+    """
+    try:
+        return check_and_notify(('email',))
     except Exception as e:
-        logging.error(f"检查即将到期的项目以发送钉钉消息时发生错误: {e}")
+        msg = f"检查即将到期项目时发生错误: {e}"
+        print(msg)
+        logging.error(msg)
         traceback.print_exc()
         return []
 
+
 # --- API Routes ---
 
 # 创建一个装饰器来检查登录状态
@@ -390,25 +342,211 @@ def require_login(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# 新增和更新提醒项时的必填字段
+REMINDER_REQUIRED_FIELDS = ['name', 'type', 'end_date', 'advance_days']
+
+# 批量接口单次最多接受的操作数
+MAX_BATCH_OPERATIONS = 5000
+
+
+def validate_reminder_data(data):
+    """
+    校验并规范化新增/更新提醒项的数据（原地修改 data）
+
+    :return: 错误信息，校验通过时返回 None
+    """
+    if not isinstance(data, dict):
+        return '请求数据必须是 JSON 对象'
+
+    # 检查必填字段
+    for field in REMINDER_REQUIRED_FIELDS:
+        if field not in data or not data[field]:
+            return f'缺少必填字段: {field}'
+
+    # 日期统一规范化为 YYYY-MM-DD，保证按日期的索引查询结果正确
+    try:
+        normalize_reminder_dates(data)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+# 以下写入函数的 version 参数是本次事务 bump_data_version() 返回的版本号，记录到 row_version 列
+
+def insert_reminder_row(cursor, data, version):
+    """插入一条已校验的提醒项，返回新 ID"""
+    cursor.execute('''
+        INSERT INTO reminders (
+            name, type, certifier, handler, period, 
+            start_date, end_date, advance_days, actual_reminder_date,
+            auto_renew, renew_period, row_version
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        data['name'], data['type'], data.get('certifier'), data.get('handler'),
+        data.get('period'), data.get('start_date'), data['end_date'],
+        data['advance_days'], data.get('actual_reminder_date'),
+        data.get('auto_renew', False), data.get('renew_period'), version
+    ))
+    return cursor.lastrowid
+
+
+def update_reminder_row(cursor, reminder_id, data, version):
+    """更新一条已校验的提醒项，返回是否找到该行"""
+    cursor.execute('''
+        UPDATE reminders SET
+            name = ?, type = ?, certifier = ?, handler = ?, period = ?,
+            start_date = ?, end_date = ?, advance_days = ?, actual_reminder_date = ?,
+            auto_renew = ?, renew_period = ?, row_version = ?
+        WHERE id = ?
+    ''', (
+        data['name'], data['type'], data.get('certifier'), data.get('handler'),
+        data.get('period'), data.get('start_date'), data['end_date'],
+        data['advance_days'], data.get('actual_reminder_date'),
+        data.get('auto_renew', False), data.get('renew_period'), version, reminder_id
+    ))
+    return cursor.rowcount > 0
+
+
+def delete_reminder_row(cursor, reminder_id, version):
+    """删除一条提醒项并记录墓碑，返回是否找到该行"""
+    cursor.execute('DELETE FROM reminders WHERE id = ?', (reminder_id,))
+    if cursor.rowcount <= 0:
+        return False
+    record_tombstone(cursor, reminder_id, version)
+    delete_notification_state(cursor, reminder_id)
+    return True
+
+
 @app.route('/api/reminders', methods=['GET'])
 @require_login
 def get_reminders():
-    """获取所有提醒项"""
+    """
+    获取提醒项
+
+    不带查询参数时返回全部提醒项的数组（兼容旧的调用方式）。
+    带有 limit/page_token/sort/order/status/type/handler/certifier 或日期范围参数时，
+    返回分页结果 {'items': [...], 'next_page_token': ...}，下一页用 page_token 请求。
+    支持 If-None-Match：数据版本未变时返回 304。
+    """
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM reminders ORDER BY actual_reminder_date')
-            rows = cursor.fetchall()
-            
-            # 获取列名
-            column_names = [description[0] for description in cursor.description]
-            
-            # 将 rows 转换为字典列表
-            reminders = [dict(zip(column_names, row)) for row in rows]
-            return jsonify(reminders), 200
+        paged = any(param in request.args for param in PAGE_QUERY_PARAMS)
+        with get_db() as conn:
+            # 状态筛选依赖当前日期，ETag 中包含日期和查询参数
+            version = get_data_version(data_version.REMINDERS, conn)
+            etag = make_etag('reminders', version, datetime.date.today(), request.query_string)
+
+            def build_response():
+                if paged:
+                    try:
+                        page = fetch_reminder_page(conn, request.args)
+                    except ValueError as e:
+                        return jsonify({'error': str(e)}), 400
+                    # 客户端之后用这个版本号调用 /api/reminders/changes 做增量同步
+                    page['version'] = version
+                    return jsonify(page), 200
+
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM reminders ORDER BY actual_reminder_date')
+                rows = cursor.fetchall()
+                
+                # 获取列名
+                column_names = [description[0] for description in cursor.description]
+                
+                # 将 rows 转换为字典列表
+                reminders = [dict(zip(column_names, row)) for row in rows]
+                return jsonify(reminders), 200
+
+            return conditional_response(etag, build_response, {'X-Data-Version': str(version)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/reminders/changes', methods=['GET'])
+@require_login
+def get_reminder_changes():
+    """
+    增量同步：返回版本号 since 之后新增、修改和删除的提醒项
+
+    返回 {'version': 当前版本号, 'changed': [...], 'deleted': [ID...], 'reset': bool}，
+    reset 为 true 时变更过多，客户端应重新加载列表。
+    """
+    try:
+        try:
+            since = parse_since(request.args.get('since'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with get_db() as conn:
+            # 在一个读事务中读取版本号和变更，得到一致的快照
+            conn.execute('BEGIN')
+            version = get_data_version(data_version.REMINDERS, conn)
+            changes = fetch_reminder_changes(conn, since, version)
+        return jsonify(changes), 200
+    except Exception as e:
+        logging.error(f"查询提醒项变更失败: {e}")
+        return jsonify({'error': '查询提醒项变更失败'}), 500
+
+# 实时更新连接的心跳间隔（秒）；心跳时顺便检查其他进程写入导致的版本变化
+EVENT_STREAM_HEARTBEAT = 15
+
+
+@app.route('/api/events', methods=['GET'])
+@require_login
+def stream_events():
+    """
+    实时更新：以 Server-Sent Events 推送提醒项变更
+
+    事件类型：
+    - reminders: {'version', 'created', 'updated', 'deleted'}
+    - stats: {'version', 'stats'}，写入后最多每 STATS_EVENT_INTERVAL 秒推送一次（连续写入合并为一次）
+    - resync: 变更范围未知（批量变更、其他进程的写入或客户端消费过慢），客户端应按版本号增量同步
+      并重新获取统计
+    事件 ID 为数据版本号，重连时通过 Last-Event-ID 补发一次 resync。
+    """
+    try:
+        subscription = change_events.subscribe()
+    except TooManySubscribersError as e:
+        return jsonify({'error': str(e)}), 503
+
+    last_event_id = request.headers.get('Last-Event-ID')
+
+    def generate():
+        try:
+            sent_version = get_data_version(data_version.REMINDERS)
+            yield 'retry: 5000\n\n'
+            if last_event_id and last_event_id != str(sent_version):
+                yield format_sse({'type': 'resync', 'version': sent_version}, sent_version)
+
+            while True:
+                event = subscription.get(timeout=EVENT_STREAM_HEARTBEAT)
+                if event is None or 'version' not in event:
+                    version = get_data_version(data_version.REMINDERS)
+                    if event is None and version == sent_version:
+                        yield ': keepalive\n\n'
+                        continue
+                    event = {'type': 'resync', 'version': version}
+                sent_version = max(sent_version, event['version'])
+                yield format_sse(event, sent_version)
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # 禁止反向代理缓冲
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/reminders/stats', methods=['GET'])
+@require_login
+def get_reminders_stats():
+    """获取提醒项统计：总数、正常、即将到期、已过期，以及按类型和办事员的分布"""
+    try:
+        version = get_data_version(data_version.REMINDERS)
+        etag = make_etag('stats', version, datetime.date.today())
+        return conditional_response(etag, lambda: (jsonify(get_cached_reminder_stats(version)), 200))
+    except Exception as e:
+        logging.error(f"获取提醒项统计失败: {e}")
+        return jsonify({'error': '获取提醒项统计失败'}), 500
+
 @app.route('/api/reminders', methods=['POST'])
 @require_login
 def add_reminder():
@@ -416,37 +554,21 @@ def add_reminder():
     try:
         data = request.get_json()
         
-        # 检查必填字段
-        required_fields = ['name', 'type', 'end_date', 'advance_days']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'缺少必填字段: {field}'}), 400
+        # 检查必填字段并规范化日期
+        error = validate_reminder_data(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO reminders (
-                    name, type, certifier, handler, period, 
-                    start_date, end_date, advance_days, actual_reminder_date,
-                    auto_renew, renew_period
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data['name'], data['type'], data.get('certifier'), data.get('handler'),
-                data.get('period'), data.get('start_date'), data['end_date'],
-                data['advance_days'], data.get('actual_reminder_date'),
-                data.get('auto_renew', False), data.get('renew_period')
-            ))
-            conn.commit()
-            new_id = cursor.lastrowid
-            
-        # 返回新创建的提醒项
-        with sqlite3.connect(DATABASE) as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
+            version = bump_data_version(cursor, data_version.REMINDERS)
+            new_id = insert_reminder_row(cursor, data, version)
+
+            # 在同一个连接上读回新创建的提醒项
             cursor.execute('SELECT * FROM reminders WHERE id = ?', (new_id,))
-            row = cursor.fetchone()
-            column_names = [description[0] for description in cursor.description]
-            new_reminder = dict(zip(column_names, row))
-            
+            new_reminder = dict(cursor.fetchone())
+
+        notify_reminders_changed(upserted=[new_reminder], created=True)
         return jsonify(new_reminder), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -458,41 +580,26 @@ def update_reminder(reminder_id):
     try:
         data = request.get_json()
         
-        # 检查必填字段
-        required_fields = ['name', 'type', 'end_date', 'advance_days']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'缺少必填字段: {field}'}), 400
+        # 检查必填字段并规范化日期
+        error = validate_reminder_data(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        with sqlite3.connect(DATABASE) as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE reminders SET
-                    name = ?, type = ?, certifier = ?, handler = ?, period = ?,
-                    start_date = ?, end_date = ?, advance_days = ?, actual_reminder_date = ?,
-                    auto_renew = ?, renew_period = ?
-                WHERE id = ?
-            ''', (
-                data['name'], data['type'], data.get('certifier'), data.get('handler'),
-                data.get('period'), data.get('start_date'), data['end_date'],
-                data['advance_days'], data.get('actual_reminder_date'),
-                data.get('auto_renew', False), data.get('renew_period'), reminder_id
-            ))
-            conn.commit()
-            
-            if cursor.rowcount == 0:
+            version = bump_data_version(cursor, data_version.REMINDERS)
+            if not update_reminder_row(cursor, reminder_id, data, version):
+                conn.rollback()
                 return jsonify({'error': 'Reminder not found'}), 404
-                
-        # 返回更新后的提醒项
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
+
+            # 在同一个连接上读回更新后的提醒项
             cursor.execute('SELECT * FROM reminders WHERE id = ?', (reminder_id,))
             row = cursor.fetchone()
             if not row:
                 return jsonify({'error': 'Reminder not found after update'}), 404
-            column_names = [description[0] for description in cursor.description]
-            updated_reminder = dict(zip(column_names, row))
-            
+            updated_reminder = dict(row)
+
+        notify_reminders_changed(upserted=[updated_reminder])
         return jsonify(updated_reminder), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -502,63 +609,217 @@ def update_reminder(reminder_id):
 def delete_reminder(reminder_id):
     """删除提醒项"""
     try:
-        with sqlite3.connect(DATABASE) as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM reminders WHERE id = ?', (reminder_id,))
-            conn.commit()
-            
-            if cursor.rowcount == 0:
+            version = bump_data_version(cursor, data_version.REMINDERS)
+            if not delete_reminder_row(cursor, reminder_id, version):
+                conn.rollback()
                 return jsonify({'error': 'Reminder not found'}), 404
-                
+
+        notify_reminders_changed(deleted=[reminder_id])
         return '', 204  # No Content
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+class BatchAbort(Exception):
+    """批量操作中某一项失败，整批回滚"""
+
+
+@app.route('/api/reminders/batch', methods=['POST'])
+@require_login
+def batch_reminders():
+    """
+    批量新增/更新/删除提醒项，所有操作在同一个事务中执行
+
+    请求体: {"operations": [
+        {"op": "create", "data": {...}},
+        {"op": "update", "id": 1, "data": {...}},
+        {"op": "delete", "id": 2}
+    ]}
+    校验规则与单条新增/更新接口相同。任一操作失败时整批回滚，
+    返回的 results 中逐项给出状态码和错误信息。
+    """
+    try:
+        body = request.get_json(silent=True)
+        operations = body.get('operations') if isinstance(body, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations 必须是非空数组'}), 400
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({'error': f'单次最多 {MAX_BATCH_OPERATIONS} 个操作'}), 400
+
+        # 1. 先校验全部操作，有任何错误都不写库
+        results = []
+        for index, operation in enumerate(operations):
+            result = {'index': index, 'op': None, 'status': 200}
+            results.append(result)
+            if not isinstance(operation, dict):
+                result.update(status=400, error='操作必须是 JSON 对象')
+                continue
+            op = operation.get('op')
+            result['op'] = op
+            if op not in ('create', 'update', 'delete'):
+                result.update(status=400, error=f'不支持的操作: {op}')
+                continue
+            if op in ('update', 'delete'):
+                reminder_id = operation.get('id')
+                if not isinstance(reminder_id, int) or isinstance(reminder_id, bool):
+                    result.update(status=400, error='缺少有效的 id')
+                    continue
+                result['id'] = reminder_id
+            if op in ('create', 'update'):
+                error = validate_reminder_data(operation.get('data'))
+                if error:
+                    result.update(status=400, error=error)
+
+        if any(result['status'] != 200 for result in results):
+            return jsonify({'error': '批量操作校验失败，未做任何修改', 'results': results}), 400
+
+        # 2. 在一个事务中依次执行，任一项找不到目标行则整批回滚
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                version = bump_data_version(cursor, data_version.REMINDERS)
+                for operation, result in zip(operations, results):
+                    op = operation['op']
+                    if op == 'create':
+                        result['id'] = insert_reminder_row(cursor, operation['data'], version)
+                        result['status'] = 201
+                    elif op == 'update':
+                        if not update_reminder_row(cursor, result['id'], operation['data'], version):
+                            result.update(status=404, error='Reminder not found')
+                            raise BatchAbort()
+                    else:
+                        if not delete_reminder_row(cursor, result['id'], version):
+                            result.update(status=404, error='Reminder not found')
+                            raise BatchAbort()
+                        result['status'] = 204
+        except BatchAbort:
+            for result in results:
+                if result['status'] in (200, 201, 204):
+                    # 已执行的操作随事务一起回滚；新增项回滚后 ID 无意义
+                    result['status'] = 424
+                    result['error'] = '因其他操作失败而未生效'
+                    if result['op'] == 'create':
+                        result.pop('id', None)
+            return jsonify({'error': '批量操作失败，已全部回滚', 'results': results}), 404
+
+        upserted = [
+            dict(operation['data'], id=result['id'])
+            for operation, result in zip(operations, results) if operation['op'] != 'delete'
+        ]
+        deleted = [result['id'] for operation, result in zip(operations, results) if operation['op'] == 'delete']
+        created = [result['id'] for result in results if result['op'] == 'create']
+        notify_reminders_changed(upserted=upserted, deleted=deleted, created=created)
+        return jsonify({'message': f'批量操作成功，共 {len(results)} 项', 'results': results}), 200
+    except Exception as e:
+        logging.error(f"批量操作提醒项失败: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+# 导出 CSV 的列：(字段名, 表头)，默认导出前 10 列，与导入的列顺序一致
+EXPORT_COLUMNS = [
+    ('id', 'ID'), ('name', '名称'), ('type', '类型'), ('certifier', '认证人员'),
+    ('handler', '办事员'), ('period', '周期(天)'), ('start_date', '开始日期'),
+    ('end_date', '到期日期'), ('advance_days', '提前天数'), ('actual_reminder_date', '实际提醒日期'),
+    ('auto_renew', '自动续期'), ('renew_period', '续期周期(天)'),
+]
+DEFAULT_EXPORT_FIELDS = [field for field, _ in EXPORT_COLUMNS[:10]]
+EXPORT_BATCH_SIZE = 1000
+
+
+def parse_export_columns(columns_param):
+    """
+    解析导出列参数（逗号分隔的字段名），为空时使用默认列
+
+    :raises ValueError: 包含不支持的字段名
+    """
+    if not columns_param:
+        return list(DEFAULT_EXPORT_FIELDS)
+    headers = dict(EXPORT_COLUMNS)
+    fields = [field.strip() for field in columns_param.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in headers]
+    if unknown:
+        raise ValueError(f"不支持的导出列: {', '.join(unknown)}，可选值: {', '.join(headers)}")
+    if not fields:
+        raise ValueError('至少需要选择一列')
+    return fields
+
+
+def iter_reminders_csv(fields, where_sql='', params=(), batch_size=EXPORT_BATCH_SIZE):
+    """
+    按 keyset 分批读取提醒项并生成 CSV 字节块（第一块以 UTF-8 BOM 开头）
+
+    每个批次单独从连接池取连接、查询后立即归还，然后才把数据交给调用方：
+    慢速下载不会长期占用池中的连接，也不会持有读快照阻止 WAL 检查点。
+    批次之间不是同一个快照，导出过程中被修改的行按读取时的数据输出。
+    内存占用只与批大小有关。
+    """
+    headers = dict(EXPORT_COLUMNS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # 写入 BOM 和表头，便于 Excel 正确识别 UTF-8
+    buffer.write('\ufeff')
+    writer.writerow([headers[field] for field in fields])
+    yield buffer.getvalue().encode('utf-8')
+
+    # 与列表默认排序相同（提醒日期为空的排在最前），按 (排序键, id) 记住上一批的位置
+    sort_key = SORT_KEYS[DEFAULT_SORT]
+    select_sql = f"SELECT {', '.join(fields)}, {sort_key} AS sort_key, id AS sort_id FROM reminders"
+    last = None
+    while True:
+        conditions = [f'({where_sql})'] if where_sql else []
+        batch_params = list(params)
+        if last is not None:
+            conditions.append(f'{sort_key} >= ? AND ({sort_key} > ? OR id > ?)')
+            batch_params.extend([last[0], last[0], last[1]])
+        sql = select_sql
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {sort_key}, id LIMIT ?'
+        batch_params.append(batch_size)
+
+        with get_db() as conn:
+            rows = conn.execute(sql, batch_params).fetchall()
+        if not rows:
+            break
+        last = (rows[-1]['sort_key'], rows[-1]['sort_id'])
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(tuple(row)[:len(fields)] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        if len(rows) < batch_size:
+            break
+
+
 @app.route('/api/reminders/export', methods=['GET'])
 @require_login
 def export_reminders_csv():
-    """导出所有提醒项为 CSV 文件"""
+    """
+    导出提醒项为 CSV 文件（流式输出）
+
+    可选参数：columns（逗号分隔的字段名）以及与 GET /api/reminders 相同的筛选参数
+    (status、type、handler、certifier、日期范围)。
+    """
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            # 通过 row_factory 可以让查询结果的每一行像字典一样被访问
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM reminders ORDER BY actual_reminder_date')
-            rows = cursor.fetchall()
-
-        # 1. 在内存中创建一个 BytesIO 对象来写入 CSV 数据 (使用字节流)
-        output = io.BytesIO()
-        # 2. 创建一个 CSV writer 对象，直接写入 UTF-8 BOM 和编码的数据
-        # 使用 utf-8-sig 编码的文本包装器
-        wrapper = io.TextIOWrapper(output, encoding='utf-8-sig', newline='')
-        writer = csv.writer(wrapper)
-        
-        # 3. 写入表头 (Header)
-        # 根据您的数据库表结构调整表头名称和顺序
-        writer.writerow([
-            'ID', '名称', '类型', '认证人员', '办事员', '周期(天)', 
-            '开始日期', '到期日期', '提前天数', '实际提醒日期'
-        ])
-        
-        # 4. 写入数据行
-        for row in rows:
-            writer.writerow([
-                row['id'], row['name'], row['type'], row['certifier'], row['handler'],
-                row['period'], row['start_date'], row['end_date'], 
-                row['advance_days'], row['actual_reminder_date']
-            ])
-        
-        # 5. 关闭 TextIOWrapper 以确保所有数据都写入 BytesIO
-        wrapper.flush() # 确保缓冲区数据被写入
-        
-        # 6. 获取字节内容
-        csv_content = output.getvalue()
-        output.close()
-        
-        # 7. 创建一个 Flask Response 对象，指定内容类型和下载文件名
-        # MIME 类型为 'text/csv'，编码信息已在字节流中
+        try:
+            fields = parse_export_columns(request.args.get('columns'))
+            where_sql, params = build_reminder_filters(request.args)
+        except ValueError as e:
+            return f"导出失败: {str(e)}", 400
+
+        def generate():
+            try:
+                yield from iter_reminders_csv(fields, where_sql, params)
+            except Exception as e:
+                # 响应头已经发出，只能记录日志并中断输出
+                logging.error(f"导出 CSV 过程中发生错误: {e}")
+                traceback.print_exc()
+                raise
+
+        # 创建一个流式 Response 对象，指定内容类型和下载文件名
         return Response(
-            csv_content,
+            generate(),
             mimetype='text/csv',
             headers={
                 "Content-Disposition": "attachment;filename=reminders_export.csv",
@@ -572,11 +833,126 @@ def export_reminders_csv():
         # 返回一个简单的文本错误信息给前端
         return f"导出失败: {str(e)}", 500
 
+# 后台导出任务生成的文件目录，文件随任务记录一起清理
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'reminder_exports')
+
+
+def export_file_path(job_id):
+    return os.path.join(EXPORT_DIR, f'{job_id}.csv')
+
+
+def run_export_job(ctx):
+    """后台任务：把 CSV 写入文件，每个批次后更新进度并检查是否已取消"""
+    fields = ctx.params['fields']
+    where_sql, params = build_reminder_filters(ctx.params.get('filters') or {})
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = export_file_path(ctx.id)
+    bytes_written = 0
+    try:
+        with open(path, 'wb') as output:
+            for chunk in iter_reminders_csv(fields, where_sql, params):
+                ctx.check_cancelled()
+                output.write(chunk)
+                bytes_written += len(chunk)
+                ctx.set_progress({'bytes_written': bytes_written})
+    except BaseException:
+        # 失败或取消时不留下不完整的文件
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return {'bytes': bytes_written, 'download_url': f'/api/jobs/{ctx.id}/download'}
+
+
+def remove_export_file(job_id, params=None):
+    """删除导出任务生成的文件（不存在时忽略）"""
+    if os.path.exists(export_file_path(job_id)):
+        os.remove(export_file_path(job_id))
+
+
+job_runner.register('export_csv', run_export_job, max_concurrency=2, on_abandoned=remove_export_file)
+
+
+def purge_expired_jobs():
+    """把进程退出后中断的任务标记为失败，删除过期的任务记录及其导出文件"""
+    try:
+        job_runner.recover_stale()
+        for job in job_runner.purge_finished():
+            if job['type'] == 'export_csv':
+                remove_export_file(job['id'])
+    except Exception as e:
+        logging.error(f"清理过期任务失败: {e}")
+
+
+@app.route('/api/reminders/export', methods=['POST'])
+@require_login
+def start_export_job():
+    """
+    提交后台导出任务，参数与 GET /api/reminders/export 相同；
+    任务完成后从 GET /api/jobs/<id>/download 下载文件
+    """
+    try:
+        try:
+            fields = parse_export_columns(request.args.get('columns'))
+            # 先校验筛选参数，任务中再按同样的参数生成查询条件
+            build_reminder_filters(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        filters = {key: request.args.get(key) for key in PAGE_QUERY_PARAMS if request.args.get(key) is not None}
+        return job_accepted_response(job_runner.submit('export_csv', {'fields': fields, 'filters': filters}), '导出任务已提交')
+    except Exception as e:
+        logging.error(f"提交导出任务失败: {e}")
+        return jsonify({'error': '提交导出任务失败'}), 500
+
+
 # --- 新增：导入 CSV ---
+def on_import_batch_committed(inserted):
+    """每个批次提交后让缓存失效，导入过程中的查询也能看到已提交的数据"""
+    notify_reminders_changed(upserted=inserted, created=True)
+
+
+def run_import_job(ctx):
+    """后台任务：从落盘的上传文件导入，每个批次提交后更新进度并检查是否已取消"""
+    params = ctx.params
+    progress = csv_import.start_import(params.get('filename'), import_id=ctx.id)
+
+    def on_batch_committed(inserted):
+        on_import_batch_committed(inserted)
+        ctx.set_progress(progress.to_dict())
+        # 已提交的批次保留，取消后不再导入后续批次
+        ctx.check_cancelled()
+
+    try:
+        with open(params['path'], 'rb') as stream:
+            return csv_import.run_import(stream, progress, params['batch_size'], on_batch_committed)
+    finally:
+        ctx.set_progress(progress.to_dict())
+        os.remove(params['path'])
+
+
+def remove_import_upload(job_id, params):
+    """中断的导入任务不会再执行，删除它落盘的上传文件"""
+    path = params.get('path')
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+# 同一时刻只运行一个导入，避免多个导入争用写锁
+job_runner.register('import_csv', run_import_job, max_concurrency=1, on_abandoned=remove_import_upload)
+
+# 启动时处理上次退出时中断的任务（需要在注册 on_abandoned 之后）
+purge_expired_jobs()
+
+
 @app.route('/api/reminders/import', methods=['POST'])
 @require_login
 def import_reminders_csv():
-    """从 CSV 文件导入提醒项"""
+    """
+    从 CSV 文件导入提醒项
+
+    文件按行流式解析，每 batch_size 行（默认 1000）提交一次。
+    带 async=1 参数时先把上传内容落盘，然后在后台线程导入并立即返回 202 和 import_id，
+    前端通过 GET /api/reminders/import/<import_id> 轮询进度。
+    """
     try:
         # 1. 检查请求中是否包含文件
         if 'file' not in request.files:
@@ -592,92 +968,57 @@ def import_reminders_csv():
         if not file.filename.endswith('.csv'):
             return jsonify({'error': '文件类型不支持，请上传 .csv 文件'}), 400
 
-        # 4. 读取文件内容
-        # 为了解决 'SpooledTemporaryFile' object has no attribute 'readable' 的问题，
-        # 我们先将文件内容读取到内存中，然后再处理
-        file_content = file.read().decode('utf-8-sig')
-        # 使用 StringIO 创建一个文本流
-        from io import StringIO
-        stream = StringIO(file_content)
-        
-        # 5. 使用 csv.reader 解析 CSV
-        csv_reader = csv.reader(stream)
-        
-        # 6. 读取并跳过标题行
-        headers = next(csv_reader)
-        # 可以在这里验证 headers 是否符合预期
-        
-        # 7. 准备批量插入的数据
-        reminders_to_insert = []
-        line_number = 1 # 因为跳过了一行标题
-        for row in csv_reader:
-            line_number += 1
-            # 简单的行验证，确保行有数据
-            if not row or all(cell == '' for cell in row):
-                print(f"警告: 第 {line_number} 行为空，已跳过。")
-                continue
-                
-            # 根据 CSV 列的顺序解析数据
-            # 假设 CSV 列顺序为: ID, 名称, 类型, 认证人员, 办事员, 周期(天), 开始日期, 到期日期, 提前天数, 实际提醒日期
-            # 我们通常会忽略 ID 列，因为它由数据库自动生成
-            try:
-                # 确保行有足够的列
-                if len(row) < 10:
-                     print(f"警告: 第 {line_number} 行列数不足，已跳过。")
-                     continue
-
-                name = row[1]
-                type_ = row[2]
-                certifier = row[3] if row[3] else None
-                handler = row[4] if row[4] else None
-                # 周期可能为空
-                period_str = row[5] if row[5] else None
-                period = int(period_str) if period_str and period_str.isdigit() else None
-                start_date = row[6] if row[6] else None
-                end_date = row[7]
-                advance_days_str = row[8] if row[8] else '0'  # 默认为0
-                advance_days = int(advance_days_str) if advance_days_str and advance_days_str.isdigit() else 0
-                actual_reminder_date = row[9] if row[9] else None
-                
-                # 基本验证：名称和到期日期是必需的
-                if not name or not end_date:
-                    print(f"警告: 第 {line_number} 行缺少必需字段 (名称或到期日期)，已跳过。")
-                    continue
-
-                reminders_to_insert.append((
-                    name, type_, certifier, handler, period,
-                    start_date, end_date, advance_days, actual_reminder_date
-                ))
-            except (ValueError, IndexError) as e:
-                print(f"警告: 第 {line_number} 行数据解析错误 ({e})，已跳过。")
-                continue
-
-        # 8. 批量插入到数据库
-        inserted_count = 0
-        if reminders_to_insert:
-            with sqlite3.connect(DATABASE) as conn:
-                cursor = conn.cursor()
-                # 注意：SQL 语句中的占位符应与元组中的元素一一对应
-                # 这里我们没有插入 ID，因为它会自动生成
-                cursor.executemany('''
-                    INSERT INTO reminders (
-                        name, type, certifier, handler, period, 
-                        start_date, end_date, advance_days, actual_reminder_date
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', reminders_to_insert)
-                inserted_count = cursor.rowcount
-                conn.commit()
-        
-        # 9. 返回成功响应
-        return jsonify({
-            'message': f'导入成功，共新增 {inserted_count} 条记录。'
-        }), 201
+        try:
+            batch_size = csv_import.parse_batch_size(request.args.get('batch_size'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if request.args.get('async') in ('1', 'true'):
+            # 4a. 上传的临时文件在请求结束后会被关闭，先按块复制到自己的临时文件，由后台任务导入
+            spooled = tempfile.NamedTemporaryFile(prefix='reminders_import_', suffix='.csv', delete=False)
+            with spooled:
+                shutil.copyfileobj(file.stream, spooled, length=1024 * 1024)
+            job_id = job_runner.submit('import_csv', {
+                'path': spooled.name, 'filename': file.filename, 'batch_size': batch_size
+            })
+            return jsonify({
+                'message': '导入已开始',
+                'job_id': job_id,
+                'import_id': job_id,
+                'status_url': f'/api/jobs/{job_id}',
+                'progress_url': f'/api/reminders/import/{job_id}'
+            }), 202
+
+        # 4b. 同步导入：直接从上传流中逐行解析
+        progress = csv_import.start_import(file.filename)
+        report = csv_import.run_import(file.stream, progress, batch_size, on_import_batch_committed)
+
+        # 5. 返回成功响应
+        report['message'] = f"导入成功，共新增 {report['rows_inserted']} 条记录。"
+        if report['rows_skipped']:
+            report['message'] += f" 跳过 {report['rows_skipped']} 行。"
+        return jsonify(report), 201
 
     except Exception as e:
         print(f"导入 CSV 时发生未预期的错误: {e}")  # 在服务器控制台打印详细错误
-        import traceback
         traceback.print_exc()  # 打印完整的堆栈跟踪
         return jsonify({'error': f'导入失败: {str(e)}'}), 500
+
+
+@app.route('/api/reminders/import/<import_id>', methods=['GET'])
+@require_login
+def get_import_progress(import_id):
+    """查询 CSV 导入进度：已解析、已插入、已跳过的行数以及跳过原因"""
+    progress = csv_import.get_import_progress(import_id)
+    if progress is None:
+        # 导入任务可能在其他进程中运行，从任务表读取最近一次保存的进度
+        job = get_job(import_id)
+        if job is None or job['type'] != 'import_csv':
+            return jsonify({'error': '导入记录不存在'}), 404
+        progress = job['progress'] or {'import_id': import_id, 'status': 'running', 'rows_parsed': 0, 'rows_inserted': 0}
+        if job['status'] in ('failed', 'cancelled') and progress['status'] == 'running':
+            progress = dict(progress, status='failed', error=job['error'] or '导入已取消')
+    return jsonify(progress), 200
 # --- 新增结束 ---
 
 # --- Serve Static Files (Frontend) ---
@@ -704,16 +1045,15 @@ def serve_test_email():
 def get_email_settings():
     """获取邮箱配置"""
     try:
-        config = {}
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            for key in ['smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'recipient_email']:
-                cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-                row = cursor.fetchone()
-                config[key] = row[0] if row else ''
-        # 不返回密码
-        config.pop('sender_password', None)
-        return jsonify(config), 200
+        version = get_data_version(data_version.SETTINGS)
+
+        def build_response():
+            config = settings_cache.get_email_config()
+            # 不返回密码
+            config.pop('sender_password', None)
+            return jsonify(config), 200
+
+        return conditional_response(make_etag('settings-email', version), build_response)
     except Exception as e:
         logging.error(f"获取邮箱配置失败: {e}")
         return jsonify({'error': '获取邮箱配置失败'}), 500
@@ -724,16 +1064,15 @@ def get_email_settings():
 def get_dingtalk_settings():
     """获取钉钉配置"""
     try:
-        config = {}
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            for key in ['dingtalk_webhook', 'dingtalk_secret']:
-                cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-                row = cursor.fetchone()
-                config[key] = row[0] if row else ''
-        # 不返回密钥
-        config.pop('dingtalk_secret', None)
-        return jsonify(config), 200
+        version = get_data_version(data_version.SETTINGS)
+
+        def build_response():
+            config = settings_cache.get_dingtalk_config()
+            # 不返回密钥
+            config.pop('dingtalk_secret', None)
+            return jsonify(config), 200
+
+        return conditional_response(make_etag('settings-dingtalk', version), build_response)
     except Exception as e:
         logging.error(f"获取钉钉配置失败: {e}")
         return jsonify({'error': '获取钉钉配置失败'}), 500
@@ -759,7 +1098,7 @@ def update_email_settings():
         if not fields_to_update:
             return jsonify({'error': '至少需要提供一个字段进行更新'}), 400
 
-        with sqlite3.connect(DATABASE) as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
             # 更新提供的字段
             for key, value in fields_to_update.items():
@@ -776,7 +1115,9 @@ def update_email_settings():
                             "UPDATE settings SET value = ? WHERE key = ?",
                             (value, key)
                         )
+            bump_data_version(cursor, data_version.SETTINGS)
             conn.commit()
+        settings_cache.invalidate()
         return jsonify({'message': '邮箱配置更新成功'}), 200
     except Exception as e:
         logging.error(f"更新邮箱配置失败: {e}")
@@ -808,7 +1149,7 @@ def update_dingtalk_settings():
             print(f"错误: {error_msg}")  # 添加调试信息
             return jsonify({'error': error_msg}), 400
 
-        with sqlite3.connect(DATABASE) as conn:
+        with get_db() as conn:
             cursor = conn.cursor()
             # 更新提供的字段
             for key, value in fields_to_update.items():
@@ -827,7 +1168,9 @@ def update_dingtalk_settings():
                             "UPDATE settings SET value = ? WHERE key = ?",
                             (value, key)
                         )
+            bump_data_version(cursor, data_version.SETTINGS)
             conn.commit()
+        settings_cache.invalidate()
         success_msg = '钉钉配置更新成功'
         print(success_msg)  # 添加调试信息
         return jsonify({'message': success_msg}), 200
@@ -839,22 +1182,111 @@ def update_dingtalk_settings():
         traceback.print_exc()  # 添加调试信息
         return jsonify({'error': '更新钉钉配置失败'}), 500
 
+@app.route('/api/settings/routes', methods=['GET'])
+@require_login
+def get_notification_routes():
+    """获取通知路由规则（不返回钉钉密钥）"""
+    try:
+        version = get_data_version(data_version.SETTINGS)
+
+        def build_response():
+            with get_db() as conn:
+                return jsonify(list_routes(conn)), 200
+
+        return conditional_response(make_etag('settings-routes', version), build_response)
+    except Exception as e:
+        logging.error(f"获取通知路由规则失败: {e}")
+        return jsonify({'error': '获取通知路由规则失败'}), 500
+
+
+@app.route('/api/settings/routes', methods=['POST'])
+@require_login
+def add_notification_route():
+    """添加通知路由规则：按 handler / certifier / type 把提醒发给指定邮箱或钉钉机器人"""
+    try:
+        data = request.get_json()
+        error = validate_route(data)
+        if error:
+            return jsonify({'error': error}), 400
+        with get_db() as conn:
+            cursor = conn.cursor()
+            route_id = insert_route(cursor, data)
+            bump_data_version(cursor, data_version.SETTINGS)
+        return jsonify({'message': '路由规则添加成功', 'id': route_id}), 201
+    except Exception as e:
+        logging.error(f"添加通知路由规则失败: {e}")
+        return jsonify({'error': '添加通知路由规则失败'}), 500
+
+
+@app.route('/api/settings/routes/<int:route_id>', methods=['DELETE'])
+@require_login
+def remove_notification_route(route_id):
+    """删除通知路由规则"""
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            if not delete_route(cursor, route_id):
+                return jsonify({'error': '路由规则不存在'}), 404
+            bump_data_version(cursor, data_version.SETTINGS)
+        return jsonify({'message': '路由规则删除成功'}), 200
+    except Exception as e:
+        logging.error(f"删除通知路由规则失败: {e}")
+        return jsonify({'error': '删除通知路由规则失败'}), 500
+
+
+@app.route('/api/reminders/auto-renew', methods=['POST'])
+@require_login
+def api_auto_renew_reminders():
+    """API 端点：为已过期的自动续期项目生成下一周期"""
+    try:
+        result = auto_renew_reminders()
+        result['message'] = f"自动续期完成，共处理了 {result['renewed']} 个项目"
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': f'自动续期失败: {str(e)}'}), 500
+
+
+def run_check_job(ctx, channel, channel_label):
+    """
+    后台任务：检查并把提醒加入 channel 的发送队列，结果中附带给用户看的消息
+
+    检查或入队出错时抛出异常，任务记录为 failed（不像定时任务那样吞掉异常返回空列表）；
+    选出需要通知的项目后、入队前检查取消请求，已取消时不入队，任务记录为 cancelled
+    """
+    upcoming_list, report = check_and_notify_with_report((channel,), before_enqueue=ctx.check_cancelled)
+    errors = [f"{name}: {result['error']}" for name, result in report.items() if result['status'] == 'error']
+    if errors:
+        raise RuntimeError(f"{channel_label}提醒入队失败: {'; '.join(errors)}")
+    if upcoming_list and report.get(channel, {}).get('status') == 'skipped':
+        raise RuntimeError(f'{channel_label}通知未配置，无法发送提醒')
+    count = len(upcoming_list)
+    print(f"检查完成，发现 {count} 个即将到期项目")
+    if count > 0:
+        message = f'检查完成，{count} 个即将到期项目需要发送新的提醒，已加入{channel_label}发送队列。'
+    else:
+        message = '检查完成，当前没有需要发送新提醒的项目。'
+    return {'count': count, 'message': message}
+
+
+# 检查并发送提醒：同一时刻每种只运行一个，重复点击的请求排队
+job_runner.register('check_email', lambda ctx: run_check_job(ctx, 'email', '邮件'))
+job_runner.register('check_dingtalk', lambda ctx: run_check_job(ctx, 'dingtalk', '钉钉'))
+
+
+def job_accepted_response(job_id, message):
+    """任务已提交：返回 202、任务 ID 和状态查询地址"""
+    return jsonify({'message': message, 'job_id': job_id, 'status_url': f'/api/jobs/{job_id}'}), 202
+
+
 @app.route('/api/reminders/check-and-email', methods=['POST'])
 @require_login
 def api_check_and_email_reminders():
-    """API 端点：检查即将到期项目并发送邮件"""
+    """API 端点：提交检查即将到期项目并发送邮件的后台任务"""
     try:
         print("收到检查并发送邮件的请求")
-        upcoming_list = check_upcoming_reminders_for_email()
-        count = len(upcoming_list)
-        print(f"检查完成，发现 {count} 个即将到期项目")
-        if count > 0:
-            return jsonify({'message': f'检查完成，发现 {count} 个即将到期项目，并已尝试发送邮件。'}), 200
-        else:
-            return jsonify({'message': '检查完成，当前没有即将到期的项目。'}), 200
+        return job_accepted_response(job_runner.submit('check_email'), '检查任务已提交')
     except Exception as e:
         print(f"通过 API 检查并发送邮件时失败: {e}")
-        import traceback
         traceback.print_exc()
         logging.error(f"通过 API 检查并发送邮件时失败: {e}")
         return jsonify({'error': '检查并发送邮件失败'}), 500
@@ -863,28 +1295,13 @@ def api_check_and_email_reminders():
 @app.route('/api/reminders/check-and-dingtalk', methods=['POST'])
 @require_login
 def api_check_and_dingtalk_reminders():
-    """API 端点：检查即将到期项目并发送钉钉消息"""
+    """API 端点：提交检查即将到期项目并发送钉钉消息的后台任务"""
     try:
         print("收到检查并发送钉钉消息的请求")
-        print("开始调用 check_upcoming_reminders_for_dingtalk 函数")
-        import traceback
-        try:
-            upcoming_list = check_upcoming_reminders_for_dingtalk()
-        except Exception as e:
-            print(f"调用 check_upcoming_reminders_for_dingtalk 时发生错误: {e}")
-            traceback.print_exc()
-            raise e
-        print(f"check_upcoming_reminders_for_dingtalk 函数返回结果: {upcoming_list}")
-        count = len(upcoming_list)
-        print(f"检查完成，发现 {count} 个即将到期项目")
-        if count > 0:
-            return jsonify({'message': f'检查完成，发现 {count} 个即将到期项目，并已尝试发送钉钉消息。'}), 200
-        else:
-            return jsonify({'message': '检查完成，当前没有即将到期的项目。'}), 200
+        return job_accepted_response(job_runner.submit('check_dingtalk'), '检查任务已提交')
     except Exception as e:
         error_msg = f"通过 API 检查并发送钉钉消息时失败: {e}"
         print(error_msg)
-        import traceback
         traceback.print_exc()
         logging.error(error_msg)
         return jsonify({'error': '检查并发送钉钉消息失败'}), 500
@@ -899,15 +1316,11 @@ def login():
         if not password:
             return jsonify({'error': '密码不能为空'}), 400
             
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT value FROM settings WHERE key = 'password'")
-            row = cursor.fetchone()
-            
-            if row and row[0] == password:
-                return jsonify({'message': '登录成功'}), 200
-            else:
-                return jsonify({'error': '密码错误'}), 401
+        stored_password = settings_cache.get_password()
+        if stored_password is not None and stored_password == password:
+            return jsonify({'message': '登录成功'}), 200
+        else:
+            return jsonify({'error': '密码错误'}), 401
                 
     except Exception as e:
         print(f"登录时发生错误: {e}")
@@ -925,9 +1338,9 @@ def change_password():
         if not old_password or not new_password:
             return jsonify({'error': '密码不能为空'}), 400
             
-        with sqlite3.connect(DATABASE) as conn:
+        # 验证旧密码（改密码前读数据库而不是缓存，避免与其他进程的修改冲突）
+        with get_db() as conn:
             cursor = conn.cursor()
-            # 验证旧密码
             cursor.execute("SELECT value FROM settings WHERE key = 'password'")
             row = cursor.fetchone()
             
@@ -939,9 +1352,11 @@ def change_password():
                 "UPDATE settings SET value = ? WHERE key = 'password'",
                 (new_password,)
             )
+            bump_data_version(cursor, data_version.SETTINGS)
             conn.commit()
-            
-            return jsonify({'message': '密码修改成功'}), 200
+
+        settings_cache.invalidate()
+        return jsonify({'message': '密码修改成功'}), 200
             
     except Exception as e:
         print(f"修改密码时发生错误: {e}")
@@ -949,6 +1364,111 @@ def change_password():
 
 # --- 新增结束 ---
 
+@app.route('/api/maintenance/malformed-dates', methods=['GET'])
+@require_login
+def get_malformed_date_reminders():
+    """维护接口：列出日期格式不合法、不会被到期检查选中的提醒项"""
+    try:
+        with get_db() as conn:
+            rows = find_malformed_date_reminders(conn)
+        return jsonify({'count': len(rows), 'reminders': rows}), 200
+    except Exception as e:
+        logging.error(f"查询日期格式异常的提醒项失败: {e}")
+        return jsonify({'error': '查询日期格式异常的提醒项失败'}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+@require_login
+def get_jobs():
+    """列出最近的后台任务，可按 type、status 过滤"""
+    try:
+        status = request.args.get('status') or None
+        if status is not None and status not in JOB_STATUSES:
+            return jsonify({'error': f"status 必须是 {', '.join(JOB_STATUSES)} 之一"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        except ValueError:
+            return jsonify({'error': 'limit 必须是整数'}), 400
+        return jsonify(list_jobs(request.args.get('type') or None, status, limit)), 200
+    except Exception as e:
+        logging.error(f"获取后台任务列表失败: {e}")
+        return jsonify({'error': '获取后台任务列表失败'}), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@require_login
+def get_job_status(job_id):
+    """查询后台任务的状态、进度和结果"""
+    try:
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        logging.error(f"查询后台任务失败: {e}")
+        return jsonify({'error': '查询后台任务失败'}), 500
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@require_login
+def cancel_job(job_id):
+    """取消后台任务：排队中的立即取消，运行中的在下一个安全点停止"""
+    try:
+        job = job_runner.cancel(job_id)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+        if job['status'] in ('succeeded', 'failed'):
+            return jsonify({'error': '任务已结束，无法取消', 'job': job}), 409
+        return jsonify(job), 200
+    except Exception as e:
+        logging.error(f"取消后台任务失败: {e}")
+        return jsonify({'error': '取消后台任务失败'}), 500
+
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+@require_login
+def download_job_result(job_id):
+    """下载已完成的导出任务生成的 CSV 文件"""
+    job = get_job(job_id)
+    if job is None or job['type'] != 'export_csv':
+        return jsonify({'error': '导出任务不存在'}), 404
+    if job['status'] != 'succeeded':
+        return jsonify({'error': '导出任务尚未完成', 'status': job['status']}), 409
+    path = export_file_path(job_id)
+    if not os.path.exists(path):
+        # 导出文件保存在运行任务的主机的临时目录中
+        return jsonify({'error': '导出文件不存在或已被清理'}), 410
+    return send_file(
+        path, mimetype='text/csv', as_attachment=True, download_name='reminders_export.csv'
+    )
+
+
+@app.route('/api/system/db-stats', methods=['GET'])
+@require_login
+def get_db_stats():
+    """获取数据库连接池统计（取用次数、等待次数、等待时长等）"""
+    try:
+        return jsonify(get_pool_stats()), 200
+    except Exception as e:
+        logging.error(f"获取连接池统计失败: {e}")
+        return jsonify({'error': '获取连接池统计失败'}), 500
+
+@app.route('/api/notifications/outbox', methods=['GET'])
+@require_login
+def get_notification_outbox():
+    """列出通知发件箱中的任务及各状态数量，可按 status 过滤"""
+    try:
+        status = request.args.get('status') or None
+        if status is not None and status not in OUTBOX_STATUSES:
+            return jsonify({'error': f"status 必须是 {', '.join(OUTBOX_STATUSES)} 之一"}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', 100)), 1), 500)
+        except ValueError:
+            return jsonify({'error': 'limit 必须是整数'}), 400
+        return jsonify({'counts': outbox_counts(), 'jobs': list_outbox(status, limit)}), 200
+    except Exception as e:
+        logging.error(f"获取通知发件箱失败: {e}")
+        return jsonify({'error': '获取通知发件箱失败'}), 500
+
 if __name__ == '__main__':
     # 注意：在 Docker 中，通常监听 0.0.0.0
     app.run(host='0.0.0.0', port=5009, debug=True)
\ No newline at end of file
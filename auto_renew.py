@@ -0,0 +1,133 @@
+# auto_renew.py
+"""
+自动续期
+
+找出已过期且开启了 auto_renew 的提醒项，为其生成下一周期的提醒项。
+整个过程是一次集合操作：INSERT ... SELECT 在一个事务里完成，
+通过 renewed_from 列（带索引）识别已经续期过的项目，不会重复创建。
+"""
+
+import datetime
+import logging
+
+from db import get_db
+import data_version
+from data_version import bump_data_version
+from reminder_queries import DATE_FORMAT
+
+# 未设置 renew_period 时的默认续期周期（天）
+DEFAULT_RENEW_PERIOD = 365
+
+# 长时间未运行时，一个项目可能需要连续续期多次；每一轮只续期一个周期
+MAX_RENEW_PASSES = 50
+
+
+def ensure_auto_renew_schema(cursor):
+    """添加 renewed_from 列以及续期查询使用的索引（幂等）"""
+    cursor.execute("PRAGMA table_info(reminders)")
+    column_names = [column[1] for column in cursor.fetchall()]
+    if 'renewed_from' not in column_names:
+        # 记录续期项目来源的提醒项 ID
+        cursor.execute("ALTER TABLE reminders ADD COLUMN renewed_from INTEGER")
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reminders_renewed_from ON reminders(renewed_from)')
+    # 旧版前端创建的续期项目没有 renewed_from，按名称和开始日期识别
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reminders_name_start_date ON reminders(name, start_date)')
+    # 只索引开启了自动续期的行
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_auto_renew_end_date
+        ON reminders(end_date) WHERE auto_renew = 1
+    ''')
+
+
+# 需要续期的条件：已过期、开启自动续期、到期日期合法，并且还没有生成过下一周期
+RENEWABLE_CONDITION = f'''
+    r.auto_renew = 1
+      AND r.end_date < :today
+      AND date(r.end_date) = r.end_date
+      AND COALESCE(r.renew_period, {DEFAULT_RENEW_PERIOD}) > 0
+      AND NOT EXISTS (SELECT 1 FROM reminders s WHERE s.renewed_from = r.id)
+      AND NOT EXISTS (
+          SELECT 1 FROM reminders s
+          WHERE s.name = r.name
+            AND s.start_date > r.end_date
+            AND s.start_date < date(r.end_date, '+1 year')
+            AND s.auto_renew = r.auto_renew
+      )
+'''
+
+# 新周期：开始日期 = 原到期日期 + 1 天，到期日期 = 原到期日期 + 续期周期，
+# 实际提醒日期 = 新到期日期 - 提前天数（与前端原有的计算方式一致）
+RENEW_SQL = f'''
+    INSERT INTO reminders (
+        name, type, certifier, handler, period,
+        start_date, end_date, advance_days, actual_reminder_date,
+        auto_renew, renew_period, renewed_from, row_version
+    )
+    SELECT
+        r.name, r.type, r.certifier, r.handler, r.period,
+        date(r.end_date, '+1 day'),
+        date(r.end_date, printf('%+d days', COALESCE(r.renew_period, {DEFAULT_RENEW_PERIOD}))),
+        r.advance_days,
+        date(r.end_date, printf('%+d days', COALESCE(r.renew_period, {DEFAULT_RENEW_PERIOD}) - r.advance_days)),
+        r.auto_renew, r.renew_period, r.id, :version
+    FROM reminders r
+    WHERE {RENEWABLE_CONDITION}
+    ORDER BY r.id
+'''
+
+
+def fetch_renewable_ids(conn, today=None):
+    """查询当前需要续期的提醒项 ID（只读，按部分索引 idx_reminders_auto_renew_end_date 取范围）"""
+    if today is None:
+        today = datetime.date.today()
+    cursor = conn.execute(
+        f'SELECT r.id FROM reminders r WHERE {RENEWABLE_CONDITION} ORDER BY r.id',
+        {'today': today.strftime(DATE_FORMAT)}
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def run_auto_renew(today=None):
+    """
+    为所有已过期的自动续期项目生成下一周期
+
+    :param today: 基准日期，默认为今天
+    :return: {'renewed': 新建数量, 'passes': 执行轮数, 'new_ids': [新提醒项 ID],
+              'new_reminders': [包含 id、actual_reminder_date、end_date 的字典]}
+    """
+    if today is None:
+        today = datetime.date.today()
+    today_str = today.strftime(DATE_FORMAT)
+
+    renewed = 0
+    passes = 0
+    with get_db() as conn:
+        # 立即获取写锁，防止多个进程同时续期同一批项目
+        conn.execute('BEGIN IMMEDIATE')
+        max_id_before = conn.execute('SELECT COALESCE(MAX(id), 0) FROM reminders').fetchone()[0]
+        version = bump_data_version(conn, data_version.REMINDERS)
+        while passes < MAX_RENEW_PASSES:
+            passes += 1
+            cursor = conn.execute(RENEW_SQL, {'today': today_str, 'version': version})
+            if cursor.rowcount <= 0:
+                break
+            renewed += cursor.rowcount
+        else:
+            logging.warning(f"自动续期达到最大轮数 {MAX_RENEW_PASSES}，剩余项目将在下次运行时续期")
+
+        if not renewed:
+            # 没有需要续期的项目，撤销版本号的递增
+            conn.rollback()
+
+        new_reminders = [dict(row) for row in conn.execute(
+            'SELECT id, actual_reminder_date, end_date FROM reminders '
+            'WHERE id > ? AND renewed_from IS NOT NULL ORDER BY id',
+            (max_id_before,)
+        )]
+        new_ids = [row['id'] for row in new_reminders]
+
+    msg = f"自动续期完成，共新建 {renewed} 个续期项目"
+    print(msg)
+    logging.info(msg)
+    return {'renewed': renewed, 'passes': passes, 'new_ids': new_ids, 'new_reminders': new_reminders}
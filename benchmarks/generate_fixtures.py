@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# generate_fixtures.py
+"""
+生成基准测试使用的 reminders.db 数据文件
+
+表结构由应用自己的 init_db() 创建（与线上数据库一致），提醒项用一个事务批量写入。
+日期分布模拟实际使用情况：
+
+- 约 15% 已过期（过去一年内到期），其中一部分开启了自动续期；
+- 约 10% 在 30 天内到期（大部分已进入提醒窗口）；
+- 其余在未来三年内到期，约三成集中在月末；
+- 周期以一年为主，也有半年、两年、三年；提前天数以 30 天为主。
+
+用法：
+    python benchmarks/generate_fixtures.py --sizes 10k,100k --out-dir benchmarks/fixtures
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+DEFAULT_OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+TYPES = ['营业执照', '资质证书', '安全生产许可证', '特种设备检验', '消防检查', '公章', '域名', 'SSL 证书', '租赁合同', '保险']
+CERTIFIERS = ['市场监督管理局', '住建局', '应急管理局', '消防救援支队', '公安局', '中国互联网络信息中心', '保险公司', None]
+HANDLERS = ['张三', '李四', '王五', '赵六', '孙七', '周八', '吴九', '郑十', None]
+
+# (周期天数, 权重)
+PERIODS = [(365, 70), (180, 10), (730, 12), (1095, 8)]
+# (提前天数, 权重)
+ADVANCE_DAYS = [(30, 50), (15, 15), (60, 15), (7, 10), (90, 10)]
+
+INSERT_SQL = '''
+    INSERT INTO reminders (
+        name, type, certifier, handler, period, start_date, end_date,
+        advance_days, actual_reminder_date, auto_renew, renew_period, row_version
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _end_date(rng, today):
+    bucket = rng.random()
+    if bucket < 0.15:
+        return today - datetime.timedelta(days=rng.randint(1, 365))
+    if bucket < 0.25:
+        return today + datetime.timedelta(days=rng.randint(0, 30))
+    end = today + datetime.timedelta(days=rng.randint(31, 3 * 365))
+    if rng.random() < 0.3:
+        # 集中在月末
+        next_month = (end.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        end = next_month - datetime.timedelta(days=1)
+    return end
+
+
+def generate_rows(count, today=None, seed=42):
+    """
+    生成 count 行提醒项（插入参数元组），相同的 seed 生成相同的数据
+
+    :param today: 日期分布的基准日期，默认为今天
+    """
+    if today is None:
+        today = datetime.date.today()
+    rng = random.Random(seed)
+    for index in range(count):
+        type_ = rng.choice(TYPES)
+        period = _weighted(rng, PERIODS)
+        end = _end_date(rng, today)
+        start = end - datetime.timedelta(days=period - 1)
+        advance_days = _weighted(rng, ADVANCE_DAYS)
+        actual = end - datetime.timedelta(days=advance_days)
+        auto_renew = 1 if rng.random() < 0.2 else 0
+        yield (
+            f'{type_}-{index + 1:07d}', type_, rng.choice(CERTIFIERS), rng.choice(HANDLERS), period,
+            start.isoformat(), end.isoformat(), advance_days, actual.isoformat(),
+            auto_renew, period if auto_renew else None, 1,
+        )
+
+
+def prepare_schema(path):
+    """用应用的 init_db() 在 path 上创建表和索引"""
+    os.environ['REMINDER_DB_PATH'] = path
+    os.environ.setdefault('REMINDER_OUTBOX_WORKER', 'external')
+    import db
+    if 'app' in sys.modules:
+        db.configure(database=path)
+        sys.modules['app'].init_db()
+    else:
+        # 导入时对 REMINDER_DB_PATH 执行 init_db()
+        import app  # noqa: F401
+
+
+def generate_fixture(path, rows, seed=42, today=None):
+    """
+    生成一个数据文件（已存在时覆盖）
+
+    :return: 用时（秒）
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    started = time.monotonic()
+    prepare_schema(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA synchronous = OFF')
+        with conn:
+            conn.executemany(INSERT_SQL, generate_rows(rows, today, seed))
+            conn.execute("UPDATE data_versions SET version = 1 WHERE name = 'reminders'")
+        # 合并 WAL，数据文件可以单独复制
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    return time.monotonic() - started
+
+
+def parse_sizes(value):
+    sizes = []
+    for item in value.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        if item in SIZES:
+            sizes.append((item, SIZES[item]))
+        elif item.isdigit():
+            sizes.append((item, int(item)))
+        else:
+            raise argparse.ArgumentTypeError(f"无效的数据量: {item}，可选 {', '.join(SIZES)} 或行数")
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成基准测试使用的 reminders.db 数据文件')
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('10k,100k'),
+                        help='逗号分隔的数据量：10k、100k、1m 或具体行数（默认 10k,100k）')
+    parser.add_argument('--out-dir', default=DEFAULT_OUT_DIR, help='输出目录')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for label, rows in args.sizes:
+        path = os.path.abspath(os.path.join(args.out_dir, f'reminders_{label}.db'))
+        elapsed = generate_fixture(path, rows, args.seed)
+        print(f'已生成 {path}: {rows} 行，用时 {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# mock_servers.py
+"""
+本地的 SMTP 和钉钉机器人替身，用于离线测试通知路径的吞吐量
+
+- SMTPSink：接受 EHLO/AUTH/MAIL/RCPT/DATA 的明文 SMTP 服务器，只计数、不投递
+  （应用需设置 REMINDER_SMTP_SECURITY=none，见 smtp_pool.py）；
+- MockDingTalkServer：模拟 /robot/send 接口，按钉钉的规则校验 timestamp/sign 签名
+  （一小时有效期、HMAC-SHA256），超过每分钟条数上限时返回 130101，消息过长时返回 460101。
+
+两者都可以注入延迟和错误（FaultInjector），用来观察客户端的重试、重连和尾延迟。
+
+单独运行时启动两个服务器，把应用的邮箱/钉钉配置指向它们即可手动测试：
+    REMINDER_SMTP_SECURITY=none python app.py
+    python benchmarks/mock_servers.py --smtp-port 2525 --dingtalk-port 8025 --secret SECtest
+"""
+
+import argparse
+import base64
+import collections
+import hashlib
+import hmac
+import http.server
+import json
+import random
+import socketserver
+import threading
+import time
+import urllib.parse
+
+# 钉钉签名的有效期（毫秒）
+SIGN_TTL_MS = 60 * 60 * 1000
+
+# 钉钉 Markdown 消息正文的长度上限（字节）
+DINGTALK_MAX_TEXT_BYTES = 20000
+
+# 钉钉返回的错误码
+ERRCODE_OK = 0
+ERRCODE_BUSY = -1
+ERRCODE_TOKEN_MISSING = 300001
+ERRCODE_SIGN_MISMATCH = 310000
+ERRCODE_SEND_TOO_FAST = 130101
+ERRCODE_INVALID_JSON = 40035
+ERRCODE_MESSAGE_TOO_LONG = 460101
+
+
+class FaultInjector:
+    """
+    按概率注入延迟和错误（线程安全）
+
+    :param latency: 每次请求固定增加的延迟（秒）
+    :param jitter: 额外的随机延迟上限（秒）
+    :param rates: {错误类型: 概率}，例如 {'error': 0.05, 'disconnect': 0.01}
+    :param seed: 随机数种子，便于复现
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rates=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rates = {name: rate for name, rate in (rates or {}).items() if rate}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            extra = self._rng.random() * self.jitter if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def pick(self):
+        """按概率选出本次要注入的错误类型，不注入时返回 None"""
+        with self._lock:
+            roll = self._rng.random()
+        for name, rate in self.rates.items():
+            if roll < rate:
+                return name
+            roll -= rate
+        return None
+
+
+class _Counters:
+    def __init__(self):
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+# --- SMTP ---
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """一个 SMTP 会话：只实现 smtplib 发送邮件需要的命令"""
+
+    def _reply(self, code, text):
+        self.wfile.write(f'{code} {text}\r\n'.encode('utf-8'))
+
+    def _readline(self):
+        return self.rfile.readline(65537)
+
+    def handle(self):
+        server = self.server
+        server.counters.add('connections')
+        self._reply(220, 'reminder-smtp-sink ESMTP ready')
+        while True:
+            line = self._readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-reminder-smtp-sink\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 52428800\r\n')
+            elif verb == 'HELO':
+                self._reply(250, 'reminder-smtp-sink')
+            elif verb == 'AUTH':
+                self._auth(command)
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                if verb == 'RCPT':
+                    server.counters.add('recipients')
+                self._reply(250, 'OK')
+            elif verb == 'DATA':
+                if not self._data():
+                    return
+            elif verb == 'QUIT':
+                self._reply(221, 'Bye')
+                return
+            else:
+                self._reply(502, 'Command not implemented')
+
+    def _auth(self, command):
+        parts = command.split()
+        mechanism = parts[1].upper() if len(parts) > 1 else ''
+        if mechanism == 'PLAIN' and len(parts) == 2:
+            self._reply(334, '')
+            self._readline()
+        elif mechanism == 'LOGIN':
+            if len(parts) == 2:
+                self._reply(334, base64.b64encode(b'Username:').decode('ascii'))
+                self._readline()
+            self._reply(334, base64.b64encode(b'Password:').decode('ascii'))
+            self._readline()
+        elif mechanism != 'PLAIN':
+            self._reply(504, 'Unrecognized authentication type')
+            return
+        self.server.counters.add('logins')
+        self._reply(235, 'Authentication successful')
+
+    def _data(self):
+        """接收邮件正文；返回 False 表示注入了断线"""
+        server = self.server
+        self._reply(354, 'End data with <CR><LF>.<CR><LF>')
+        size = 0
+        while True:
+            line = self._readline()
+            if not line:
+                return False
+            if line in (b'.\r\n', b'.\n'):
+                break
+            size += len(line)
+
+        server.faults.delay()
+        fault = server.faults.pick()
+        if fault == 'disconnect':
+            server.counters.add('injected_disconnects')
+            return False
+        if fault == 'error':
+            server.counters.add('injected_errors')
+            self._reply(451, 'Injected temporary failure')
+            return True
+        server.counters.add('messages')
+        server.counters.add('bytes', size)
+        self._reply(250, 'OK: queued')
+        return True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    计数用的 SMTP 服务器
+
+    :param faults: 在每封邮件的 DATA 结束时生效；错误类型 'error' 返回 451，'disconnect' 直接断开连接
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, faults=None):
+        self._server = _ThreadingTCPServer((host, port), _SMTPHandler)
+        self._server.faults = faults or FaultInjector()
+        self._server.counters = _Counters()
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        return self._server.counters.snapshot()
+
+
+# --- 钉钉 ---
+
+def verify_sign(secret, timestamp, sign, now_ms=None):
+    """按钉钉的规则校验签名：timestamp 在一小时内，sign = Base64(HMAC-SHA256(secret, timestamp + '\\n' + secret))"""
+    if not timestamp or not sign:
+        return False
+    try:
+        timestamp_ms = int(timestamp)
+    except ValueError:
+        return False
+    if now_ms is None:
+        now_ms = time.time() * 1000
+    if abs(now_ms - timestamp_ms) > SIGN_TTL_MS:
+        return False
+    string_to_sign = f'{timestamp}\n{secret}'.encode('utf-8')
+    expected = base64.b64encode(hmac.new(secret.encode('utf-8'), string_to_sign, hashlib.sha256).digest()).decode('ascii')
+    return hmac.compare_digest(expected, sign)
+
+
+class _DingTalkHandler(http.server.BaseHTTPRequestHandler):
+    # 保持长连接，与 requests.Session 的连接池配合
+    protocol_version = 'HTTP/1.1'
+    # 头部和正文分两次写出，关闭 Nagle 以免与客户端的延迟确认叠加出约 200ms 的停顿
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        server.counters.add('requests')
+
+        parsed = urllib.parse.urlsplit(self.path)
+        if parsed.path != '/robot/send':
+            self._respond(404, {'errcode': 404, 'errmsg': 'not found'})
+            return
+        query = urllib.parse.parse_qs(parsed.query)
+        if not query.get('access_token'):
+            server.counters.add('token_missing')
+            self._respond(200, {'errcode': ERRCODE_TOKEN_MISSING, 'errmsg': 'token is not exist'})
+            return
+        if server.secret is not None:
+            timestamp = (query.get('timestamp') or [None])[0]
+            sign = (query.get('sign') or [None])[0]
+            if not verify_sign(server.secret, timestamp, sign):
+                server.counters.add('sign_rejected')
+                self._respond(200, {'errcode': ERRCODE_SIGN_MISMATCH, 'errmsg': 'sign not match'})
+                return
+
+        server.faults.delay()
+        fault = server.faults.pick()
+        if fault == 'http_error':
+            server.counters.add('injected_http_errors')
+            self._respond(500, {'errcode': 500, 'errmsg': 'injected server error'})
+            return
+        if fault == 'busy':
+            server.counters.add('injected_busy')
+            self._respond(200, {'errcode': ERRCODE_BUSY, 'errmsg': '系统繁忙'})
+            return
+        if not server.allow_request():
+            server.counters.add('rate_limited')
+            self._respond(200, {
+                'errcode': ERRCODE_SEND_TOO_FAST,
+                'errmsg': f'send too fast, exceed {server.rate_limit_per_minute} times per minute',
+            })
+            return
+
+        try:
+            message = json.loads(raw.decode('utf-8'))
+        except ValueError:
+            self._respond(200, {'errcode': ERRCODE_INVALID_JSON, 'errmsg': '缺少参数 json'})
+            return
+        text = (message.get('markdown') or {}).get('text') or (message.get('text') or {}).get('content') or ''
+        if len(text.encode('utf-8')) > DINGTALK_MAX_TEXT_BYTES:
+            server.counters.add('too_long')
+            self._respond(200, {'errcode': ERRCODE_MESSAGE_TOO_LONG, 'errmsg': 'message too long'})
+            return
+
+        server.counters.add('messages')
+        server.counters.add('bytes', len(raw))
+        with server.messages_lock:
+            server.messages.append(message)
+        self._respond(200, {'errcode': ERRCODE_OK, 'errmsg': 'ok'})
+
+
+class _ThreadingHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockDingTalkServer:
+    """
+    钉钉机器人 Webhook 替身
+
+    :param secret: 加签密钥，为 None 时不校验签名
+    :param rate_limit_per_minute: 每分钟最多接受的消息数（滑动窗口），超过时返回 130101；None 表示不限
+    :param faults: 错误类型 'http_error' 返回 HTTP 500，'busy' 返回 errcode -1
+    :param keep_messages: 最多保留的最近消息数，供检查内容
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, secret=None, rate_limit_per_minute=None, faults=None,
+                 keep_messages=1000):
+        server = _ThreadingHTTPServer((host, port), _DingTalkHandler)
+        server.secret = secret
+        server.rate_limit_per_minute = rate_limit_per_minute
+        server.faults = faults or FaultInjector()
+        server.counters = _Counters()
+        server.messages = collections.deque(maxlen=keep_messages)
+        server.messages_lock = threading.Lock()
+        window = collections.deque()
+        window_lock = threading.Lock()
+
+        def allow_request():
+            if not rate_limit_per_minute:
+                return True
+            now = time.monotonic()
+            with window_lock:
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                if len(window) >= rate_limit_per_minute:
+                    return False
+                window.append(now)
+                return True
+
+        server.allow_request = allow_request
+        self._server = server
+        self.host, self.port = server.server_address[:2]
+        self.webhook_url = f'http://{self.host}:{self.port}/robot/send?access_token=mock'
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='dingtalk-mock', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        return self._server.counters.snapshot()
+
+    def messages(self):
+        with self._server.messages_lock:
+            return list(self._server.messages)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='启动本地 SMTP 和钉钉机器人替身')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--smtp-port', type=int, default=2525)
+    parser.add_argument('--dingtalk-port', type=int, default=8025)
+    parser.add_argument('--secret', help='钉钉加签密钥，不指定时不校验签名')
+    parser.add_argument('--rate-limit', type=int, default=20, help='钉钉每分钟消息数上限（0 表示不限，默认 20）')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求增加的延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='SMTP 451 / 钉钉 HTTP 500 的概率')
+    args = parser.parse_args(argv)
+
+    smtp = SMTPSink(args.host, args.smtp_port, FaultInjector(args.latency, rates={'error': args.error_rate})).start()
+    dingtalk = MockDingTalkServer(
+        args.host, args.dingtalk_port, args.secret, args.rate_limit or None,
+        FaultInjector(args.latency, rates={'http_error': args.error_rate})
+    ).start()
+    print(f'SMTP 替身: {smtp.host}:{smtp.port}（应用需设置 REMINDER_SMTP_SECURITY=none）')
+    print(f'钉钉替身: {dingtalk.webhook_url}')
+    try:
+        while True:
+            time.sleep(10)
+            print(f'SMTP {smtp.stats()} | 钉钉 {dingtalk.stats()}')
+    except KeyboardInterrupt:
+        smtp.stop()
+        dingtalk.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# notification_harness.py
+"""
+通知发送吞吐量测试
+
+启动本地的 SMTP 和钉钉替身（见 mock_servers.py），把合成的提醒汇总写入通知发件箱，
+再由 concurrency 个 OutboxWorker 同时领取并投递，走的是与生产环境相同的路径：
+领取（claim）、notification_outbox.deliver_email / deliver_dingtalk、逐页记录进度、
+记录结果。报告：
+
+- 每秒投递成功的任务数和替身实际收到的消息数；
+- 每个任务从领取到记录结果的延迟分布（p50/p90/p95/p99）；
+- 客户端的重试/重连次数和替身注入的错误、限流次数。
+
+投递失败的任务按发件箱的退避时间重新排队，测试结束时不会等待重试，计为失败。
+
+用法：
+    python benchmarks/notification_harness.py --messages 200 --concurrency 4
+    python benchmarks/notification_harness.py --dingtalk-busy-rate 0.1 --dingtalk-rate-limit 600 --output notify.json
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from mock_servers import SMTPSink, MockDingTalkServer, FaultInjector
+from generate_fixtures import generate_rows
+from run_benchmarks import summarize
+
+CHANNELS = ('email', 'dingtalk')
+
+REMINDER_FIELDS = ('name', 'type', 'certifier', 'handler', 'period', 'start_date', 'end_date',
+                   'advance_days', 'actual_reminder_date')
+
+
+def build_reminders(count, seed):
+    """合成 count 个已进入提醒窗口的提醒项（字典）"""
+    today = datetime.date.today()
+    reminders = []
+    for index, row in enumerate(generate_rows(count, today, seed)):
+        reminder = dict(zip(REMINDER_FIELDS, row))
+        reminder['id'] = index + 1
+        reminder['end_date'] = (today + datetime.timedelta(days=index % 30)).isoformat()
+        reminder['actual_reminder_date'] = today.isoformat()
+        reminders.append(reminder)
+    return reminders
+
+
+def make_timed_worker_class():
+    """在导入应用模块（已设置好环境变量）之后生成记录每个任务耗时的 OutboxWorker 子类"""
+    from notification_outbox import OutboxWorker
+
+    class TimedOutboxWorker(OutboxWorker):
+        """记录每个任务从领取到记录结果的耗时"""
+
+        def __init__(self, durations, lock):
+            super().__init__()
+            self.durations = durations
+            self._durations_lock = lock
+            self._claimed_at = {}
+
+        def claim(self):
+            jobs = super().claim()
+            now = time.perf_counter()
+            for job in jobs:
+                self._claimed_at[job['id']] = now
+            return jobs
+
+        def _record(self, job, error):
+            super()._record(job, error)
+            elapsed = time.perf_counter() - self._claimed_at.pop(job['id'])
+            with self._durations_lock:
+                self.durations.append(elapsed)
+
+    return TimedOutboxWorker
+
+
+def run_channel(name, payload, messages, concurrency):
+    """
+    向发件箱写入 messages 个任务，再用 concurrency 个 worker 同时投递到没有可领取的任务为止
+
+    :return: (每个任务的耗时列表, 投递成功的任务数, 投递用时)
+    """
+    from notification_outbox import enqueue_notification, outbox_counts
+    worker_class = make_timed_worker_class()
+
+    sent_before = outbox_counts()['sent']
+    for index in range(messages):
+        enqueue_notification(name, payload, idempotency_key=f'bench:{name}:{index}')
+
+    durations = []
+    lock = threading.Lock()
+    workers = [worker_class(durations, lock) for _ in range(concurrency)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'bench-{name}') as pool:
+            list(pool.map(lambda worker: worker.drain(), workers))
+    elapsed = time.perf_counter() - started
+    return durations, outbox_counts()['sent'] - sent_before, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在本地替身上测试通知发送的吞吐量和尾延迟')
+    parser.add_argument('--channels', default=','.join(CHANNELS), help='逗号分隔的通道（默认 email,dingtalk）')
+    parser.add_argument('--messages', type=int, default=200, help='每个通道写入发件箱的任务数（默认 200）')
+    parser.add_argument('--reminders', type=int, default=50, help='每个任务包含的提醒项数（默认 50）')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时领取任务的发件箱 worker 数（默认 4）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--smtp-latency', type=float, default=0.0, help='SMTP 每封邮件的延迟（秒）')
+    parser.add_argument('--smtp-error-rate', type=float, default=0.0, help='SMTP 返回 451 的概率')
+    parser.add_argument('--smtp-disconnect-rate', type=float, default=0.0, help='SMTP 断开连接的概率（触发重连重试）')
+    parser.add_argument('--dingtalk-latency', type=float, default=0.0, help='钉钉每个请求的延迟（秒）')
+    parser.add_argument('--dingtalk-jitter', type=float, default=0.0, help='钉钉额外随机延迟的上限（秒）')
+    parser.add_argument('--dingtalk-error-rate', type=float, default=0.0, help='钉钉返回 HTTP 500 的概率')
+    parser.add_argument('--dingtalk-busy-rate', type=float, default=0.0, help='钉钉返回 errcode -1 的概率')
+    parser.add_argument('--dingtalk-rate-limit', type=int, default=0,
+                        help='钉钉替身每分钟的消息数上限，超过时返回 130101（默认不限）')
+    parser.add_argument('--dingtalk-secret', default='SECbenchmark', help='钉钉加签密钥（空字符串表示不加签）')
+    parser.add_argument('--client-rate', type=int, default=60000,
+                        help='钉钉客户端限速的每分钟消息数（默认 60000，即基本不限速）')
+    parser.add_argument('--backoff', type=float, default=0.05, help='钉钉客户端重试的退避基数（秒，默认 0.05）')
+    parser.add_argument('--output', help='结果 JSON 文件，不指定时输出到标准输出')
+    args = parser.parse_args(argv)
+
+    channels = [channel.strip() for channel in args.channels.split(',') if channel.strip()]
+    unknown = [channel for channel in channels if channel not in CHANNELS]
+    if unknown:
+        parser.error(f"未知的通道: {', '.join(unknown)}")
+
+    smtp = SMTPSink(faults=FaultInjector(
+        args.smtp_latency, rates={'error': args.smtp_error_rate, 'disconnect': args.smtp_disconnect_rate},
+        seed=args.seed
+    )).start()
+    dingtalk = MockDingTalkServer(
+        secret=args.dingtalk_secret or None, rate_limit_per_minute=args.dingtalk_rate_limit or None,
+        faults=FaultInjector(
+            args.dingtalk_latency, args.dingtalk_jitter,
+            rates={'http_error': args.dingtalk_error_rate, 'busy': args.dingtalk_busy_rate}, seed=args.seed
+        )
+    ).start()
+
+    # 应用模块在导入时读取这些配置；数据库只用临时文件，不会碰到项目目录中的 reminders.db；
+    # 发件箱 worker 不在后台自动启动，由下面的 TimedOutboxWorker 投递
+    workdir = tempfile.mkdtemp(prefix='reminder_notify_bench_')
+    os.environ['REMINDER_DB_PATH'] = os.path.join(workdir, 'reminders.db')
+    os.environ['REMINDER_OUTBOX_WORKER'] = 'external'
+    os.environ['REMINDER_SMTP_SECURITY'] = 'none'
+    os.environ['REMINDER_DINGTALK_RATE_PER_MINUTE'] = str(args.client_rate)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    from digest import build_email_pages, build_dingtalk_pages
+    from smtp_pool import smtp_sender
+    from dingtalk_client import dingtalk_client
+    # 失败次数已计入结果，不再逐条输出错误日志
+    logging.getLogger().setLevel(logging.CRITICAL)
+    dingtalk_client.backoff = args.backoff
+
+    # 与 Web 界面一样通过配置接口把两个通道指向替身，投递时从配置缓存读取
+    client = app.app.test_client()
+    headers = {'X-User-Logged-In': '1'}
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.post('/api/settings/email', json={
+            'smtp_server': smtp.host, 'smtp_port': str(smtp.port), 'sender_email': 'bench@example.com',
+            'sender_password': 'bench', 'recipient_email': 'ops@example.com',
+        }, headers=headers)
+        client.post('/api/settings/dingtalk', json={
+            'dingtalk_webhook': dingtalk.webhook_url, 'dingtalk_secret': args.dingtalk_secret,
+        }, headers=headers)
+
+    reminders = build_reminders(args.reminders, args.seed)
+    payloads = {
+        'email': {'pages': build_email_pages(reminders)},
+        'dingtalk': {'pages': build_dingtalk_pages(reminders)},
+    }
+
+    results = {}
+    try:
+        for channel in channels:
+            print(f'[{channel}] 发送 {args.messages} 次，并发 {args.concurrency}', file=sys.stderr)
+            smtp_before, client_before = smtp_sender.stats(), dingtalk_client.stats()
+            durations, succeeded, elapsed = run_channel(channel, payloads[channel], args.messages, args.concurrency)
+            result = summarize(durations) if durations else {'unit': 'ms', 'count': 0}
+            result.update({
+                'messages': args.messages,
+                'pages_per_message': len(payloads[channel]['pages']),
+                'succeeded': succeeded,
+                'failed': args.messages - succeeded,
+                'elapsed_seconds': round(elapsed, 3),
+                'messages_per_second': round(succeeded / elapsed, 1) if elapsed else 0.0,
+            })
+            if channel == 'email':
+                smtp_after = smtp_sender.stats()
+                result['reconnects'] = smtp_after['reconnects'] - smtp_before['reconnects']
+                result['connects'] = smtp_after['connects'] - smtp_before['connects']
+                result['server'] = smtp.stats()
+            else:
+                client_after = dingtalk_client.stats()
+                result['retries'] = client_after['retries'] - client_before['retries']
+                result['throttled_seconds'] = round(client_after['throttled_seconds'] - client_before['throttled_seconds'], 3)
+                result['server'] = dingtalk.stats()
+            results[channel] = result
+            print(f"  {result['messages_per_second']} 条/秒，p50 {result.get('p50')}ms，p99 {result.get('p99')}ms，"
+                  f"失败 {result['failed']}", file=sys.stderr)
+    finally:
+        smtp_sender.close()
+        smtp.stop()
+        dingtalk.stop()
+
+    report = {
+        'meta': {
+            'channels': channels,
+            'messages': args.messages,
+            'reminders_per_message': args.reminders,
+            'concurrency': args.concurrency,
+            'faults': {
+                'smtp': {'latency': args.smtp_latency, 'error_rate': args.smtp_error_rate,
+                         'disconnect_rate': args.smtp_disconnect_rate},
+                'dingtalk': {'latency': args.dingtalk_latency, 'jitter': args.dingtalk_jitter,
+                             'error_rate': args.dingtalk_error_rate, 'busy_rate': args.dingtalk_busy_rate,
+                             'rate_limit_per_minute': args.dingtalk_rate_limit or None},
+            },
+            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text + '\n')
+        print(f'结果已写入 {args.output}', file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# run_benchmarks.py
+"""
+API 和通知路径的基准测试
+
+在数据文件（见 generate_fixtures.py）的临时副本上，通过 Flask 测试客户端测量：
+
+- 列表：GET /api/reminders 分页首页、按状态筛选、连续翻页、304、一次返回全部；
+- 统计：GET /api/reminders/stats（评估缓存失效/命中）；
+- 增删改：POST / PUT / DELETE /api/reminders 的延迟；
+- CSV：导出和导入的延迟与吞吐量；
+- 到期检查：reminder_engine 评估、email_utils.check_and_notify（写入发件箱，不实际发送）。
+
+结果以 JSON 输出（每项的次数、最小/平均/最大值和 p50/p90/p95/p99，单位毫秒），
+用 --compare 与上一个版本的结果比较，p95 变慢超过阈值时以非零状态退出。
+
+用法：
+    python benchmarks/run_benchmarks.py benchmarks/fixtures/reminders_10k.db --output results.json
+    python benchmarks/run_benchmarks.py benchmarks/fixtures/reminders_10k.db --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+BENCHMARK_GROUPS = ('list', 'stats', 'crud', 'csv', 'due')
+
+HEADERS = {'X-User-Logged-In': '1'}
+
+# 比较结果时默认允许的 p95 变慢比例
+DEFAULT_THRESHOLD = 1.2
+
+
+def percentile(sorted_values, fraction):
+    """线性插值的百分位数，sorted_values 已排序且非空"""
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(durations, **extra):
+    """把耗时列表（秒）汇总为毫秒统计"""
+    values = sorted(duration * 1000 for duration in durations)
+    summary = {
+        'unit': 'ms',
+        'count': len(values),
+        'min': values[0],
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 0.50),
+        'p90': percentile(values, 0.90),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1],
+    }
+    summary = {key: round(value, 3) if isinstance(value, float) else value for key, value in summary.items()}
+    summary.update(extra)
+    return summary
+
+
+def timed(func, *args, **kwargs):
+    """执行一次并返回 (耗时秒数, 返回值)"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def _check(response, expected=(200,)):
+    if response.status_code not in expected:
+        raise RuntimeError(f'{response.request.method} {response.request.path} 返回 {response.status_code}: '
+                           f'{response.get_data(as_text=True)[:200]}')
+    return response
+
+
+class BenchmarkRunner:
+    """
+    在数据文件的副本上运行各组基准测试
+
+    :param fixture: 数据文件路径（不会被修改）
+    :param iterations: 每项的测量次数（重量级的项目次数更少）
+    :param warmup: 每项正式测量前的预热次数
+    """
+
+    def __init__(self, fixture, iterations=50, warmup=3, heavy_iterations=3, import_rows=5000):
+        self.fixture = fixture
+        self.iterations = iterations
+        self.warmup = warmup
+        self.heavy_iterations = heavy_iterations
+        self.import_rows = import_rows
+        self.results = {}
+        self._workdir = tempfile.mkdtemp(prefix='reminder_bench_')
+        self.database = os.path.join(self._workdir, 'reminders.db')
+        shutil.copyfile(fixture, self.database)
+
+        # 应用在导入时连接 REMINDER_DB_PATH 并执行 init_db()；通知只入队，不启动投递线程
+        os.environ['REMINDER_DB_PATH'] = self.database
+        os.environ['REMINDER_OUTBOX_WORKER'] = 'external'
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+            import db
+            if db.DATABASE != self.database:
+                db.configure(database=self.database)
+                app.init_db()
+        logging.getLogger().setLevel(logging.WARNING)
+        self.app = app
+        self.client = app.app.test_client()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self._configure_channels()
+
+    def close(self):
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def _configure_channels(self):
+        """配置不可达的 SMTP 服务器和钉钉 Webhook，使到期检查走完两个通道的入队路径（不启动投递）"""
+        _check(self.client.post('/api/settings/email', json={
+            'smtp_server': '127.0.0.1', 'smtp_port': '2525', 'sender_email': 'bench@example.com',
+            'sender_password': 'bench', 'recipient_email': 'ops@example.com',
+        }, headers=HEADERS))
+        _check(self.client.post('/api/settings/dingtalk', json={
+            'dingtalk_webhook': 'http://127.0.0.1:9/robot/send?access_token=bench', 'dingtalk_secret': '',
+        }, headers=HEADERS))
+
+    def row_count(self):
+        with self.app.get_db() as conn:
+            return conn.execute('SELECT COUNT(*) FROM reminders').fetchone()[0]
+
+    def measure(self, name, func, iterations=None, setup=None, warmup=None, **extra):
+        """
+        预热后测量 func() iterations 次，结果记录在 self.results[name]
+
+        :param setup: 可选，每次测量前调用（不计时），例如让缓存失效
+        """
+        iterations = iterations or self.iterations
+        warmup = self.warmup if warmup is None else warmup
+        durations = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for index in range(warmup + iterations):
+                if setup:
+                    setup()
+                elapsed, _ = timed(func)
+                if index >= warmup:
+                    durations.append(elapsed)
+        self.results[name] = summarize(durations, **extra)
+        print(f"  {name}: p50 {self.results[name]['p50']}ms, p95 {self.results[name]['p95']}ms", file=sys.stderr)
+        return self.results[name]
+
+    # --- 列表 ---
+
+    def bench_list(self):
+        client = self.client
+        self.measure('list_first_page', lambda: _check(client.get('/api/reminders?limit=100', headers=HEADERS)))
+        self.measure('list_status_warning', lambda: _check(
+            client.get('/api/reminders?status=warning&limit=100', headers=HEADERS)))
+        self.measure('list_sort_end_date_desc', lambda: _check(
+            client.get('/api/reminders?sort=end_date&order=desc&limit=100', headers=HEADERS)))
+
+        # 连续翻页：每一页单独计时
+        durations = []
+        token = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(self.iterations):
+                url = '/api/reminders?limit=100' + (f'&page_token={token}' if token else '')
+                elapsed, response = timed(client.get, url, headers=HEADERS)
+                durations.append(elapsed)
+                token = _check(response).get_json()['next_page_token']
+                if not token:
+                    break
+        self.results['list_page_walk'] = summarize(durations)
+
+        etag = _check(client.get('/api/reminders?limit=100', headers=HEADERS)).headers['ETag']
+        self.measure('list_not_modified', lambda: _check(
+            client.get('/api/reminders?limit=100', headers=dict(HEADERS, **{'If-None-Match': etag})), (304,)))
+        self.measure('list_all', lambda: _check(client.get('/api/reminders', headers=HEADERS)),
+                     iterations=self.heavy_iterations, warmup=1, rows=self.row_count())
+
+    # --- 统计 ---
+
+    def bench_stats(self):
+        engine = self.app.reminder_engine
+        self.measure('stats_cold', lambda: _check(self.client.get('/api/reminders/stats', headers=HEADERS)),
+                     setup=engine.invalidate)
+        self.measure('stats_cached', lambda: _check(self.client.get('/api/reminders/stats', headers=HEADERS)))
+
+    # --- 增删改 ---
+
+    def bench_crud(self):
+        today = datetime.date.today()
+        created = []
+
+        def create():
+            end = today + datetime.timedelta(days=len(created) % 365 + 1)
+            response = _check(self.client.post('/api/reminders', json={
+                'name': f'基准测试-{len(created)}', 'type': '营业执照', 'certifier': '市场监督管理局',
+                'handler': '张三', 'period': 365, 'start_date': (end - datetime.timedelta(days=364)).isoformat(),
+                'end_date': end.isoformat(), 'advance_days': 30,
+            }, headers=HEADERS), (201,))
+            created.append(response.get_json())
+
+        self.measure('crud_create', create)
+
+        pending = list(created)
+
+        def update():
+            reminder = pending.pop()
+            reminder['handler'] = '李四'
+            _check(self.client.put(f"/api/reminders/{reminder['id']}", json=reminder, headers=HEADERS))
+
+        self.measure('crud_update', update, iterations=len(created) - self.warmup)
+
+        remaining = list(created)
+
+        def delete():
+            _check(self.client.delete(f"/api/reminders/{remaining.pop()['id']}", headers=HEADERS), (200, 204))
+
+        self.measure('crud_delete', delete, iterations=len(created) - self.warmup)
+
+    # --- CSV ---
+
+    def bench_csv(self):
+        rows = self.row_count()
+        sizes = []
+
+        def export():
+            response = _check(self.client.get('/api/reminders/export', headers=HEADERS))
+            sizes.append(len(response.get_data()))
+
+        result = self.measure('csv_export', export, iterations=self.heavy_iterations, warmup=1, rows=rows)
+        result['bytes'] = sizes[-1]
+        result['rows_per_second'] = round(rows / (result['p50'] / 1000), 1)
+        result['mb_per_second'] = round(sizes[-1] / 1024 / 1024 / (result['p50'] / 1000), 2)
+
+        payload = self._import_csv(self.import_rows)
+        max_id = [0]
+
+        def before_import():
+            with self.app.get_db() as conn:
+                max_id[0] = conn.execute('SELECT COALESCE(MAX(id), 0) FROM reminders').fetchone()[0]
+
+        def import_csv():
+            response = _check(self.client.post(
+                '/api/reminders/import', data={'file': (io.BytesIO(payload), 'bench.csv')},
+                headers=HEADERS, content_type='multipart/form-data'
+            ), (201,))
+            if response.get_json()['rows_inserted'] != self.import_rows:
+                raise RuntimeError(f"导入行数不符: {response.get_json()}")
+
+        durations = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(self.heavy_iterations):
+                before_import()
+                elapsed, _ = timed(import_csv)
+                durations.append(elapsed)
+                # 删除本次导入的行，后续测量的数据量不变（递增版本号，评估缓存随之失效）
+                with self.app.get_db() as conn:
+                    conn.execute('DELETE FROM reminders WHERE id > ?', (max_id[0],))
+                    self.app.bump_data_version(conn, self.app.data_version.REMINDERS)
+        result = summarize(durations, rows=self.import_rows)
+        result['rows_per_second'] = round(self.import_rows / (result['p50'] / 1000), 1)
+        self.results['csv_import'] = result
+        print(f"  csv_import: p50 {result['p50']}ms, {result['rows_per_second']} 行/秒", file=sys.stderr)
+
+    def _import_csv(self, rows):
+        """生成导入文件，列与导出文件相同"""
+        from generate_fixtures import generate_rows
+        buffer = io.StringIO()
+        buffer.write('\ufeffID,名称,类型,认证人员,办事员,周期(天),开始日期,到期日期,提前天数,实际提醒日期\n')
+        for row in generate_rows(rows, seed=7):
+            name, type_, certifier, handler, period, start, end, advance_days, actual = row[:9]
+            buffer.write(f"0,{name},{type_},{certifier or ''},{handler or ''},{period},{start},{end},{advance_days},{actual}\n")
+        return buffer.getvalue().encode('utf-8')
+
+    # --- 到期检查 ---
+
+    def bench_due(self):
+        engine = self.app.reminder_engine
+        from email_utils import check_and_notify
+
+        def reset_notices():
+            # 每次都从“从未通知过”开始，测量完整的筛选、分页和入队
+            with self.app.get_db() as conn:
+                conn.execute('DELETE FROM notification_state')
+                conn.execute('DELETE FROM notification_outbox')
+
+        def reset_all():
+            reset_notices()
+            engine.invalidate()
+
+        due = len(engine.evaluate().due)
+        self.measure('engine_evaluate_cold', engine.evaluate, setup=engine.invalidate, due=due)
+        self.measure('due_check_cold', lambda: check_and_notify(('email', 'dingtalk')),
+                     setup=reset_all, due=due)
+        self.measure('due_check_cached', lambda: check_and_notify(('email', 'dingtalk')),
+                     setup=reset_notices, due=due)
+        # 当天已通知过：只读通知状态，没有需要发送的项目。通知状态在发件箱投递成功时才写入，
+        # 基准测试不启动投递（通道指向不可达的地址），这里按已入队任务附带的通知记录直接写入，
+        # 与 worker 投递成功时的写入相同
+        reset_notices()
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_and_notify(('email', 'dingtalk'))
+        self._mark_outbox_delivered()
+        with contextlib.redirect_stdout(io.StringIO()):
+            remaining = len(check_and_notify(('email', 'dingtalk')))
+        if remaining:
+            raise RuntimeError(f'写入通知状态后仍有 {remaining} 个项目需要通知')
+        self.measure('due_check_nothing_new', lambda: check_and_notify(('email', 'dingtalk')), due=due)
+
+    def _mark_outbox_delivered(self):
+        """把发件箱中的任务标记为已投递，并写入任务附带的通知状态（见 notification_outbox.OutboxWorker._record）"""
+        from notification_state import record_delivered_notices
+        with self.app.get_db() as conn:
+            for row in conn.execute("SELECT id, payload FROM notification_outbox WHERE status = 'pending'").fetchall():
+                notices = json.loads(row['payload']).get('notices')
+                if notices:
+                    record_delivered_notices(conn, notices)
+                conn.execute("UPDATE notification_outbox SET status = 'sent' WHERE id = ?", (row['id'],))
+
+    def run(self, groups=BENCHMARK_GROUPS):
+        for group in groups:
+            print(f'[{group}]', file=sys.stderr)
+            getattr(self, f'bench_{group}')()
+        return self.results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与基线结果比较 p50/p95
+
+    :return: p95 变慢超过 threshold 倍的项目名列表
+    """
+    regressions = []
+    print(f"{'benchmark':<28}{'p50 基线':>12}{'p50 当前':>12}{'p95 基线':>12}{'p95 当前':>12}{'p95 比例':>10}", file=sys.stderr)
+    for name, current in results['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            print(f'{name:<28}（基线中没有）', file=sys.stderr)
+            continue
+        ratio = current['p95'] / old['p95'] if old['p95'] else float('inf')
+        flag = ' !' if ratio > threshold else ''
+        print(f"{name:<28}{old['p50']:>12}{current['p50']:>12}{old['p95']:>12}{current['p95']:>12}{ratio:>10.2f}{flag}", file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='运行 API 和通知路径的基准测试')
+    parser.add_argument('fixture', help='generate_fixtures.py 生成的数据文件')
+    parser.add_argument('--iterations', type=int, default=50, help='每项的测量次数（默认 50）')
+    parser.add_argument('--warmup', type=int, default=3, help='每项的预热次数（默认 3）')
+    parser.add_argument('--heavy-iterations', type=int, default=3,
+                        help='全量列表、CSV 导入导出的测量次数（默认 3）')
+    parser.add_argument('--import-rows', type=int, default=5000, help='导入测试的 CSV 行数（默认 5000）')
+    parser.add_argument('--only', default=','.join(BENCHMARK_GROUPS),
+                        help=f"逗号分隔的测试组（默认全部）：{', '.join(BENCHMARK_GROUPS)}")
+    parser.add_argument('--output', help='结果 JSON 文件，不指定时输出到标准输出')
+    parser.add_argument('--compare', help='基线结果 JSON 文件')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'p95 允许的变慢比例（默认 {DEFAULT_THRESHOLD}）')
+    args = parser.parse_args(argv)
+
+    groups = [group.strip() for group in args.only.split(',') if group.strip()]
+    unknown = [group for group in groups if group not in BENCHMARK_GROUPS]
+    if unknown:
+        parser.error(f"未知的测试组: {', '.join(unknown)}")
+
+    runner = BenchmarkRunner(args.fixture, args.iterations, args.warmup, args.heavy_iterations, args.import_rows)
+    try:
+        rows = runner.row_count()
+        print(f'数据文件 {args.fixture}: {rows} 行', file=sys.stderr)
+        started = time.monotonic()
+        runner.run(groups)
+        results = {
+            'meta': {
+                'fixture': os.path.basename(args.fixture),
+                'rows': rows,
+                'groups': groups,
+                'iterations': args.iterations,
+                'warmup': args.warmup,
+                'heavy_iterations': args.heavy_iterations,
+                'git_revision': git_revision(),
+                'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'duration_seconds': round(time.monotonic() - started, 1),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+            },
+            'results': runner.results,
+        }
+    finally:
+        runner.close()
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text + '\n')
+        print(f'结果已写入 {args.output}', file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f"p95 变慢超过 {args.threshold} 倍: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# change_events.py
+"""
+提醒项变更事件的进程内发布/订阅
+
+每个 SSE 连接订阅一个有界队列；写入路径调用 publish() 时非阻塞地放入
+所有订阅者的队列。某个客户端消费太慢、队列已满时，不再为它缓存后续事件，
+而是标记为溢出，由连接发送一个 resync 事件让客户端自行增量同步，
+因此慢客户端不会拖慢写入，也不会无限占用内存。
+"""
+
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+
+# 每个订阅者最多缓存的事件数
+MAX_PENDING_EVENTS = 100
+
+# 每个进程最多同时订阅的连接数；每个 SSE 连接一直占用一个请求线程，
+# gunicorn.conf.py 按线程数设置为远小于线程数的值，超过时返回 503，前端退避后重连
+MAX_SUBSCRIBERS = int(os.environ.get('REMINDER_SSE_MAX_SUBSCRIBERS', '200'))
+
+
+class TooManySubscribersError(Exception):
+    """订阅者数量已达上限"""
+
+
+class Subscription:
+    """一个订阅者（一个 SSE 连接）"""
+
+    def __init__(self, broker, subscriber_id, max_pending):
+        self.id = subscriber_id
+        self._broker = broker
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def offer(self, event):
+        """非阻塞放入事件，队列已满时标记溢出"""
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """
+        取出下一个事件；超时返回 None
+
+        溢出后先清空队列，返回一个 {'type': 'resync'} 事件
+        """
+        if self.overflowed:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.overflowed = False
+            return {'type': 'resync'}
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class ChangeEventBroker:
+    """变更事件的发布/订阅中心"""
+
+    def __init__(self, max_pending=MAX_PENDING_EVENTS, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._published = 0
+
+    def subscribe(self):
+        """
+        新建订阅
+
+        :raises TooManySubscribersError: 订阅者数量已达上限
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribersError(f'实时更新连接数已达上限 {self.max_subscribers}')
+            subscription = Subscription(self, next(self._ids), self.max_pending)
+            self._subscribers[subscription.id] = subscription
+        logging.info(f"实时更新订阅 {subscription.id} 已连接，当前 {len(self._subscribers)} 个")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.pop(subscription.id, None)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event):
+        """向所有订阅者发布事件（不阻塞）"""
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+            self._published += 1
+        for subscription in subscribers:
+            subscription.offer(event)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'overflowed': sum(1 for s in self._subscribers.values() if s.overflowed),
+                'published': self._published,
+            }
+
+
+class ThrottledPublisher:
+    """
+    合并频繁的发布请求：每 interval 秒最多调用一次 build_event() 并发布结果
+
+    两次发布之间的请求合并为窗口结束时的一次（尾部触发），最后一次请求之后的结果
+    一定会发布。build_event() 在定时线程中执行，不占用写入路径；返回 None 时不发布。
+
+    :param broker: ChangeEventBroker
+    :param build_event: 生成事件的函数
+    :param interval: 最短发布间隔（秒）
+    """
+
+    def __init__(self, broker, build_event, interval):
+        self.broker = broker
+        self.build_event = build_event
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._timer = None
+        self._last = 0.0
+
+    def request(self):
+        """请求发布一次；已有待发布的请求时直接合并"""
+        with self._lock:
+            if self._timer is not None:
+                return
+            delay = max(0.0, self._last + self.interval - time.monotonic())
+            self._timer = threading.Timer(delay, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+            self._last = time.monotonic()
+        if not self.broker.has_subscribers():
+            return
+        try:
+            event = self.build_event()
+        except Exception as e:
+            logging.error(f"生成合并发布的事件失败: {e}")
+            return
+        if event is not None:
+            self.broker.publish(event)
+
+
+change_events = ChangeEventBroker()
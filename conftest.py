@@ -0,0 +1,9 @@
+# conftest.py
+# 根目录下的这些 test_*.py 是手动运行的脚本：导入时就会修改 reminders.db、
+# 调用本机的 API 或发送真实邮件，不能被 pytest 收集
+collect_ignore = [
+    'test_api_direct.py',
+    'test_api_request.py',
+    'test_email_config.py',
+    'test_email_sending.py',
+]
@@ -0,0 +1,250 @@
+# csv_import.py
+"""
+CSV 批量导入
+
+上传的文件按行流式解析，每 batch_size 行在一个独立事务中插入，
+写锁只在单个批次内持有。导入进度（已解析/已插入/已跳过行数及跳过原因）
+记录在进程内的登记表中，供前端轮询。
+"""
+
+import codecs
+import csv
+import datetime
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from db import get_db
+import data_version
+from data_version import bump_data_version
+from reminder_queries import normalize_reminder_dates
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+
+# 每次导入最多记录的跳过原因条数，避免错误很多的文件占满内存
+MAX_SKIPPED_DETAILS = 1000
+
+# 进度登记表最多保留的导入记录数
+MAX_TRACKED_IMPORTS = 50
+
+INSERT_SQL = '''
+    INSERT INTO reminders (
+        name, type, certifier, handler, period,
+        start_date, end_date, advance_days, actual_reminder_date, row_version
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class ImportProgress:
+    """一次导入的进度"""
+
+    def __init__(self, filename=None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = 'running'  # running / completed / failed
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.rows_skipped = 0
+        self.batches_committed = 0
+        self.skipped = []
+        self.error = None
+        self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def add_parsed(self):
+        """记录解析了一行"""
+        with self._lock:
+            self.rows_parsed += 1
+
+    def add_committed(self, row_count):
+        """记录一个批次已提交"""
+        with self._lock:
+            self.rows_inserted += row_count
+            self.batches_committed += 1
+
+    def skip(self, line_number, reason):
+        with self._lock:
+            self.rows_skipped += 1
+            if len(self.skipped) < MAX_SKIPPED_DETAILS:
+                self.skipped.append({'line': line_number, 'reason': reason})
+        print(f"警告: 第 {line_number} 行{reason}，已跳过。")
+
+    def finish(self, error=None):
+        with self._lock:
+            self.status = 'failed' if error else 'completed'
+            self.error = error
+            self.finished_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'import_id': self.id,
+                'filename': self.filename,
+                'status': self.status,
+                'rows_parsed': self.rows_parsed,
+                'rows_inserted': self.rows_inserted,
+                'rows_skipped': self.rows_skipped,
+                'batches_committed': self.batches_committed,
+                'skipped': list(self.skipped),
+                'skipped_truncated': self.rows_skipped > len(self.skipped),
+                'error': self.error,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+
+
+_imports = OrderedDict()
+_imports_lock = threading.Lock()
+
+
+def start_import(filename=None, import_id=None):
+    """登记一次新的导入并返回其进度对象（import_id 默认随机生成，后台任务中使用任务 ID）"""
+    progress = ImportProgress(filename)
+    if import_id:
+        progress.id = import_id
+    with _imports_lock:
+        _imports[progress.id] = progress
+        while len(_imports) > MAX_TRACKED_IMPORTS:
+            _imports.popitem(last=False)
+    return progress
+
+
+def get_import_progress(import_id):
+    """按 ID 查询导入进度，不存在时返回 None"""
+    with _imports_lock:
+        progress = _imports.get(import_id)
+    return progress.to_dict() if progress else None
+
+
+def parse_batch_size(value):
+    """
+    解析批大小参数
+
+    :raises ValueError: 不是正整数
+    """
+    if value in (None, ''):
+        return DEFAULT_BATCH_SIZE
+    try:
+        batch_size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'batch_size 无效: {value}')
+    if batch_size < 1:
+        raise ValueError('batch_size 必须大于 0')
+    return min(batch_size, MAX_BATCH_SIZE)
+
+
+def parse_import_row(row):
+    """
+    将 CSV 的一行解析为插入参数
+
+    CSV 列顺序为: ID, 名称, 类型, 认证人员, 办事员, 周期(天), 开始日期, 到期日期, 提前天数, 实际提醒日期
+    ID 列会被忽略，由数据库自动生成。
+
+    :raises ValueError: 行数据无效，异常信息即跳过原因
+    """
+    # 确保行有足够的列
+    if len(row) < 10:
+        raise ValueError('列数不足')
+
+    name = row[1]
+    type_ = row[2]
+    certifier = row[3] if row[3] else None
+    handler = row[4] if row[4] else None
+    # 周期可能为空
+    period_str = row[5] if row[5] else None
+    period = int(period_str) if period_str and period_str.isdigit() else None
+    advance_days_str = row[8] if row[8] else '0'  # 默认为0
+    advance_days = int(advance_days_str) if advance_days_str and advance_days_str.isdigit() else 0
+
+    # 基本验证：名称和到期日期是必需的
+    if not name or not row[7]:
+        raise ValueError('缺少必需字段 (名称或到期日期)')
+
+    # 日期统一规范化为 YYYY-MM-DD
+    dates = normalize_reminder_dates({
+        'start_date': row[6], 'end_date': row[7],
+        'actual_reminder_date': row[9], 'advance_days': advance_days
+    })
+    return (
+        name, type_, certifier, handler, period,
+        dates['start_date'], dates['end_date'], advance_days, dates['actual_reminder_date']
+    )
+
+
+def run_import(binary_stream, progress, batch_size=DEFAULT_BATCH_SIZE, on_batch_committed=None):
+    """
+    从二进制流中逐行解析 CSV 并分批插入
+
+    :param binary_stream: 上传文件的二进制流（例如 FileStorage.stream 或临时文件）
+    :param progress: start_import() 返回的进度对象
+    :param batch_size: 每个事务插入的行数
+    :param on_batch_committed: 每个批次提交后的回调，参数为本批插入的提醒项
+                               （包含 id、actual_reminder_date、end_date 的字典列表）
+    :return: 进度字典
+    """
+    def flush(batch):
+        with get_db() as conn:
+            # 先获取写锁再读取最大 ID，其他写入者的新行不会落在本批的 ID 范围内
+            conn.execute('BEGIN IMMEDIATE')
+            max_id_before = conn.execute('SELECT COALESCE(MAX(id), 0) FROM reminders').fetchone()[0]
+            version = bump_data_version(conn, data_version.REMINDERS)
+            conn.executemany(INSERT_SQL, [row + (version,) for row in batch])
+            inserted = None
+            if on_batch_committed:
+                # 同一事务内按主键范围读回本批新行的 ID
+                inserted = [dict(row) for row in conn.execute(
+                    'SELECT id, actual_reminder_date, end_date FROM reminders WHERE id > ? ORDER BY id',
+                    (max_id_before,)
+                )]
+        progress.add_committed(len(batch))
+        if on_batch_committed:
+            on_batch_committed(inserted)
+
+    started = time.monotonic()
+    try:
+        # utf-8-sig 会去掉文件开头的 BOM；StreamReader 只依赖 read()，
+        # 不要求底层对象实现 readable()（SpooledTemporaryFile 在旧版本 Python 中没有）
+        text_stream = codecs.getreader('utf-8-sig')(binary_stream)
+        csv_reader = csv.reader(text_stream)
+
+        # 读取并跳过标题行
+        if next(csv_reader, None) is None:
+            raise ValueError('文件为空')
+
+        batch = []
+        line_number = 1  # 因为跳过了一行标题
+        for row in csv_reader:
+            line_number += 1
+            progress.add_parsed()
+
+            # 简单的行验证，确保行有数据
+            if not row or all(cell == '' for cell in row):
+                progress.skip(line_number, '为空')
+                continue
+            try:
+                batch.append(parse_import_row(row))
+            except (ValueError, IndexError) as e:
+                progress.skip(line_number, f'数据无效 ({e})')
+                continue
+
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+
+        if batch:
+            flush(batch)
+        progress.finish()
+    except Exception as e:
+        logging.error(f"导入 CSV 失败: {e}")
+        progress.finish(error=str(e))
+        raise
+    finally:
+        logging.info(
+            f"CSV 导入 {progress.id} 结束: 解析 {progress.rows_parsed} 行，插入 {progress.rows_inserted} 行，"
+            f"跳过 {progress.rows_skipped} 行，用时 {time.monotonic() - started:.2f}s"
+        )
+    return progress.to_dict()
@@ -0,0 +1,57 @@
+# data_version.py
+"""
+数据版本号
+
+data_versions 表为每类数据（reminders、settings）保存一个单调递增的版本号，
+每个写入路径在自己的事务中调用 bump_data_version()，与数据修改一起提交。
+读接口用版本号生成 ETag：客户端带 If-None-Match 且版本未变时直接返回 304，
+只需一次主键查询，不必扫描表和序列化结果。版本号存在数据库中，
+因此多个进程（Web 应用、独立的提醒服务）之间也是一致的。
+"""
+
+from db import get_db
+
+REMINDERS = 'reminders'
+SETTINGS = 'settings'
+
+DATA_VERSION_NAMES = (REMINDERS, SETTINGS)
+
+
+def ensure_data_version_schema(cursor):
+    """创建 data_versions 表并初始化各类数据的版本号（幂等）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.executemany(
+        'INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)',
+        [(name,) for name in DATA_VERSION_NAMES]
+    )
+
+
+def bump_data_version(conn, name):
+    """
+    在调用方的事务中将版本号加一
+
+    :param conn: 正在执行写入的连接（或游标）
+    :param name: REMINDERS 或 SETTINGS
+    :return: 加一后的版本号（提醒项写入时记录到 row_version 列）
+    """
+    conn.execute('UPDATE data_versions SET version = version + 1 WHERE name = ?', (name,))
+    row = conn.execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_data_version(name, conn=None):
+    """
+    读取当前版本号
+
+    :param conn: 可选，复用已有连接；不传时从连接池取一个
+    """
+    if conn is None:
+        with get_db() as conn:
+            return get_data_version(name, conn)
+    row = conn.execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,268 @@
+# db.py
+"""
+数据库连接管理
+
+所有路由和 email_utils 共用同一个 SQLite 连接池，避免每次请求都重新
+connect / 设置 PRAGMA / 关闭连接。连接以 WAL 模式打开，读写互不阻塞，
+写锁冲突时通过 busy_timeout 等待而不是立即报错。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+# 数据库文件路径
+DATABASE = os.environ.get('REMINDER_DB_PATH', 'reminders.db')
+
+# 连接池配置（均可通过环境变量覆盖）
+POOL_SIZE = int(os.environ.get('REMINDER_DB_POOL_SIZE', '8'))
+BUSY_TIMEOUT_MS = int(os.environ.get('REMINDER_DB_BUSY_TIMEOUT_MS', '5000'))
+STATEMENT_CACHE_SIZE = int(os.environ.get('REMINDER_DB_STATEMENT_CACHE_SIZE', '256'))
+CHECKOUT_TIMEOUT = float(os.environ.get('REMINDER_DB_CHECKOUT_TIMEOUT', '30'))
+
+
+class PoolTimeoutError(Exception):
+    """在 CHECKOUT_TIMEOUT 内没有拿到空闲连接"""
+
+
+class ConnectionPool:
+    """
+    固定上限的 SQLite 连接池
+
+    空闲连接按后进先出复用，池满时调用方在条件变量上等待归还。
+    进程 fork 之后（例如多 worker 部署）会自动丢弃从父进程继承的连接。
+    """
+
+    def __init__(self, database, pool_size=POOL_SIZE, busy_timeout_ms=BUSY_TIMEOUT_MS,
+                 statement_cache_size=STATEMENT_CACHE_SIZE, checkout_timeout=CHECKOUT_TIMEOUT):
+        if pool_size < 1:
+            raise ValueError('pool_size 必须大于 0')
+        self.database = database
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.statement_cache_size = statement_cache_size
+        self.checkout_timeout = checkout_timeout
+
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._created = 0
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+        }
+
+    def _connect(self):
+        """创建一个新连接并设置 PRAGMA"""
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,  # 连接会在线程之间流转，但同一时刻只归一个线程使用
+            cached_statements=self.statement_cache_size,
+        )
+        conn.row_factory = sqlite3.Row  # 支持按列名和下标两种方式访问
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def _reset_after_fork(self):
+        """fork 后子进程不能使用父进程的连接，直接清空重新计数"""
+        self._idle.clear()
+        self._created = 0
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._lock = threading.Condition()
+
+    def acquire(self):
+        """从池中取出一个连接，池满时最多等待 checkout_timeout 秒"""
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            waited = None
+            deadline = None
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.pool_size:
+                    # 在锁外建立连接前先占位，避免超出上限
+                    self._created += 1
+                    conn = None
+                    break
+                if waited is None:
+                    waited = time.monotonic()
+                    deadline = waited + self.checkout_timeout
+                    self._stats['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f'等待数据库连接超时 ({self.checkout_timeout}s, 连接池大小 {self.pool_size})'
+                    )
+                self._lock.wait(remaining)
+
+            if waited is not None:
+                elapsed = time.monotonic() - waited
+                self._stats['wait_time_total'] += elapsed
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], elapsed)
+            self._in_use += 1
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._stats['connections_created'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """归还连接；出现异常的连接可以直接丢弃"""
+        if self._pid != os.getpid():
+            # 父进程的连接，不再放回池中
+            return
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                discard = True
+
+        with self._lock:
+            self._in_use -= 1
+            if discard:
+                self._created -= 1
+                self._stats['connections_discarded'] += 1
+            else:
+                self._idle.append(conn)
+            self._lock.notify()
+
+        if discard:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    @contextmanager
+    def connection(self):
+        """
+        取出连接并在一个事务内使用，正常退出时提交，异常时回滚
+
+        用法与原先的 ``with sqlite3.connect(DATABASE) as conn:`` 一致。
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException as e:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
+            if isinstance(e, sqlite3.DatabaseError) and not isinstance(e, sqlite3.IntegrityError):
+                # 数据库层面的错误（例如文件损坏、连接失效），不再复用该连接
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def stats(self):
+        """返回连接池的使用统计"""
+        with self._lock:
+            result = dict(self._stats)
+            result.update({
+                'database': self.database,
+                'pool_size': self.pool_size,
+                'connections_open': self._created,
+                'connections_idle': len(self._idle),
+                'connections_in_use': self._in_use,
+            })
+        checkouts = result['checkouts']
+        result['wait_ratio'] = result['waits'] / checkouts if checkouts else 0.0
+        return result
+
+    def close_all(self):
+        """关闭所有空闲连接（正在使用的连接在归还后会被重新放回池中）"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._created -= len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """返回全局连接池（首次调用时创建）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE)
+                logging.info(f"数据库连接池已创建: {DATABASE} (大小 {_pool.pool_size})")
+    return _pool
+
+
+def configure(database=None, pool_size=None, busy_timeout_ms=None,
+              statement_cache_size=None, checkout_timeout=None):
+    """
+    重新配置全局连接池（例如切换数据库文件或调整池大小）
+
+    旧连接池中的空闲连接会被关闭。
+    """
+    global _pool, DATABASE
+    with _pool_lock:
+        old = _pool
+        if database is not None:
+            DATABASE = database
+        _pool = ConnectionPool(
+            DATABASE,
+            pool_size=pool_size if pool_size is not None else (old.pool_size if old else POOL_SIZE),
+            busy_timeout_ms=busy_timeout_ms if busy_timeout_ms is not None else BUSY_TIMEOUT_MS,
+            statement_cache_size=statement_cache_size if statement_cache_size is not None else STATEMENT_CACHE_SIZE,
+            checkout_timeout=checkout_timeout if checkout_timeout is not None else CHECKOUT_TIMEOUT,
+        )
+    if old is not None:
+        old.close_all()
+    return _pool
+
+
+def get_db():
+    """
+    获取一个池化连接的上下文管理器
+
+        with get_db() as conn:
+            conn.execute(...)
+    """
+    return get_pool().connection()
+
+
+def get_pool_stats():
+    """返回全局连接池的统计信息"""
+    return get_pool().stats()
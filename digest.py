@@ -0,0 +1,185 @@
+# digest.py
+"""
+提醒汇总（digest）的分页生成
+
+到期的提醒项很多时，一条钉钉消息会超过机器人 Markdown 的长度上限，
+一封邮件也会变成难以阅读的长列表。这里把提醒项按类型或按剩余天数分组，
+再按字节数和条数切成若干页；每一页开头都有汇总（第几页、总数、各组数量），
+跨页的分组在下一页标注“续”。各页按顺序作为一组消息发送。
+"""
+
+import datetime
+import os
+
+from reminder_queries import DATE_FORMAT
+from notification_state import STAGE_LABELS
+
+# 钉钉 Markdown 消息正文的上限约为 20000 字节，留出余量
+DINGTALK_MAX_BYTES = int(os.environ.get('REMINDER_DINGTALK_MAX_BYTES', '18000'))
+
+# 每封邮件最多列出的提醒项数和正文字节数
+EMAIL_MAX_ITEMS = int(os.environ.get('REMINDER_EMAIL_PAGE_ITEMS', '200'))
+EMAIL_MAX_BYTES = int(os.environ.get('REMINDER_EMAIL_MAX_BYTES', '100000'))
+
+# 分组方式：type（按类型）或 date（按剩余天数）
+DEFAULT_GROUP_BY = os.environ.get('REMINDER_DIGEST_GROUP_BY', 'type')
+
+# 按剩余天数分组时的区间：(最多剩余天数, 名称)
+DATE_BUCKETS = [
+    (0, '今天到期'),
+    (3, '3 天内到期'),
+    (7, '7 天内到期'),
+    (30, '30 天内到期'),
+    (None, '30 天以后到期'),
+]
+
+DIGEST_TITLE = '证照即将到期提醒'
+
+# 页头汇总中最多列出的分组数，避免分组很多时页头本身过长
+SUMMARY_GROUP_LIMIT = 10
+
+
+def _date_bucket(end_date, today):
+    try:
+        days_left = (datetime.datetime.strptime(end_date, DATE_FORMAT).date() - today).days
+    except (TypeError, ValueError):
+        return DATE_BUCKETS[-1][1]
+    for max_days, label in DATE_BUCKETS:
+        if max_days is None or days_left <= max_days:
+            return label
+    return DATE_BUCKETS[-1][1]
+
+
+def group_reminders(reminders, group_by=DEFAULT_GROUP_BY, today=None):
+    """
+    把提醒项分组，组内按到期日期排序
+
+    :param group_by: 'type' 按类型（组按名称排序），'date' 按剩余天数（组按紧急程度排序）
+    :return: [(组名, [提醒项])]
+    """
+    groups = {}
+    if group_by == 'date':
+        today = today or datetime.date.today()
+        for reminder in reminders:
+            groups.setdefault(_date_bucket(reminder.get('end_date'), today), []).append(reminder)
+        order = [label for _, label in DATE_BUCKETS]
+        keys = sorted(groups, key=order.index)
+    elif group_by == 'type':
+        for reminder in reminders:
+            groups.setdefault(reminder.get('type') or '未分类', []).append(reminder)
+        keys = sorted(groups)
+    else:
+        raise ValueError(f'不支持的分组方式: {group_by}')
+    return [(key, sorted(groups[key], key=lambda r: (r.get('end_date') or '', r.get('name') or ''))) for key in keys]
+
+
+def paginate(groups, render_item, max_bytes, max_items=None):
+    """
+    把分组后的提醒项切成页，每页正文（不含页头）不超过 max_bytes 字节、max_items 条
+
+    :param render_item: 把一个提醒项渲染成一行文本的函数
+    :return: [[(组名, 是否续页, [行文本])]]
+    """
+    pages = []
+    current = []
+    size = 0
+    count = 0
+
+    for name, items in groups:
+        lines = None
+        for position, reminder in enumerate(items):
+            line = render_item(reminder)
+            line_size = len(line.encode('utf-8')) + 1
+            page_full = (max_items is not None and count >= max_items) or (count and size + line_size > max_bytes)
+            if page_full:
+                pages.append(current)
+                current, size, count = [], 0, 0
+                lines = None
+            if lines is None:
+                # 新的一页或新的一组：分组标题的长度按 100 字节预留；不是组内第一项说明是续页
+                lines = []
+                current.append((name, position > 0, lines))
+                size += 100
+            lines.append(line)
+            size += line_size
+            count += 1
+    if current:
+        pages.append(current)
+    return pages
+
+
+def _stage_suffix(reminder):
+    """带有通知阶段（见 notification_state.py）的提醒项在行尾标注阶段"""
+    stage = reminder.get('notice_stage')
+    return f' [{STAGE_LABELS[stage]}]' if stage in STAGE_LABELS else ''
+
+
+def _group_summary(groups, limit=SUMMARY_GROUP_LIMIT):
+    parts = [f'{name} {len(items)} 项' for name, items in groups[:limit]]
+    if len(groups) > limit:
+        parts.append(f'等 {len(groups)} 组')
+    return '，'.join(parts)
+
+
+def build_dingtalk_pages(reminders, group_by=DEFAULT_GROUP_BY, max_bytes=DINGTALK_MAX_BYTES):
+    """
+    生成钉钉 Markdown 消息的各页
+
+    :return: [{'title', 'text'}]，按发送顺序排列
+    """
+    groups = group_reminders(reminders, group_by)
+    pages = paginate(
+        groups,
+        lambda r: f"- **{r['name']}** (类型: {r['type']}, 到期日期: {r['end_date']}){_stage_suffix(r)}",
+        max_bytes - 500  # 页头
+    )
+    summary = _group_summary(groups)
+    result = []
+    for index, page in enumerate(pages, 1):
+        page_count = sum(len(lines) for _, _, lines in page)
+        title = DIGEST_TITLE if len(pages) == 1 else f'{DIGEST_TITLE} ({index}/{len(pages)})'
+        parts = [
+            f'### {title}',
+            '',
+            f'共 {len(reminders)} 项即将到期（{summary}），本页 {page_count} 项。',
+        ]
+        for name, continued, lines in page:
+            parts.append('')
+            parts.append(f"#### {name}{'（续）' if continued else ''}")
+            parts.append('')
+            parts.extend(lines)
+        parts.append('')
+        parts.append('请登录系统查看详情。')
+        result.append({'title': title, 'text': '\n'.join(parts)})
+    return result
+
+
+def build_email_pages(reminders, group_by=DEFAULT_GROUP_BY, max_items=EMAIL_MAX_ITEMS, max_bytes=EMAIL_MAX_BYTES):
+    """
+    生成提醒邮件的各页
+
+    :return: [{'subject', 'body'}]，按发送顺序排列
+    """
+    groups = group_reminders(reminders, group_by)
+    pages = paginate(
+        groups,
+        lambda r: f"- {r['name']} (类型: {r['type']}, 到期日期: {r['end_date']}){_stage_suffix(r)}",
+        max_bytes,
+        max_items
+    )
+    summary = _group_summary(groups)
+    result = []
+    for index, page in enumerate(pages, 1):
+        page_count = sum(len(lines) for _, _, lines in page)
+        subject = DIGEST_TITLE if len(pages) == 1 else f'{DIGEST_TITLE} ({index}/{len(pages)})'
+        parts = ['您好，', '']
+        if len(pages) > 1:
+            parts.append(f'本提醒共 {len(pages)} 封邮件，这是第 {index} 封。')
+        parts.append(f'以下证照即将到期，请及时处理（共 {len(reminders)} 项：{summary}；本封 {page_count} 项）：')
+        for name, continued, lines in page:
+            parts.append('')
+            parts.append(f"【{name}{'（续）' if continued else ''}】")
+            parts.extend(lines)
+        parts.extend(['', '请登录系统查看详情。', '', '谢谢！'])
+        result.append({'subject': subject, 'body': '\n'.join(parts)})
+    return result
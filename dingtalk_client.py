@@ -0,0 +1,255 @@
+# dingtalk_client.py
+"""
+钉钉机器人 Webhook 客户端
+
+- 基于 requests.Session 的长连接池，连续发送时不必每次重新握手；
+- 每个请求都有连接/读取超时；
+- 网络错误、5xx、429 以及钉钉的限流/系统繁忙错误码按指数退避重试；
+- 60 秒滑动窗口限速，默认与机器人每分钟 20 条的上限一致。消息先进入队列，
+  由后台线程按允许的速率发出：突发的多条消息排队等待，而不是被钉钉拒绝，
+  调用方也可以只提交不等待。每一次请求（包括重试）都占用窗口中的一个名额；
+  发送记录保存在 SQLite 中，同一个数据库上的所有进程（gunicorn 的多个 worker、
+  独立的提醒服务和发件箱服务）共享同一个窗口，限额对同一个机器人是全局的。
+"""
+
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from db import get_db
+
+# 机器人每分钟允许发送的消息数
+DEFAULT_RATE_PER_MINUTE = int(os.environ.get('REMINDER_DINGTALK_RATE_PER_MINUTE', '20'))
+
+# 限速窗口（秒）：钉钉按 60 秒计算，多留 1 秒抵消请求在路上的时间和时钟误差
+RATE_WINDOW_SECONDS = 61.0
+
+# (连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (5, 10)
+
+# 最多重试次数（不含第一次请求）和退避基数（秒）
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+# 队列中最多等待的消息数
+DEFAULT_MAX_QUEUE = 1000
+
+# 可重试的钉钉错误码：-1 系统繁忙，130101 发送太快被限流
+TRANSIENT_ERRCODES = {-1, 130101}
+
+# 可重试的 HTTP 状态码
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class DingTalkQueueFullError(Exception):
+    """待发送队列已满"""
+
+
+def sign_webhook_url(webhook_url, secret, timestamp=None):
+    """
+    为加签的机器人生成带 timestamp 和 sign 参数的 URL，没有密钥时原样返回
+
+    签名有效期只有一小时，每次请求（包括重试）都要重新计算。
+    """
+    if not secret:
+        return webhook_url
+    if timestamp is None:
+        timestamp = str(round(time.time() * 1000))
+    string_to_sign = '{}\n{}'.format(timestamp, secret)
+    hmac_code = hmac.new(secret.encode('utf-8'), string_to_sign.encode('utf-8'), digestmod=hashlib.sha256).digest()
+    sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
+    return f"{webhook_url}&timestamp={timestamp}&sign={sign}"
+
+
+def ensure_send_log_schema(cursor):
+    """创建限速使用的发送记录表（幂等）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dingtalk_send_log (
+            webhook TEXT NOT NULL,
+            sent_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_dingtalk_send_log ON dingtalk_send_log(webhook, sent_at)')
+
+
+class SlidingWindowLimiter:
+    """
+    滑动窗口限速器：同一个 key（机器人 Webhook）在任意 window 秒内最多 limit 次
+
+    与令牌桶不同，窗口开始时不会先放行一整桶再加上窗口内补充的令牌，
+    任何 60 秒内的请求数都不会超过 limit。记录保存在 SQLite 中，多个进程共享。
+
+    :param limit: 窗口内允许的次数
+    :param window: 窗口长度（秒）
+    """
+
+    def __init__(self, limit, window=RATE_WINDOW_SECONDS):
+        self.limit = limit
+        self.window = window
+        self._schema_ready = False
+
+    def _try_acquire(self, key):
+        """有名额时记录本次请求并返回 None，否则返回需要等待的秒数"""
+        now = time.time()
+        with get_db() as conn:
+            if not self._schema_ready:
+                ensure_send_log_schema(conn)
+                self._schema_ready = True
+            # 立即获取写锁，多个进程不会同时看到同一个空闲名额
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM dingtalk_send_log WHERE webhook = ? AND sent_at <= ?', (key, now - self.window))
+            count, oldest = conn.execute(
+                'SELECT COUNT(*), MIN(sent_at) FROM dingtalk_send_log WHERE webhook = ?', (key,)
+            ).fetchone()
+            if count < self.limit:
+                conn.execute('INSERT INTO dingtalk_send_log (webhook, sent_at) VALUES (?, ?)', (key, now))
+                return None
+        # 最早的一条移出窗口后才有名额
+        return max(oldest + self.window - now, 0.01)
+
+    def acquire(self, key):
+        """占用一个名额，窗口已满时睡眠到有名额为止；返回等待的秒数"""
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(key)
+            if wait is None:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+class DingTalkClient:
+    """
+    带连接池、重试和限速的钉钉机器人客户端
+
+    消息由后台线程按滑动窗口限速依次发出；submit() 立即返回 Future，
+    send() 在 submit() 的基础上等待结果。
+    """
+
+    def __init__(self, rate_per_minute=DEFAULT_RATE_PER_MINUTE, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF, max_queue=DEFAULT_MAX_QUEUE):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limiter = SlidingWindowLimiter(rate_per_minute)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats = {'sent': 0, 'failed': 0, 'retries': 0, 'throttled_seconds': 0.0}
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='dingtalk-sender', daemon=True)
+                self._worker.start()
+
+    def submit(self, webhook_url, secret, payload):
+        """
+        把消息放入发送队列，立即返回 Future，结果为 post() 的返回值
+
+        :raises DingTalkQueueFullError: 队列已满
+        """
+        future = concurrent.futures.Future()
+        try:
+            self._queue.put_nowait((webhook_url, secret, payload, future))
+        except queue.Full:
+            raise DingTalkQueueFullError(f'钉钉待发送队列已满 ({self._queue.maxsize})')
+        self._ensure_worker()
+        return future
+
+    def send(self, webhook_url, secret, payload, timeout=None):
+        """
+        发送消息并等待结果（排队 + 限速 + 重试）
+
+        :param timeout: 最长等待秒数，None 表示一直等待
+        :return: {'ok': bool, 'errcode', 'errmsg', 'attempts'}
+        """
+        return self.submit(webhook_url, secret, payload).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            webhook_url, secret, payload, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.post(webhook_url, secret, payload, rate_limited=True))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _throttle(self, webhook_url):
+        waited = self.limiter.acquire(webhook_url)
+        self._stats['throttled_seconds'] += waited
+
+    def post(self, webhook_url, secret, payload, rate_limited=False):
+        """
+        立即发送一条消息（不经过队列），对临时性错误按指数退避重试
+
+        :param rate_limited: 为 True 时每次请求（包括被 130101 限流后的重试）之前都先占用限速名额
+        :return: {'ok': bool, 'errcode', 'errmsg', 'attempts'}
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_reason = None
+            if rate_limited:
+                self._throttle(webhook_url)
+            result = None
+            try:
+                response = self.session.post(sign_webhook_url(webhook_url, secret), json=payload, timeout=self.timeout)
+                if response.status_code in TRANSIENT_STATUS_CODES:
+                    retry_reason = f'HTTP {response.status_code}'
+                else:
+                    response.raise_for_status()
+                    data = response.json()
+                    result = {
+                        'ok': data.get('errcode') == 0,
+                        'errcode': data.get('errcode'),
+                        'errmsg': data.get('errmsg'),
+                        'attempts': attempt,
+                    }
+                    if data.get('errcode') in TRANSIENT_ERRCODES:
+                        retry_reason = f"errcode {data.get('errcode')}: {data.get('errmsg')}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry_reason = str(e)
+                result = {'ok': False, 'errcode': None, 'errmsg': str(e), 'attempts': attempt}
+            except (requests.RequestException, ValueError) as e:
+                # 4xx、响应不是 JSON 等不可重试的错误
+                result = {'ok': False, 'errcode': None, 'errmsg': str(e), 'attempts': attempt}
+
+            if retry_reason is None or attempt > self.max_retries:
+                if result is None:
+                    result = {'ok': False, 'errcode': None, 'errmsg': retry_reason, 'attempts': attempt}
+                self._stats['sent' if result['ok'] else 'failed'] += 1
+                return result
+
+            # 指数退避并加一点随机抖动，避免多个进程同时重试
+            delay = self.backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.2)
+            self._stats['retries'] += 1
+            logging.warning(f"钉钉消息发送失败 ({retry_reason})，{delay:.1f} 秒后第 {attempt} 次重试")
+            time.sleep(delay)
+
+    def stats(self):
+        result = dict(self._stats)
+        result['queued'] = self._queue.qsize()
+        return result
+
+
+dingtalk_client = DingTalkClient()
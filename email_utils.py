@@ -1,34 +1,20 @@
-import smtplib
-import sqlite3
 import logging
 import traceback
-import ssl
-import requests
-import json
-import hmac
-import hashlib
-import base64
-import urllib.parse
-import time
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import datetime
 
-# 假设 DATABASE 和其他配置在主 app.py 中定义
-# 为了模块化，我们可以在这里重新定义或从环境变量/配置文件读取
-# 但为简单起见，我们假设 DATABASE 路径是已知的
-DATABASE = 'reminders.db'
+from notification_state import build_notice_record
+from reminder_engine import reminder_engine
+from settings_cache import settings_cache
+from notification_outbox import enqueue_notification, enqueue_routed_digests
+from digest import build_email_pages, build_dingtalk_pages
+
+# 发送邮件必需的配置项
+EMAIL_REQUIRED_KEYS = ['smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'recipient_email']
 
 def get_email_config():
-    """从数据库获取邮件配置"""
+    """获取邮件配置（来自与 app.py 共享的配置缓存）"""
     config = {}
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            for key in ['smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'recipient_email']:
-                cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-                row = cursor.fetchone()
-                config[key] = row[0] if row else ''
+        config = settings_cache.get_email_config()
     except Exception as e:
         logging.error(f"获取邮件配置时出错: {e}")
         print(f"获取邮件配置时出错: {e}")
@@ -36,226 +22,112 @@ def get_email_config():
 
 
 def get_dingtalk_config():
-    """从数据库获取钉钉配置"""
+    """获取钉钉配置（来自与 app.py 共享的配置缓存）"""
     config = {}
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            cursor = conn.cursor()
-            for key in ['dingtalk_webhook', 'dingtalk_secret']:
-                cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-                row = cursor.fetchone()
-                config[key] = row[0] if row else ''
+        config = settings_cache.get_dingtalk_config()
     except Exception as e:
         logging.error(f"获取钉钉配置时出错: {e}")
         print(f"获取钉钉配置时出错: {e}")
     return config
 
-def send_reminder_email(upcoming_reminders, config=None):
+def notify_upcoming_reminders(pending, evaluation):
     """
-    发送即将到期提醒邮件
-    :param upcoming_reminders: 即将到期的提醒项列表
-    :param config: (可选) 邮件配置字典。如果不提供，将从数据库获取。
+    把提醒写入各已配置通道的通知发件箱，由后台 worker 并发投递、失败重试，投递成功后记录通知状态
+
+    :param pending: {通道名: 需要通知的提醒项列表}，见 ReminderEvaluation.pending_notices
+    :param evaluation: 本次使用的评估结果，路由规则的定向汇总也从中筛选
+    :return: {通道名或 通道名:route路由ID: {'status': queued / duplicate / nothing / skipped / error,
+             ['count'], ['job_id'], ['error']}}；duplicate 表示相同内容当天已经入队过，不会重复发送
     """
-    if config is None:
-        config = get_email_config()
-        
+    builders = {}
+    if 'email' in pending:
+        if all(get_email_config().get(key) for key in EMAIL_REQUIRED_KEYS):
+            builders['email'] = build_email_pages
+    if 'dingtalk' in pending:
+        if get_dingtalk_config().get('dingtalk_webhook'):
+            builders['dingtalk'] = build_dingtalk_pages
+
+    report = {}
+    for name, reminders in pending.items():
+        if name not in builders:
+            report[name] = {'status': 'skipped'}
+            continue
+        if not reminders:
+            report[name] = {'status': 'nothing', 'count': 0}
+            continue
+        try:
+            # 通知状态随任务入队，投递成功后才写入（见 notification_state.record_delivered_notices）
+            job_id, created = enqueue_notification(name, {
+                'pages': builders[name](reminders),
+                'notices': build_notice_record(name, reminders, evaluation.today),
+            })
+            report[name] = {'status': 'queued' if created else 'duplicate', 'count': len(reminders), 'job_id': job_id}
+        except Exception as e:
+            logging.error(f"通知通道 {name} 入队失败: {e}")
+            report[name] = {'status': 'error', 'error': str(e)}
+
+    # 按路由规则生成的定向汇总（与默认通道共用同一次评估）
     try:
-        # 1. 验证配置是否完整
-        required_keys = ['smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'recipient_email']
-        if not all(config.get(key) for key in required_keys):
-            msg = "警告: 邮件配置不完整，无法发送邮件。"
-            print(msg)
-            logging.warning(msg)
-            return False # 表示未发送
-
-        # 2. 准备邮件内容
-        subject = "证照即将到期提醒"
-        body = """您好，
-
-以下证照即将到期，请及时处理：
-
-
-"""
-        for reminder in upcoming_reminders:
-            body += f"- {reminder['name']} (类型: {reminder['type']}, 到期日期: {reminder['end_date']})\n"
-        body += """
-
-
-请登录系统查看详情。
-
-
-谢谢！"""
+        for route_id, result in enqueue_routed_digests(tuple(pending), evaluation).items():
+            report[f"{result['channel']}:route{route_id}"] = result
+    except Exception as e:
+        logging.error(f"路由定向提醒入队失败: {e}")
+        report['routes'] = {'status': 'error', 'error': str(e)}
+    return report
 
-        # 3. 创建 MIMEText 对象
-        message = MIMEMultipart()
-        message["From"] = config['sender_email']
-        message["To"] = config['recipient_email']
-        message["Subject"] = subject
-        message.attach(MIMEText(body, "plain", 'utf-8')) # 指定编码
 
-        # 4. 连接 SMTP 服务器并发送邮件
-        # 将端口号转换为整数
-        port = int(config['smtp_port'])
-        # 创建安全的 SSL 上下文
-        context = ssl.create_default_context()
+def check_and_notify(channels, evaluation=None):
+    """
+    检查即将到期的项目并把提醒加入这些通道的发送队列
 
-        # 根据端口号选择连接方式
-        if port == 465:
-            # 使用 SMTP_SSL 连接（适用于端口 465）
-            with smtplib.SMTP_SSL(config['smtp_server'], port, context=context) as server:
-                server.login(config['sender_email'], config['sender_password'])
-                text = message.as_string()
-                server.sendmail(config['sender_email'], config['recipient_email'], text)
-        else:
-            # 使用普通 SMTP 连接并启动 TLS（适用于端口 587 等）
-            with smtplib.SMTP(config['smtp_server'], port) as server:
-                server.starttls(context=context) # 启用 TLS 加密
-                server.login(config['sender_email'], config['sender_password'])
-                text = message.as_string()
-                server.sendmail(config['sender_email'], config['recipient_email'], text)
+    Web 应用的调度任务和 API、send_reminders.py、reminder_service.py 都通过这里发送提醒，
+    到期项目来自 reminder_engine 当天的评估结果（没有写入时不重新查询提醒表）。
 
-        msg = f"邮件已成功发送至 {config['recipient_email']}"
-        print(msg)
-        logging.info(msg)
-        return True # 表示发送成功
-
-    except Exception as e:
-        msg = f"发送邮件时发生错误: {e}"
-        print(msg)
-        logging.error(msg)
-        traceback.print_exc() # 打印堆栈跟踪，便于调试
-        return False # 表示发送失败
+    :param channels: 通道名元组，例如 ('email', 'dingtalk')
+    :param evaluation: 可选，调用方已获取的评估结果
+    :return: 本次在至少一个通道上发送了提醒的项目列表
+    """
+    return check_and_notify_with_report(channels, evaluation)[0]
 
 
-def send_dingtalk_message(upcoming_reminders, config=None):
+def check_and_notify_with_report(channels, evaluation=None, before_enqueue=None):
     """
-    发送即将到期提醒到钉钉
-    :param upcoming_reminders: 即将到期的提醒项列表
-    :param config: (可选) 钉钉配置字典。如果不提供，将从数据库获取。
+    同 check_and_notify，同时返回各通道的入队结果，调用方可以据此判断检查是否失败
+
+    :param before_enqueue: 可选，选出需要通知的项目之后、写入发件箱之前调用的无参函数
+                           （例如后台任务的取消检查），抛出异常时不入队
+    :return: (发送了提醒的项目列表, notify_upcoming_reminders() 的结果)
     """
-    if config is None:
-        config = get_dingtalk_config()
-    
-    print(f"获取到的钉钉配置: {config}")  # 添加调试信息
-    
-    webhook_url = config.get('dingtalk_webhook')
-    secret = config.get('dingtalk_secret')
-    
-    if not webhook_url:
-        msg = "警告: 钉钉Webhook URL未配置，无法发送消息。"
-        print(msg)
-        logging.warning(msg)
-        return False
-    
-    print(f"Webhook URL: {webhook_url}")  # 添加调试信息
-    print(f"Secret: {'*' * len(secret) if secret else 'None'}")  # 添加调试信息（隐藏密钥）
-    
-    try:
-        # 1. 准备消息内容
-        reminder_text = ""
-        for reminder in upcoming_reminders:
-            reminder_text += f"- {reminder['name']} (类型: {reminder['type']}, 到期日期: {reminder['end_date']})\n"
-        
-        # 2. 构造钉钉消息
-        message_data = {
-            "msgtype": "markdown",
-            "markdown": {
-                "title": "证照即将到期提醒",
-                "text": f"## 证照即将到期提醒\n\n以下证照即将到期，请及时处理：\n\n{reminder_text}\n\n请登录系统查看详情。"
-            }
-        }
-        
-        print(f"发送的消息内容: {json.dumps(message_data, ensure_ascii=False, indent=2)}")  # 添加调试信息
-        
-        # 3. 处理签名
-        if secret:
-            timestamp = str(round(time.time() * 1000))
-            secret_enc = secret.encode('utf-8')
-            string_to_sign = '{}{}{}'.format(timestamp, '\n', secret)
-            string_to_sign_enc = string_to_sign.encode('utf-8')
-            hmac_code = hmac.new(secret_enc, string_to_sign_enc, digestmod=hashlib.sha256).digest()
-            sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
-            webhook_with_sign = f"{webhook_url}&timestamp={timestamp}&sign={sign}"
-        else:
-            webhook_with_sign = webhook_url
-            
-        print(f"最终的Webhook URL: {webhook_with_sign}")  # 添加调试信息
-        
-        # 4. 发送请求
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(webhook_with_sign, data=json.dumps(message_data), headers=headers)
-        print(f"钉钉API响应状态码: {response.status_code}")  # 添加调试信息
-        print(f"钉钉API响应内容: {response.text}")  # 添加调试信息
-        result = response.json()
-        
-        if result.get('errcode') == 0:
-            msg = "钉钉消息发送成功"
-            print(msg)
-            logging.info(msg)
-            return True
-        else:
-            msg = f"钉钉消息发送失败: {result.get('errmsg')}"
-            print(msg)
-            logging.error(msg)
-            return False
-            
-    except Exception as e:
-        msg = f"发送钉钉消息时发生错误: {e}"
-        print(msg)
-        logging.error(msg)
-        traceback.print_exc()
-        return False
+    if evaluation is None:
+        evaluation = reminder_engine.evaluate()
+    print(f"开始检查需要发送提醒的项目，今天的日期: {evaluation.today}")
+    pending = evaluation.pending_notices(channels)
+    noticed = {}
+    for reminders in pending.values():
+        noticed.update((reminder['id'], reminder) for reminder in reminders)
+    if noticed:
+        print(f"发现 {len(noticed)} 个需要发送提醒的即将到期项目。")
+    else:
+        print("当前没有需要发送新提醒的项目。")
+    if before_enqueue is not None:
+        before_enqueue()
+
+    # 写入通知发件箱，由后台 worker 并发投递；路由规则即使默认通道没有新项目也要检查
+    report = notify_upcoming_reminders(pending, evaluation)
+    for name, result in report.items():
+        print(f"通道 {name}: {result['status']}")
+    return list(noticed.values()), report
+
 
 def check_upcoming_reminders_for_email():
     """
-    检查即将到期的项目 (供独立脚本或定时任务调用)
+    检查即将到期的项目并把提醒加入所有已配置通道的发送队列 (供独立脚本或定时任务调用)
+
+    :return: 本次在至少一个通道上发送了提醒的项目列表
     """
     try:
-        with sqlite3.connect(DATABASE) as conn:
-            conn.row_factory = sqlite3.Row # 使行可以通过列名访问
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM reminders ORDER BY actual_reminder_date')
-            rows = cursor.fetchall()
-
-        reminders = [dict(row) for row in rows] # 转换为字典列表
-
-        today = datetime.date.today()
-        upcoming_reminders = []
-
-        for reminder in reminders:
-            # 将日期字符串转换为 date 对象进行比较
-            try:
-                actual_reminder_date = datetime.datetime.strptime(reminder['actual_reminder_date'], "%Y-%m-%d").date()
-                end_date = datetime.datetime.strptime(reminder['end_date'], "%Y-%m-%d").date()
-
-                # 检查实际提醒日期是否已到（<= 今天） 且 未过期 (结束日期 >= 今天)
-                if actual_reminder_date <= today and end_date >= today:
-                    upcoming_reminders.append(reminder)
-            except (ValueError, TypeError) as e:
-                msg = f"警告: 处理提醒项 ID {reminder.get('id', 'unknown')} 的日期时出错: {e}"
-                print(msg)
-                logging.warning(msg)
-
-        if upcoming_reminders:
-            print(f"发现 {len(upcoming_reminders)} 个即将到期的项目。")
-            # 发送邮件通知
-            email_success = send_reminder_email(upcoming_reminders)
-            if email_success:
-                print("已发送提醒邮件。")
-            else:
-                print("提醒邮件发送失败。")
-            
-            # 发送钉钉通知
-            dingtalk_success = send_dingtalk_message(upcoming_reminders)
-            if dingtalk_success:
-                print("已发送钉钉提醒。")
-            else:
-                print("钉钉提醒发送失败。")
-                
-            return upcoming_reminders # 返回即将到期的列表
-        else:
-            print("当前没有即将到期的项目。")
-            return []
+        return check_and_notify(('email', 'dingtalk'))
     except Exception as e:
         msg = f"检查即将到期项目时发生错误: {e}"
         print(msg)
@@ -266,57 +138,15 @@ def check_upcoming_reminders_for_email():
 
 def check_upcoming_reminders_for_dingtalk():
     """
-    检查即将到期的项目并发送钉钉消息 (供后端定时任务或 API 调用)
+    检查即将到期的项目并把钉钉消息加入发送队列 (供后端定时任务或 API 调用)
+
+    :return: 本次发送了钉钉提醒的项目列表
     """
     try:
-        print("开始从数据库获取提醒项")
-        with sqlite3.connect(DATABASE) as conn:
-            conn.row_factory = sqlite3.Row # 使行可以通过列名访问
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM reminders ORDER BY actual_reminder_date')
-            rows = cursor.fetchall()
-
-        reminders = [dict(row) for row in rows] # 转换为字典列表
-        print(f"从数据库获取到 {len(reminders)} 个提醒项")
-
-        today = datetime.date.today()
-        upcoming_reminders = []
-        print(f"今天的日期: {today}")
-
-        for reminder in reminders:
-            # 将日期字符串转换为 date 对象进行比较
-            try:
-                actual_reminder_date = datetime.datetime.strptime(reminder['actual_reminder_date'], "%Y-%m-%d").date()
-                end_date = datetime.datetime.strptime(reminder['end_date'], "%Y-%m-%d").date()
-                print(f"提醒项 {reminder['name']}: 实际提醒日期={actual_reminder_date}, 结束日期={end_date}")
-
-                # 检查实际提醒日期是否已到（<= 今天） 且 未过期 (结束日期 >= 今天)
-                if actual_reminder_date <= today and end_date >= today:
-                    upcoming_reminders.append(reminder)
-                    print(f"提醒项 {reminder['name']} 即将到期")
-            except (ValueError, TypeError) as e:
-                msg = f"警告: 处理提醒项 ID {reminder.get('id', 'unknown')} 的日期时出错: {e}"
-                print(msg)
-                logging.warning(msg)
-
-        if upcoming_reminders:
-            print(f"发现 {len(upcoming_reminders)} 个即将到期的项目。")
-            # 发送钉钉通知
-            print("开始发送钉钉消息")
-            dingtalk_success = send_dingtalk_message(upcoming_reminders)
-            print(f"钉钉消息发送结果: {dingtalk_success}")
-            if dingtalk_success:
-                print("已发送钉钉提醒。")
-            else:
-                print("钉钉提醒发送失败。")
-                
-            return upcoming_reminders # 返回即将到期的列表
-        else:
-            print("当前没有即将到期的项目。")
-            return []
+        return check_and_notify(('dingtalk',))
     except Exception as e:
         msg = f"检查即将到期项目时发生错误: {e}"
         print(msg)
         logging.error(msg)
         traceback.print_exc()
-        return []
\ No newline at end of file
+        return []
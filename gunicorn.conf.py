@@ -0,0 +1,41 @@
+# gunicorn.conf.py
+"""
+生产环境启动配置：gunicorn -c gunicorn.conf.py app:app
+
+多个 worker 进程、每个进程多个线程处理请求。SSE 实时更新连接会一直占用一个线程，
+因此每个进程的实时更新连接数限制为线程数的四分之一（REMINDER_SSE_MAX_SUBSCRIBERS），
+其余线程始终留给 API 请求；超过上限的页面收到 503 后退避重连，列表仍可手动刷新。
+每个 worker 启动后参与调度器选举，只有获得租约的一个进程运行每天的提醒和自动续期任务。
+"""
+import os
+
+bind = os.environ.get('REMINDER_BIND', '0.0.0.0:5009')
+
+# SQLite 同一时刻只有一个写入者，进程数不宜过多
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+threads = int(os.environ.get('REMINDER_THREADS', '16'))
+
+# worker 在 fork 后导入应用，继承这里设置的环境变量
+os.environ.setdefault('REMINDER_SSE_MAX_SUBSCRIBERS', str(max(1, threads // 4)))
+
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('REMINDER_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    """worker 加载应用后启动后台服务（发件箱 worker、调度器选举）"""
+    from run_app import start_background_services
+    worker.reminder_lease = start_background_services()
+
+
+def worker_exit(server, worker):
+    """worker 退出时释放调度器租约，其他 worker 不必等到租约过期即可接替"""
+    lease = getattr(worker, 'reminder_lease', None)
+    if lease is not None:
+        lease.stop()
@@ -0,0 +1,346 @@
+# job_runner.py
+"""
+后台任务
+
+耗时的操作（检查并发送提醒、CSV 导入、CSV 导出）不再占用 HTTP 请求线程：
+接口把任务写入 jobs 表后立即返回任务 ID，任务在本进程的线程池中执行，
+前端通过 GET /api/jobs/<id> 轮询状态、进度和结果。
+
+- 状态、进度和结果保存在数据库中，多进程部署时轮询请求落到任何一个进程都能查到；
+- 每种任务类型有自己的线程池，限制同类任务的并发数（例如同一时刻只运行一个导入）；
+- 取消：排队中的任务直接标记为 cancelled；运行中的任务设置 cancel_requested，
+  任务函数在安全点（例如每个批次之间）调用 ctx.check_cancelled() 后停止；
+- 租约：任务记录提交它的进程（owner），该进程每隔 HEARTBEAT_INTERVAL 秒刷新
+  排队中和运行中任务的 heartbeat_at。进程重启或崩溃后心跳停止，超过 STALE_AFTER 秒
+  的任务由任一进程（启动时和心跳线程中）标记为 failed，并调用该类型的 on_abandoned
+  清理关联资源（例如导入的临时上传文件）。
+"""
+
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from db import get_db
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# 运行中的任务最多每隔这么多秒读一次取消标记
+CANCEL_CHECK_INTERVAL = 1.0
+
+# 已结束的任务保留的天数
+JOB_RETENTION_DAYS = int(os.environ.get('REMINDER_JOB_RETENTION_DAYS', '7'))
+
+# 心跳间隔（秒）；心跳超过 STALE_AFTER 秒未刷新的排队中/运行中任务视为已中断
+HEARTBEAT_INTERVAL = float(os.environ.get('REMINDER_JOB_HEARTBEAT_INTERVAL', '10'))
+STALE_AFTER = float(os.environ.get('REMINDER_JOB_STALE_AFTER', '60'))
+
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+
+class UnknownJobTypeError(Exception):
+    """未注册的任务类型"""
+
+
+def ensure_jobs_schema(cursor):
+    """创建任务表和索引（幂等）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            params TEXT,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            owner TEXT,
+            heartbeat_at REAL
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(jobs)")
+    column_names = [column[1] for column in cursor.fetchall()]
+    if 'owner' not in column_names:
+        # 旧版本创建的任务表没有租约字段，心跳为空的未结束任务会被当作已中断
+        cursor.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        cursor.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)')
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def _row_to_job(row):
+    job = dict(row)
+    for field in ('params', 'progress', 'result'):
+        job[field] = json.loads(job[field]) if job[field] else None
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    return job
+
+
+def get_job(job_id):
+    """按 ID 查询任务，不存在时返回 None"""
+    with get_db() as conn:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def list_jobs(job_type=None, status=None, limit=50):
+    """按创建时间倒序列出任务（不含参数和结果）"""
+    sql = ('SELECT id, type, status, progress, error, cancel_requested, created_at, started_at, finished_at, '
+           'owner, heartbeat_at FROM jobs')
+    conditions, params = [], []
+    if job_type:
+        conditions.append('type = ?')
+        params.append(job_type)
+    if status:
+        conditions.append('status = ?')
+        params.append(status)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY created_at DESC, rowid DESC LIMIT ?'
+    params.append(limit)
+    with get_db() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    jobs = []
+    for row in rows:
+        job = dict(row)
+        job['progress'] = json.loads(job['progress']) if job['progress'] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        jobs.append(job)
+    return jobs
+
+
+class JobContext:
+    """传给任务函数的上下文：参数、进度上报和取消检查"""
+
+    def __init__(self, job_id, job_type, params):
+        self.id = job_id
+        self.type = job_type
+        self.params = params
+        self._last_cancel_check = 0.0
+
+    def set_progress(self, progress):
+        """保存进度（JSON 可序列化的字典）"""
+        with get_db() as conn:
+            conn.execute(
+                'UPDATE jobs SET progress = ? WHERE id = ?',
+                (json.dumps(progress, ensure_ascii=False), self.id)
+            )
+
+    def check_cancelled(self):
+        """
+        已请求取消时抛出 JobCancelled；读数据库有节流，可以在循环中频繁调用
+
+        :raises JobCancelled: 任务已被请求取消
+        """
+        now = time.monotonic()
+        if now - self._last_cancel_check < CANCEL_CHECK_INTERVAL:
+            return
+        self._last_cancel_check = now
+        with get_db() as conn:
+            row = conn.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (self.id,)).fetchone()
+        if row is None or row[0]:
+            raise JobCancelled('任务已取消')
+
+
+class JobRunner:
+    """按任务类型分线程池执行后台任务"""
+
+    def __init__(self):
+        self._handlers = {}
+        self._abandoned_handlers = {}
+        self._executors = {}
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+        self._owner = None
+
+    @property
+    def owner(self):
+        """本进程的租约标识（主机名:进程号:随机后缀），fork 出的子进程会得到新的标识"""
+        if self._owner is None or self._owner[0] != os.getpid():
+            self._owner = (os.getpid(), f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}')
+        return self._owner[1]
+
+    def register(self, job_type, handler, max_concurrency=1, on_abandoned=None):
+        """
+        注册任务类型
+
+        :param handler: 任务函数 handler(ctx: JobContext)，返回值（JSON 可序列化）作为任务结果
+        :param max_concurrency: 同类任务同时运行的最大数量，多出的任务排队等待
+        :param on_abandoned: 任务因进程退出而中断时的清理函数 on_abandoned(job_id, params)
+        """
+        self._handlers[job_type] = (handler, max_concurrency)
+        if on_abandoned is not None:
+            self._abandoned_handlers[job_type] = on_abandoned
+
+    def _executor(self, job_type):
+        with self._lock:
+            executor = self._executors.get(job_type)
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._handlers[job_type][1], thread_name_prefix=f'job-{job_type}'
+                )
+                self._executors[job_type] = executor
+            return executor
+
+    def submit(self, job_type, params=None):
+        """
+        创建任务并提交到对应的线程池，立即返回任务 ID
+
+        :raises UnknownJobTypeError: 任务类型未注册
+        """
+        if job_type not in self._handlers:
+            raise UnknownJobTypeError(f'未知的任务类型: {job_type}')
+        job_id = uuid.uuid4().hex
+        with get_db() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, type, status, params, created_at, owner, heartbeat_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, job_type, 'queued', json.dumps(params or {}, ensure_ascii=False), _now(),
+                 self.owner, time.time())
+            )
+        self._ensure_heartbeat()
+        self._executor(job_type).submit(self._run, job_id, job_type, params or {})
+        logging.info(f"后台任务 {job_type} {job_id} 已提交")
+        return job_id
+
+    def _run(self, job_id, job_type, params):
+        handler = self._handlers[job_type][0]
+        with get_db() as conn:
+            # 排队期间被取消的任务不再执行
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                (_now(), job_id)
+            )
+            if cursor.rowcount == 0:
+                return
+
+        status, result, error = 'succeeded', None, None
+        try:
+            result = handler(JobContext(job_id, job_type, params))
+        except JobCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            status, error = 'failed', str(e)
+            logging.error(f"后台任务 {job_type} {job_id} 失败: {e}")
+            traceback.print_exc()
+
+        with get_db() as conn:
+            # 已被当作中断任务标记为 failed 时不再覆盖
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, _now(), job_id)
+            )
+        logging.info(f"后台任务 {job_type} {job_id} 结束: {status}")
+
+    # --- 租约 ---
+
+    def _ensure_heartbeat(self):
+        """第一次提交任务时启动心跳线程（在 fork 出的 worker 中启动，不在主进程中）"""
+        with self._lock:
+            if self._heartbeat_thread is not None and self._heartbeat_thread.is_alive():
+                return
+            self._heartbeat_thread = threading.Thread(
+                target=self._heartbeat_loop, name='job-heartbeat', daemon=True
+            )
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self.heartbeat()
+                self.recover_stale()
+            except Exception as e:
+                logging.error(f"刷新后台任务心跳失败: {e}")
+
+    def heartbeat(self):
+        """刷新本进程所有排队中和运行中任务的心跳"""
+        with get_db() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('queued', 'running')",
+                (time.time(), self.owner)
+            )
+
+    def recover_stale(self, stale_after=STALE_AFTER):
+        """
+        把心跳超时的排队中/运行中任务标记为 failed，并调用对应类型的 on_abandoned 清理资源
+
+        :return: 被标记的任务列表（id、type、params）
+        """
+        cutoff = time.time() - stale_after
+        recovered = []
+        with get_db() as conn:
+            rows = conn.execute(
+                "SELECT id, type, params FROM jobs WHERE status IN ('queued', 'running') "
+                "AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (cutoff,)
+            ).fetchall()
+            for row in rows:
+                # 条件中再检查一次心跳，避免和刚刚刷新心跳的进程竞争
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                    "WHERE id = ? AND status IN ('queued', 'running') AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                    ('执行任务的进程已退出，任务中断', _now(), row['id'], cutoff)
+                )
+                if cursor.rowcount:
+                    recovered.append({
+                        'id': row['id'], 'type': row['type'],
+                        'params': json.loads(row['params']) if row['params'] else {},
+                    })
+        for job in recovered:
+            logging.warning(f"后台任务 {job['type']} {job['id']} 的进程已退出，已标记为失败")
+            on_abandoned = self._abandoned_handlers.get(job['type'])
+            if on_abandoned is not None:
+                try:
+                    on_abandoned(job['id'], job['params'])
+                except Exception as e:
+                    logging.error(f"清理中断的后台任务 {job['id']} 失败: {e}")
+        return recovered
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的直接取消，运行中的设置取消标记
+
+        :return: 取消后的任务，不存在时返回 None
+        """
+        with get_db() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (_now(), job_id)
+            )
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return get_job(job_id)
+
+    def purge_finished(self, days=JOB_RETENTION_DAYS):
+        """删除 days 天前结束的任务，返回删除的任务列表（id、type、result），供调用方清理关联文件"""
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat(timespec='seconds')
+        placeholders = ','.join('?' * len(FINISHED_STATUSES))
+        with get_db() as conn:
+            rows = conn.execute(
+                f'SELECT id, type, result FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?',
+                (*FINISHED_STATUSES, cutoff)
+            ).fetchall()
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(row['id'],) for row in rows])
+        return [
+            {'id': row['id'], 'type': row['type'], 'result': json.loads(row['result']) if row['result'] else None}
+            for row in rows
+        ]
+
+
+job_runner = JobRunner()
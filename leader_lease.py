@@ -0,0 +1,116 @@
+# leader_lease.py
+"""
+基于 SQLite 租约的主进程选举
+
+多进程部署（gunicorn 多个 worker）时，每个进程都会加载应用，但定时任务
+（到期提醒、自动续期）只能由一个进程执行，否则每天 09:00 会发出多份通知。
+
+每个进程定期尝试获取 leader_leases 表中的同一行租约：租约不存在、已过期
+或本来就属于自己时写入自己的标识和新的过期时间。持有者每隔 renew_interval
+秒续租一次；持有者崩溃后租约在 ttl 秒内过期，由其他进程接替。
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from db import get_db
+
+# 租约有效期和续租间隔（秒），续租间隔应明显小于有效期
+DEFAULT_TTL = float(os.environ.get('REMINDER_LEADER_TTL', '30'))
+DEFAULT_RENEW_INTERVAL = float(os.environ.get('REMINDER_LEADER_RENEW_INTERVAL', '10'))
+
+
+def ensure_leader_lease_schema(cursor):
+    """创建租约表（幂等）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leader_leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+
+class LeaderLease:
+    """
+    一个具名租约
+
+    :param name: 租约名，同名租约同一时刻只有一个持有者
+    :param ttl: 租约有效期（秒）
+    :param renew_interval: 续租/重试间隔（秒）
+    """
+
+    def __init__(self, name, ttl=DEFAULT_TTL, renew_interval=DEFAULT_RENEW_INTERVAL):
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.holder = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def try_acquire(self):
+        """获取或续租，返回当前进程是否持有租约"""
+        now = time.time()
+        with get_db() as conn:
+            ensure_leader_lease_schema(conn)
+            # 立即获取写锁，两个进程不会同时判断租约已过期
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT holder, expires_at FROM leader_leases WHERE name = ?', (self.name,)
+            ).fetchone()
+            if row is not None and row['holder'] != self.holder and row['expires_at'] > now:
+                return False
+            conn.execute('''
+                INSERT INTO leader_leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            ''', (self.name, self.holder, now + self.ttl))
+            return True
+
+    def release(self):
+        """主动释放租约（进程正常退出时），其他进程不必等到过期"""
+        with get_db() as conn:
+            conn.execute('DELETE FROM leader_leases WHERE name = ? AND holder = ?', (self.name, self.holder))
+        self.is_leader = False
+
+    def run(self, on_elected, on_lost=None):
+        """
+        循环获取/续租（阻塞），成为持有者时调用 on_elected()，失去租约时调用 on_lost()
+        """
+        while not self._stop.is_set():
+            try:
+                acquired = self.try_acquire()
+            except Exception as e:
+                # 数据库暂时不可用时不能确定自己仍是持有者
+                logging.error(f"租约 {self.name} 续租失败: {e}")
+                acquired = False
+            if acquired and not self.is_leader:
+                self.is_leader = True
+                logging.info(f"进程 {self.holder} 获得租约 {self.name}")
+                on_elected()
+            elif not acquired and self.is_leader:
+                self.is_leader = False
+                logging.warning(f"进程 {self.holder} 失去租约 {self.name}")
+                if on_lost:
+                    on_lost()
+            self._stop.wait(self.renew_interval)
+
+    def start(self, on_elected, on_lost=None):
+        """在后台线程中运行选举"""
+        self._thread = threading.Thread(
+            target=self.run, args=(on_elected, on_lost), name=f'lease-{self.name}', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止续租并释放租约"""
+        self._stop.set()
+        if self.is_leader:
+            try:
+                self.release()
+            except Exception as e:
+                logging.error(f"释放租约 {self.name} 失败: {e}")
@@ -0,0 +1,109 @@
+# notification_dispatcher.py
+"""
+通知并发分发
+
+把同一批提醒同时交给所有已配置的通道（邮件、钉钉……）发送，每个通道在
+线程池中独立运行并有自己的超时时间。总耗时取决于最慢的通道而不是各通道之和，
+一个通道卡住或报错不会影响其他通道。结果汇总为一份报告。
+
+通道数多于空闲线程时，后面的通道在线程池中排队；超时从通道真正开始执行时计算，
+排队等待的时间不计入，不会在开始之前就被判为超时。
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+# 各通道的默认超时（秒），可以通过环境变量调整
+DEFAULT_CHANNEL_TIMEOUTS = {
+    'email': float(os.environ.get('REMINDER_EMAIL_TIMEOUT', '60')),
+    'dingtalk': float(os.environ.get('REMINDER_DINGTALK_TIMEOUT', '30')),
+}
+
+# 未在 DEFAULT_CHANNEL_TIMEOUTS 中列出的通道使用的超时
+FALLBACK_CHANNEL_TIMEOUT = 60
+
+# 分发线程数：每个通道一个线程即可，留一些余量给超时后仍在运行的任务
+MAX_WORKERS = int(os.environ.get('REMINDER_NOTIFY_WORKERS', '8'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS, thread_name_prefix='notify'
+                )
+    return _executor
+
+
+# 等待排队中的通道开始执行时，检查任务是否已结束的间隔（秒）
+START_POLL_INTERVAL = 0.5
+
+
+class _ChannelRun:
+    """一个通道在线程池中的执行：记录真正开始执行的时间"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.started_at = None
+
+
+def _run_channel(name, send, run):
+    started = time.monotonic()
+    run.started_at = started
+    run.started.set()
+    try:
+        ok = send()
+        return {'status': 'sent' if ok else 'failed', 'elapsed': time.monotonic() - started}
+    except Exception as e:
+        logging.error(f"通知通道 {name} 发送时发生错误: {e}")
+        return {'status': 'error', 'error': str(e), 'elapsed': time.monotonic() - started}
+
+
+def dispatch(channels, timeouts=None):
+    """
+    并发执行各通道的发送函数
+
+    :param channels: {通道名: 无参发送函数}，发送函数返回 True 表示成功
+    :param timeouts: 可选，{通道名: 超时秒数}，覆盖默认超时；从通道开始执行时计算
+    :return: 报告 {'channels': {通道名: {'status', 'elapsed', ['error']}}, 'elapsed', 'success'}
+             status 为 sent / failed / error / timeout；success 表示所有通道都已发送
+    """
+    timeouts = dict(DEFAULT_CHANNEL_TIMEOUTS, **(timeouts or {}))
+    started = time.monotonic()
+    executor = _get_executor()
+    runs = {name: _ChannelRun() for name in channels}
+    futures = {name: executor.submit(_run_channel, name, send, runs[name]) for name, send in channels.items()}
+
+    results = {}
+    for name, future in futures.items():
+        run = runs[name]
+        # 还在排队等待空闲线程的通道不计时，开始执行后才按各自的超时计算截止时间
+        while not run.started.wait(START_POLL_INTERVAL) and not future.done():
+            pass
+        channel_started = run.started_at if run.started_at is not None else time.monotonic()
+        deadline = channel_started + timeouts.get(name, FALLBACK_CHANNEL_TIMEOUT)
+        try:
+            results[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except concurrent.futures.TimeoutError:
+            # 线程无法被强制终止，任务会在后台继续运行直到底层 I/O 超时
+            logging.warning(f"通知通道 {name} 超过 {timeouts.get(name, FALLBACK_CHANNEL_TIMEOUT)} 秒未完成")
+            results[name] = {'status': 'timeout', 'elapsed': time.monotonic() - channel_started}
+
+    for result in results.values():
+        result['elapsed'] = round(result['elapsed'], 3)
+    report = {
+        'channels': results,
+        'elapsed': round(time.monotonic() - started, 3),
+        'success': bool(results) and all(result['status'] == 'sent' for result in results.values()),
+    }
+    summary = ', '.join(f"{name}={result['status']}" for name, result in results.items())
+    logging.info(f"通知分发完成 ({summary})，用时 {report['elapsed']}s")
+    return report
@@ -0,0 +1,468 @@
+# notification_outbox.py
+"""
+持久化的通知发件箱
+
+检查函数不再直接发送通知，而是把要发送的内容写入 notification_outbox 表；
+后台 worker 领取任务、投递、记录结果，失败时按指数退避重试。
+
+- 幂等键：同一内容（同一天、同一通道、同一批提醒项）只会入队一次，
+  重复执行检查不会重复发送；
+- 租约：worker 领取任务时写入 claimed_until，进程崩溃后租约过期，
+  任务会被其他 worker 重新领取（至少投递一次）；
+- 通道的配置（SMTP 账号、钉钉密钥）在投递时从配置缓存读取，不写入发件箱。
+
+worker 可以在 Web 进程或提醒服务进程中以后台线程运行（默认，入队时自动启动），
+也可以设置 REMINDER_OUTBOX_WORKER=external 后用 outbox_service.py 作为独立进程运行。
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from db import get_db
+from settings_cache import settings_cache
+from notification_dispatcher import dispatch, DEFAULT_CHANNEL_TIMEOUTS, MAX_WORKERS
+from smtp_pool import smtp_sender, parse_recipients
+from dingtalk_client import dingtalk_client
+from digest import build_email_pages, build_dingtalk_pages
+from notification_routes import ensure_routes_schema, get_route, route_state_target
+from reminder_engine import reminder_engine
+from notification_state import ensure_notification_state_schema, build_notice_record, record_delivered_notices
+
+# 最多投递次数，超过后标记为 failed
+MAX_ATTEMPTS = int(os.environ.get('REMINDER_OUTBOX_MAX_ATTEMPTS', '6'))
+
+# 重试退避：第 n 次失败后等待 RETRY_BACKOFF * 2^(n-1) 秒，最长 MAX_RETRY_DELAY 秒
+RETRY_BACKOFF = 60
+MAX_RETRY_DELAY = 3600
+
+# 领取任务的租约时长（秒），应大于单页的最长投递时间；分页任务每发出一页续租一次
+LEASE_SECONDS = 300
+
+# 每次领取的任务数：不超过分发线程数，领取的任务都能立即开始投递，
+# 不会在线程池中排队时消耗租约
+CLAIM_BATCH_SIZE = MAX_WORKERS
+
+# 没有待投递任务时的最长休眠时间（秒）
+POLL_INTERVAL = float(os.environ.get('REMINDER_OUTBOX_POLL_INTERVAL', '30'))
+
+# 为 external 时不在当前进程中自动启动 worker
+WORKER_MODE = os.environ.get('REMINDER_OUTBOX_WORKER', 'inprocess')
+
+OUTBOX_STATUSES = ('pending', 'sending', 'sent', 'failed')
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_outbox_schema(cursor):
+    """创建发件箱表、路由规则表、通知状态表和索引（幂等）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_by TEXT,
+            claimed_until REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(notification_outbox)")
+    column_names = [column[1] for column in cursor.fetchall()]
+    if 'pages_sent' not in column_names:
+        # 分页汇总已发出的页数，重试时从下一页继续
+        cursor.execute("ALTER TABLE notification_outbox ADD COLUMN pages_sent INTEGER NOT NULL DEFAULT 0")
+    ensure_routes_schema(cursor)
+    ensure_notification_state_schema(cursor)
+    # worker 领取任务：按状态和下一次投递时间查找
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notification_outbox_status_next
+        ON notification_outbox(status, next_attempt_at)
+    ''')
+
+
+def _ensure_schema():
+    """独立进程（提醒服务、outbox_service.py）不经过 app.init_db，首次使用时建表"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            with get_db() as conn:
+                ensure_outbox_schema(conn.cursor())
+            _schema_ready = True
+
+
+def make_idempotency_key(channel, *parts):
+    """由通道和内容生成幂等键，相同的内容得到相同的键"""
+    digest = hashlib.sha256(
+        json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()[:32]
+    return f'{channel}:{digest}'
+
+
+def enqueue_notification(channel, payload, idempotency_key=None):
+    """
+    把一条通知写入发件箱
+
+    :param channel: 'email' 或 'dingtalk'
+    :param payload: 通知内容（JSON 可序列化的字典）
+    :param idempotency_key: 幂等键，默认由通道、当天日期和内容生成
+    :return: (任务 ID, 是否新入队)；幂等键已存在时返回已有任务的 ID 和 False，
+             已有任务投递失败时重新排队并返回 True
+    """
+    if channel not in DELIVERERS:
+        raise ValueError(f'不支持的通知通道: {channel}')
+    _ensure_schema()
+    if idempotency_key is None:
+        idempotency_key = make_idempotency_key(channel, datetime.date.today().isoformat(), payload)
+
+    with get_db() as conn:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO notification_outbox
+                (channel, idempotency_key, payload, status, next_attempt_at, created_at)
+            VALUES (?, ?, ?, 'pending', ?, ?)
+        ''', (
+            channel, idempotency_key, json.dumps(payload, ensure_ascii=False),
+            time.time(), datetime.datetime.now().isoformat(timespec='seconds')
+        ))
+        created = cursor.rowcount > 0
+        job_id = cursor.lastrowid if created else conn.execute(
+            'SELECT id FROM notification_outbox WHERE idempotency_key = ?', (idempotency_key,)
+        ).fetchone()[0]
+        if not created:
+            # 相同内容的通知已投递失败（次数用尽，通知状态没有写入），重新排队
+            created = conn.execute('''
+                UPDATE notification_outbox
+                SET status = 'pending', attempts = 0, pages_sent = 0, next_attempt_at = ?
+                WHERE id = ? AND status = 'failed'
+            ''', (time.time(), job_id)).rowcount > 0
+
+    if created:
+        logging.info(f"通知已入队: {channel} #{job_id}")
+        if WORKER_MODE != 'external':
+            outbox_worker.start()
+        outbox_worker.wake()
+    else:
+        logging.info(f"相同内容的通知已在发件箱中 ({channel} #{job_id})，不重复入队")
+    return job_id, created
+
+
+def enqueue_routed_digests(channels=('email', 'dingtalk'), evaluation=None):
+    """
+    为每条有需要通知的到期提醒项的路由规则生成一份汇总并入队（投递成功后记录通知状态）
+
+    :param evaluation: 调用方已获取的评估结果（见 reminder_engine），不传时获取当天的评估
+    :return: {路由规则 ID: {'channel', 'count', 'status': queued / duplicate, 'job_id'}}
+    """
+    _ensure_schema()
+    if evaluation is None:
+        evaluation = reminder_engine.evaluate()
+    today = evaluation.today
+    routes = evaluation.routed_notices(channels)
+
+    report = {}
+    for route in routes:
+        builder = build_email_pages if route['channel'] == 'email' else build_dingtalk_pages
+        # 收件人、Webhook 和密钥在投递时按 route_id 读取
+        payload = {
+            'route_id': route['route_id'],
+            'pages': builder(route['reminders']),
+            'notices': build_notice_record(route_state_target(route['route_id']), route['reminders'], today),
+        }
+        job_id, created = enqueue_notification(route['channel'], payload)
+        report[route['route_id']] = {
+            'channel': route['channel'],
+            'count': len(route['reminders']),
+            'status': 'queued' if created else 'duplicate',
+            'job_id': job_id,
+        }
+    return report
+
+
+def list_outbox(status=None, limit=100):
+    """按 ID 倒序列出发件箱中的任务（不含内容正文）"""
+    _ensure_schema()
+    sql = '''
+        SELECT id, channel, idempotency_key, status, attempts, pages_sent, next_attempt_at,
+               last_error, created_at, sent_at
+        FROM notification_outbox
+    '''
+    params = []
+    if status:
+        sql += ' WHERE status = ?'
+        params.append(status)
+    sql += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+    with get_db() as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+
+def outbox_counts():
+    """各状态的任务数"""
+    _ensure_schema()
+    with get_db() as conn:
+        rows = conn.execute('SELECT status, COUNT(*) FROM notification_outbox GROUP BY status').fetchall()
+    counts = {status: 0 for status in OUTBOX_STATUSES}
+    counts.update({row[0]: row[1] for row in rows})
+    return counts
+
+
+def _payload_pages(payload):
+    """分页汇总的 payload 为 {'pages': [...]}，单条消息的 payload 本身就是一页"""
+    return payload.get('pages') or [payload]
+
+
+def _load_route(route_id):
+    with get_db() as conn:
+        route = get_route(conn, route_id)
+    if route is None:
+        raise RuntimeError(f'路由规则 {route_id} 已删除')
+    return route
+
+
+# --- 各通道的投递函数：按顺序发送 payload 中的各页，从第 start 页开始；
+# 每发出一页调用 on_page_sent(已发出页数)；成功返回 None，失败抛出异常 ---
+
+def deliver_email(payload, start=0, on_page_sent=None):
+    """
+    payload: {'pages': [{'subject', 'body'}], 'route_id' 或 'recipients'（可选，默认取配置中的收件人）}
+    """
+    config = settings_cache.get_email_config()
+    required_keys = ['smtp_server', 'smtp_port', 'sender_email', 'sender_password']
+    missing = [key for key in required_keys if not config.get(key)]
+    if missing:
+        raise RuntimeError(f"邮件配置不完整，缺少字段: {', '.join(missing)}")
+    if payload.get('route_id'):
+        route = _load_route(payload['route_id'])
+        recipients = parse_recipients(route['target'])
+    else:
+        recipients = payload.get('recipients') or parse_recipients(config.get('recipient_email'))
+    if not recipients:
+        raise RuntimeError('邮件收件人未配置')
+    pages = _payload_pages(payload)
+    for index in range(start, len(pages)):
+        # 各页通过同一个 SMTP 会话依次发送
+        results = smtp_sender.send_digest(config, pages[index]['subject'], pages[index]['body'], recipients)
+        failed = [result for result in results if not result['ok']]
+        if failed:
+            raise RuntimeError('; '.join(f"{', '.join(r['recipients'])}: {r.get('error')}" for r in failed))
+        if on_page_sent:
+            on_page_sent(index + 1)
+
+
+def deliver_dingtalk(payload, start=0, on_page_sent=None):
+    """
+    payload: {'pages': [{'title', 'text'}], 'route_id' 或 'webhook'（可选，默认取配置中的机器人）, 'secret'（与 webhook 配套）}
+    """
+    webhook_url = payload.get('webhook')
+    secret = payload.get('secret')
+    if payload.get('route_id'):
+        route = _load_route(payload['route_id'])
+        webhook_url, secret = route['target'], route['secret']
+    if not webhook_url:
+        config = settings_cache.get_dingtalk_config()
+        webhook_url = config.get('dingtalk_webhook')
+        secret = config.get('dingtalk_secret')
+    if not webhook_url:
+        raise RuntimeError('钉钉 Webhook URL 未配置')
+    pages = _payload_pages(payload)
+    for index in range(start, len(pages)):
+        message_data = {
+            "msgtype": "markdown",
+            "markdown": {"title": pages[index]['title'], "text": pages[index]['text']}
+        }
+        # worker 在后台运行，可以一直等到限速器放行；上一页发出后才发下一页，保证顺序
+        result = dingtalk_client.send(webhook_url, secret, message_data)
+        if not result['ok']:
+            raise RuntimeError(f"钉钉返回错误: {result.get('errcode')} {result.get('errmsg')}")
+        if on_page_sent:
+            on_page_sent(index + 1)
+
+
+DELIVERERS = {
+    'email': deliver_email,
+    'dingtalk': deliver_dingtalk,
+}
+
+
+class OutboxWorker:
+    """领取并投递发件箱中的任务"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, batch_size=CLAIM_BATCH_SIZE):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def claim(self):
+        """领取到期的待投递任务以及租约已过期的任务"""
+        now = time.time()
+        with get_db() as conn:
+            # 立即获取写锁，多个 worker 不会领取到同一个任务
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                SELECT id FROM notification_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claimed_until < ?)
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            ''', (now, now, self.batch_size)).fetchall()
+            ids = [row[0] for row in rows]
+            if not ids:
+                return []
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(f'''
+                UPDATE notification_outbox
+                SET status = 'sending', claimed_by = ?, claimed_until = ?, attempts = attempts + 1
+                WHERE id IN ({placeholders})
+            ''', [self.worker_id, now + LEASE_SECONDS] + ids)
+            return [dict(row) for row in conn.execute(
+                f'SELECT * FROM notification_outbox WHERE id IN ({placeholders}) ORDER BY id', ids
+            )]
+
+    def _record_progress(self, job, pages_sent):
+        """记录已发出的页数（失败重试时不重复发送已发出的页），并延长租约"""
+        with get_db() as conn:
+            conn.execute(
+                'UPDATE notification_outbox SET pages_sent = ?, claimed_until = ? WHERE id = ? AND claimed_by = ?',
+                (pages_sent, time.time() + LEASE_SECONDS, job['id'], self.worker_id)
+            )
+
+    def _record(self, job, error):
+        """
+        记录投递结果：成功为 sent，并在同一事务中写入任务附带的通知状态；
+        失败时按退避时间重新排队，次数用尽则为 failed（不写通知状态，下一次检查会重新通知）
+        """
+        with get_db() as conn:
+            if error is None:
+                cursor = conn.execute('''
+                    UPDATE notification_outbox
+                    SET status = 'sent', sent_at = ?, last_error = NULL, claimed_by = NULL, claimed_until = NULL
+                    WHERE id = ? AND claimed_by = ?
+                ''', (datetime.datetime.now().isoformat(timespec='seconds'), job['id'], self.worker_id))
+                notices = json.loads(job['payload']).get('notices')
+                if cursor.rowcount and notices:
+                    record_delivered_notices(conn, notices)
+                logging.info(f"通知投递成功: {job['channel']} #{job['id']}")
+                return
+            if job['attempts'] >= MAX_ATTEMPTS:
+                status, next_attempt_at = 'failed', job['next_attempt_at']
+                logging.error(f"通知投递失败且已达最大次数: {job['channel']} #{job['id']}: {error}")
+            else:
+                delay = min(RETRY_BACKOFF * (2 ** (job['attempts'] - 1)), MAX_RETRY_DELAY)
+                status, next_attempt_at = 'pending', time.time() + delay
+                logging.warning(f"通知投递失败，{delay} 秒后重试: {job['channel']} #{job['id']}: {error}")
+            conn.execute('''
+                UPDATE notification_outbox
+                SET status = ?, next_attempt_at = ?, last_error = ?, claimed_by = NULL, claimed_until = NULL
+                WHERE id = ? AND claimed_by = ?
+            ''', (status, next_attempt_at, str(error), job['id'], self.worker_id))
+
+    @staticmethod
+    def _timeout(job):
+        """任务的超时：通道超时乘以剩余页数"""
+        pages = len(_payload_pages(json.loads(job['payload'])))
+        return DEFAULT_CHANNEL_TIMEOUTS.get(job['channel'], LEASE_SECONDS) * max(pages - job['pages_sent'], 1)
+
+    def run_once(self):
+        """领取一批任务并并发投递，返回处理的任务数"""
+        _ensure_schema()
+        jobs = self.claim()
+        if not jobs:
+            return 0
+
+        def make_sender(job):
+            def send():
+                DELIVERERS[job['channel']](
+                    json.loads(job['payload']),
+                    start=job['pages_sent'],
+                    on_page_sent=lambda pages_sent: self._record_progress(job, pages_sent)
+                )
+                return True
+            return send
+
+        names = {f"{job['channel']}#{job['id']}": job for job in jobs}
+        report = dispatch(
+            {name: make_sender(job) for name, job in names.items()},
+            timeouts={name: self._timeout(job) for name, job in names.items()}
+        )
+        for name, job in names.items():
+            result = report['channels'][name]
+            if result['status'] == 'sent':
+                self._record(job, None)
+            elif result['status'] == 'timeout':
+                # 仍在后台执行，租约过期前不要重新排队，避免重复发送
+                logging.warning(f"通知 {name} 投递超时，租约过期后重新领取")
+            else:
+                self._record(job, result.get('error') or result['status'])
+        return len(jobs)
+
+    def drain(self):
+        """投递所有已到期的任务直到没有可领取的任务（供一次性脚本在退出前调用），返回处理的任务数"""
+        total = 0
+        while True:
+            count = self.run_once()
+            if not count:
+                return total
+            total += count
+
+    def _next_due_in(self):
+        """距离最早一个待投递任务的秒数，没有任务时返回 None"""
+        with get_db() as conn:
+            row = conn.execute('''
+                SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status = 'pending'
+            ''').fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - time.time(), 0)
+
+    def run_forever(self):
+        """循环领取任务，没有任务时睡眠到下一次重试时间或被 wake() 唤醒"""
+        logging.info(f"通知发件箱 worker {self.worker_id} 已启动")
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+                timeout = self.poll_interval
+                due_in = self._next_due_in()
+                if due_in is not None:
+                    timeout = min(timeout, due_in)
+            except Exception as e:
+                logging.error(f"通知发件箱 worker 出错: {e}")
+                timeout = self.poll_interval
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def start(self):
+        """在后台线程中启动 worker（已启动时什么也不做）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='notification-outbox', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+outbox_worker = OutboxWorker()
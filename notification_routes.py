@@ -0,0 +1,148 @@
+# notification_routes.py
+"""
+通知路由规则
+
+默认情况下所有提醒都发给邮箱配置中的收件人和钉钉配置中的机器人。
+路由规则按提醒项的办事员（handler）、发证机关（certifier）或类型（type）
+把提醒额外发给指定的邮箱地址或钉钉机器人，每条规则各自生成一份只包含
+匹配提醒项的汇总，并各自记录通知状态（见 notification_state.py）。
+
+所有规则共用 reminder_engine 对到期提醒项的同一次评估，
+而不是每条规则各扫描一次提醒表。
+"""
+
+from notification_state import fetch_notice_states, select_needing_notice
+
+ROUTE_MATCH_FIELDS = ('handler', 'certifier', 'type')
+ROUTE_CHANNELS = ('email', 'dingtalk')
+
+# 汇总中使用的提醒项字段
+DIGEST_FIELDS = ('id', 'name', 'type', 'certifier', 'handler', 'end_date', 'actual_reminder_date')
+
+
+def ensure_routes_schema(cursor):
+    """创建路由规则表（幂等）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_routes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            match_field TEXT NOT NULL,
+            match_value TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            target TEXT NOT NULL,
+            secret TEXT,
+            enabled INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+
+
+def validate_route(data):
+    """
+    校验并规范化路由规则（原地修改 data）
+
+    :return: 错误信息，校验通过时返回 None
+    """
+    if not isinstance(data, dict):
+        return '请求数据必须是 JSON 对象'
+    if data.get('match_field') not in ROUTE_MATCH_FIELDS:
+        return f"match_field 必须是 {', '.join(ROUTE_MATCH_FIELDS)} 之一"
+    if data.get('channel') not in ROUTE_CHANNELS:
+        return f"channel 必须是 {', '.join(ROUTE_CHANNELS)} 之一"
+    for field in ('match_value', 'target'):
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return f'缺少必填字段: {field}'
+        data[field] = value.strip()
+    if data['channel'] == 'dingtalk' and not data['target'].startswith(('http://', 'https://')):
+        return '钉钉路由的 target 必须是 Webhook URL'
+    data['secret'] = data.get('secret') or None
+    data['enabled'] = 1 if data.get('enabled', True) else 0
+    return None
+
+
+def list_routes(conn):
+    """列出所有路由规则（不含钉钉密钥）"""
+    cursor = conn.execute('''
+        SELECT id, match_field, match_value, channel, target, enabled, secret IS NOT NULL AS has_secret
+        FROM notification_routes
+        ORDER BY id
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def insert_route(cursor, data):
+    cursor.execute('''
+        INSERT INTO notification_routes (match_field, match_value, channel, target, secret, enabled)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (data['match_field'], data['match_value'], data['channel'], data['target'], data['secret'], data['enabled']))
+    return cursor.lastrowid
+
+
+def get_route(conn, route_id):
+    """按 ID 读取一条路由规则（含钉钉密钥），不存在时返回 None"""
+    row = conn.execute('SELECT * FROM notification_routes WHERE id = ?', (route_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def delete_route(cursor, route_id):
+    cursor.execute('DELETE FROM notification_routes WHERE id = ?', (route_id,))
+    deleted = cursor.rowcount
+    cursor.execute('DELETE FROM notification_state WHERE target = ?', (route_state_target(route_id),))
+    return deleted
+
+
+def route_state_target(route_id):
+    """路由规则在通知状态表中的目标名"""
+    return f'route:{route_id}'
+
+
+def fetch_enabled_routes(conn, channels=ROUTE_CHANNELS):
+    """列出这些通道上启用的路由规则（含钉钉密钥）"""
+    placeholders = ','.join('?' * len(channels))
+    cursor = conn.execute(
+        f'SELECT * FROM notification_routes WHERE enabled = 1 AND channel IN ({placeholders}) ORDER BY id',
+        list(channels)
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def fetch_routed_due_reminders(conn, due, today=None, channels=ROUTE_CHANNELS):
+    """
+    按路由规则分组选出需要发送新通知的到期提醒项
+
+    到期的提醒项由 reminder_engine 评估（不再查询提醒表），这里读取路由规则表，
+    在内存中按 match_field 把提醒项分到匹配的规则下，再按主键读取匹配项在各规则上的通知状态。
+
+    :param due: 到期窗口内的提醒项，见 ReminderEvaluation.due
+    :return: [{'route_id', 'channel', 'target', 'secret', 'match_field', 'match_value', 'reminders': [...]}]
+             reminders 中每项只保留汇总需要的字段并附带 notice_stage；没有需要通知的项目的规则不返回
+    """
+    routes = fetch_enabled_routes(conn, channels)
+    if not routes or not due:
+        return []
+    matched_by_route = {
+        route['id']: [reminder for reminder in due if reminder.get(route['match_field']) == route['match_value']]
+        for route in routes
+    }
+    states = fetch_notice_states(
+        conn, [route_state_target(route['id']) for route in routes],
+        [reminder['id'] for matched in matched_by_route.values() for reminder in matched]
+    )
+
+    result = []
+    for route in routes:
+        pending = select_needing_notice(matched_by_route[route['id']], states[route_state_target(route['id'])], today)
+        if not pending:
+            continue
+        result.append({
+            'route_id': route['id'],
+            'channel': route['channel'],
+            'target': route['target'],
+            'secret': route['secret'],
+            'match_field': route['match_field'],
+            'match_value': route['match_value'],
+            'reminders': [
+                {field: reminder.get(field) for field in DIGEST_FIELDS + ('notice_stage',)}
+                for reminder in pending
+            ],
+        })
+    return result
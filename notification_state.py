@@ -0,0 +1,211 @@
+# notification_state.py
+"""
+每个提醒项在每个通知目标上的通知状态
+
+原先每天的检查都会把提醒窗口内的所有提醒项重新发一遍，一个提前 30 天进入
+提醒窗口的项目会连续出现在 30 份汇总里。这里为每个 (提醒项, 通知目标) 记录
+最近一次通知的日期、所处阶段和下一次应通知的日期，检查时只选出需要发送新通知的项目：
+
+- first：首次进入提醒窗口（或到期日期被修改过）；
+- weekly：距上次通知满 REPEAT_DAYS 天的重复提醒；
+- final：到期当天的最后提醒。
+
+到期窗口内的提醒项由 reminder_engine 每天（数据变化时）评估一次，各通知目标
+按主键只读取这些到期提醒项的通知状态并在内存中筛选，不再各自查询提醒表。
+到期日期已过的状态（包括已续期的旧周期）不会再被用到，写入新状态时一并删除，
+通知状态表的大小与当前的到期窗口相关，而不是随历史累积。
+
+通知状态在发件箱把通知投递成功时才写入（与标记 sent 在同一个事务中）：
+入队时把提醒项 ID、到期日期和阶段放在任务内容的 notices 字段里（见 build_notice_record），
+投递失败且次数用尽的通知不会留下“已通知”的状态，下一次检查会重新选出这些项目。
+
+通知目标为 'email'、'dingtalk'（默认收件人和机器人）或 'route:<路由规则 ID>'。
+"""
+
+import datetime
+import os
+
+from reminder_queries import DATE_FORMAT
+
+STAGE_FIRST = 'first'
+STAGE_REPEAT = 'weekly'
+STAGE_FINAL = 'final'
+
+STAGE_LABELS = {
+    STAGE_FIRST: '首次提醒',
+    STAGE_REPEAT: '重复提醒',
+    STAGE_FINAL: '今天到期',
+}
+
+# 重复提醒的间隔天数
+REPEAT_DAYS = int(os.environ.get('REMINDER_REPEAT_DAYS', '7'))
+
+# 按提醒项 ID 读取通知状态时每条查询的 ID 数，不超过 SQLite 旧版本 999 个参数的上限
+STATE_QUERY_CHUNK = 500
+
+def ensure_notification_state_schema(cursor):
+    """创建通知状态表和索引（幂等）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_state (
+            reminder_id INTEGER NOT NULL,
+            target TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            end_date TEXT,
+            last_notified TEXT NOT NULL,
+            next_notify_date TEXT,
+            PRIMARY KEY (reminder_id, target)
+        )
+    ''')
+    # 按目标查询下一次应通知的项目（以及统计各目标的待通知数量）
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notification_state_target_next
+        ON notification_state(target, next_notify_date)
+    ''')
+    # 按到期日期删除已过期的状态
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notification_state_end_date ON notification_state(end_date)')
+
+
+def fetch_notice_states(conn, targets, reminder_ids):
+    """
+    读取这些提醒项在这些通知目标上的通知状态
+
+    按主键 (reminder_id, target) 分批查找，读取量与到期的提醒项数量相关，与状态表的大小无关。
+
+    :param reminder_ids: 到期窗口内的提醒项 ID
+    :return: {通知目标: {提醒项 ID: 状态字典}}
+    """
+    states = {target: {} for target in targets}
+    reminder_ids = list(dict.fromkeys(reminder_ids))
+    if not states or not reminder_ids:
+        return states
+    target_placeholders = ','.join('?' * len(states))
+    for start in range(0, len(reminder_ids), STATE_QUERY_CHUNK):
+        chunk = reminder_ids[start:start + STATE_QUERY_CHUNK]
+        cursor = conn.execute(f'''
+            SELECT * FROM notification_state
+            WHERE reminder_id IN ({','.join('?' * len(chunk))}) AND target IN ({target_placeholders})
+        ''', chunk + list(states))
+        for row in cursor.fetchall():
+            states[row['target']][row['reminder_id']] = dict(row)
+    return states
+
+
+def notice_stage(reminder, state, today_str):
+    """
+    提醒项在某个通知目标上本次应处的通知阶段，不需要发送新通知时返回 None
+
+    :param reminder: 到期窗口内的提醒项（需要 end_date）
+    :param state: 该目标上的通知状态，从未通知过时为 None
+    """
+    if state is None or state['end_date'] != reminder['end_date']:
+        # 首次进入提醒窗口，或到期日期被修改过
+        return STAGE_FINAL if reminder['end_date'] == today_str else STAGE_FIRST
+    if state['next_notify_date'] is None or state['next_notify_date'] > today_str:
+        return None
+    return STAGE_FINAL if reminder['end_date'] == today_str else STAGE_REPEAT
+
+
+def select_needing_notice(reminders, states, today=None):
+    """
+    从到期的提醒项中选出在该通知目标上需要发送新通知的项目
+
+    :param reminders: 到期窗口内的提醒项（见 reminder_engine）
+    :param states: 该目标上的通知状态 {提醒项 ID: 状态字典}，见 fetch_notice_states
+    :return: 提醒项字典的副本列表（附带 notice_stage 字段），保持 reminders 的顺序
+    """
+    if today is None:
+        today = datetime.date.today()
+    today_str = today.strftime(DATE_FORMAT)
+    selected = []
+    for reminder in reminders:
+        stage = notice_stage(reminder, states.get(reminder['id']), today_str)
+        if stage is not None:
+            selected.append(dict(reminder, notice_stage=stage))
+    return selected
+
+
+def _next_notify_date(end_date, today):
+    """下一次重复提醒的日期：REPEAT_DAYS 天后，但不晚于到期当天；到期当天已通知过则为 None"""
+    try:
+        end = datetime.datetime.strptime(end_date, DATE_FORMAT).date()
+    except (TypeError, ValueError):
+        return None
+    if today >= end:
+        return None
+    return min(today + datetime.timedelta(days=REPEAT_DAYS), end).strftime(DATE_FORMAT)
+
+
+def record_notices(conn, target, reminders, today=None):
+    """
+    记录已为这些提醒项发送了通知，并删除已过期的通知状态
+
+    :param reminders: select_needing_notice 返回的提醒项（需要 id、end_date、notice_stage）
+    """
+    if today is None:
+        today = datetime.date.today()
+    today_str = today.strftime(DATE_FORMAT)
+    purge_expired_notification_state(conn, today)
+    conn.executemany('''
+        INSERT INTO notification_state (reminder_id, target, stage, end_date, last_notified, next_notify_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (reminder_id, target) DO UPDATE SET
+            stage = excluded.stage,
+            end_date = excluded.end_date,
+            last_notified = excluded.last_notified,
+            next_notify_date = excluded.next_notify_date
+    ''', [
+        (
+            reminder['id'], target, reminder.get('notice_stage') or STAGE_FIRST, reminder['end_date'],
+            today_str, _next_notify_date(reminder['end_date'], today)
+        )
+        for reminder in reminders
+    ])
+
+
+def build_notice_record(target, reminders, today):
+    """
+    生成随通知一起入队的通知记录，投递成功后由 record_delivered_notices 写入通知状态
+
+    :param reminders: select_needing_notice 返回的提醒项（需要 id、end_date、notice_stage）
+    :return: {'target', 'date', 'reminders': [[ID, 到期日期, 阶段]]}（JSON 可序列化）
+    """
+    return {
+        'target': target,
+        'date': today.strftime(DATE_FORMAT),
+        'reminders': [
+            [reminder['id'], reminder['end_date'], reminder.get('notice_stage') or STAGE_FIRST]
+            for reminder in reminders
+        ],
+    }
+
+
+def record_delivered_notices(conn, notice_record):
+    """通知投递成功后，按入队时的通知记录（见 build_notice_record）写入通知状态"""
+    today = datetime.datetime.strptime(notice_record['date'], DATE_FORMAT).date()
+    reminders = [
+        {'id': reminder_id, 'end_date': end_date, 'notice_stage': stage}
+        for reminder_id, end_date, stage in notice_record['reminders']
+    ]
+    record_notices(conn, notice_record['target'], reminders, today)
+
+
+def purge_expired_notification_state(conn, today=None):
+    """
+    删除到期日期已过的通知状态
+
+    过期或已续期（续期的都是已过期的旧周期）的提醒项不在到期窗口内，不会再读取这些状态；
+    到期日期后来被延长的提醒项，旧状态的到期日期不一致，本来也会按首次提醒处理。
+
+    :return: 删除的行数
+    """
+    if today is None:
+        today = datetime.date.today()
+    cursor = conn.execute(
+        'DELETE FROM notification_state WHERE end_date < ?', (today.strftime(DATE_FORMAT),)
+    )
+    return cursor.rowcount
+
+
+def delete_notification_state(cursor, reminder_id):
+    """删除提醒项时一并删除它的通知状态"""
+    cursor.execute('DELETE FROM notification_state WHERE reminder_id = ?', (reminder_id,))
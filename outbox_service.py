@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+通知发件箱的独立投递进程
+
+与 Web 应用分开部署时，设置 REMINDER_OUTBOX_WORKER=external 关闭进程内的 worker，
+再运行本脚本。可以同时运行多个实例，任务通过租约领取，不会重复投递。
+"""
+import logging
+import os
+import sys
+
+# 添加项目目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from notification_outbox import outbox_worker
+
+
+def run_worker():
+    """运行通知投递 worker（阻塞）"""
+    print(f"通知发件箱 worker {outbox_worker.worker_id} 已启动")
+    try:
+        outbox_worker.run_forever()
+    except KeyboardInterrupt:
+        outbox_worker.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_worker()
@@ -0,0 +1,97 @@
+# reminder_changes.py
+"""
+提醒项增量同步
+
+每一行提醒项记录最后一次写入时的 reminders 数据版本号（row_version 列），
+删除的提醒项在 reminder_tombstones 表中留下墓碑（ID 和删除时的版本号）。
+客户端记住上次同步到的版本号，之后只需取回 row_version 或删除版本号
+大于该值的行，合并到本地列表即可，不必重新下载整张表。
+"""
+
+# 一次增量同步最多返回的行数，超过时让客户端整体重新加载
+MAX_CHANGES = 5000
+
+
+def ensure_change_tracking_schema(cursor):
+    """添加 row_version 列、墓碑表以及相应的索引（幂等）"""
+    cursor.execute("PRAGMA table_info(reminders)")
+    column_names = [column[1] for column in cursor.fetchall()]
+    if 'row_version' not in column_names:
+        # 已有的行视为版本 0
+        cursor.execute("ALTER TABLE reminders ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reminders_row_version ON reminders(row_version)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_tombstones (
+            id INTEGER PRIMARY KEY,
+            deleted_version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_reminder_tombstones_deleted_version '
+        'ON reminder_tombstones(deleted_version)'
+    )
+
+
+def record_tombstone(cursor, reminder_id, version):
+    """在删除提醒项的同一事务中记录墓碑"""
+    cursor.execute(
+        'INSERT OR REPLACE INTO reminder_tombstones (id, deleted_version) VALUES (?, ?)',
+        (reminder_id, version)
+    )
+
+
+def parse_since(value):
+    """
+    解析客户端提交的版本号
+
+    :raises ValueError: 不是非负整数
+    """
+    try:
+        since = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'since 无效: {value}')
+    if since < 0:
+        raise ValueError('since 不能为负数')
+    return since
+
+
+def fetch_reminder_changes(conn, since, current_version, limit=MAX_CHANGES):
+    """
+    查询 since 之后新增、修改和删除的提醒项
+
+    调用方应在同一个读事务中读取 current_version 并调用本函数，保证结果是一致的快照。
+
+    :param since: 客户端上次同步到的版本号
+    :param current_version: 当前的 reminders 数据版本号
+    :return: {'version', 'since', 'changed': [行字典], 'deleted': [ID], 'reset': bool}
+             reset 为 True 时变更过多（或 since 无效），客户端应整体重新加载
+    """
+    result = {'version': current_version, 'since': since, 'changed': [], 'deleted': [], 'reset': False}
+    if since > current_version:
+        # 客户端的版本号来自另一个数据库（例如数据库被替换）
+        result['reset'] = True
+        return result
+    if since == current_version:
+        return result
+
+    rows = conn.execute(
+        'SELECT * FROM reminders WHERE row_version > ? ORDER BY id LIMIT ?',
+        (since, limit + 1)
+    ).fetchall()
+    if len(rows) > limit:
+        result['reset'] = True
+        return result
+
+    # 删除后又以同一 ID 新建的情况（AUTOINCREMENT 下不会发生）以行为准
+    changed_ids = {row['id'] for row in rows}
+    deleted = [
+        row[0] for row in conn.execute(
+            'SELECT id FROM reminder_tombstones WHERE deleted_version > ? ORDER BY id',
+            (since,)
+        )
+        if row[0] not in changed_ids
+    ]
+    result['changed'] = [dict(row) for row in rows]
+    result['deleted'] = deleted
+    return result
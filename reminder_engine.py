@@ -0,0 +1,148 @@
+# reminder_engine.py
+"""
+提醒项评估
+
+把所有提醒项按当天日期分为四类：
+
+- normal：未到提醒日期；
+- warning：已到提醒日期、尚未过期（到期窗口内，需要通知）；
+- expired：已过期；
+- renewable：已过期且开启了自动续期、尚未生成下一周期（expired 的子集）。
+
+一次评估包含统计（总数、各类数量、按类型/办事员的分布）、到期窗口内的提醒项
+和需要续期的提醒项 ID，在同一个读事务中用三条索引查询得到。结果按
+(日期, reminders 数据版本号) 缓存：当天内没有写入时，统计接口、实时推送、
+各通知通道、路由规则、Web 应用的调度任务和独立脚本都使用同一份结果；
+任何写入都会递增数据版本号，下一次读取时自动重新评估（其他进程的写入也一样）。
+
+各通知目标是否需要发送新通知取决于通知状态（见 notification_state.py），
+通知状态在发送时才会变化，因此不缓存，由 pending_notices()/routed_notices()
+读取后在评估结果上筛选。
+"""
+
+import datetime
+import threading
+
+from db import get_db
+import data_version
+from data_version import get_data_version
+from reminder_queries import DATE_FORMAT, fetch_due_reminders, fetch_reminder_stats
+from auto_renew import fetch_renewable_ids
+from notification_state import fetch_notice_states, select_needing_notice
+from notification_routes import fetch_routed_due_reminders, ROUTE_CHANNELS
+
+STATUS_NORMAL = 'normal'
+STATUS_WARNING = 'warning'
+STATUS_EXPIRED = 'expired'
+STATUS_RENEWABLE = 'renewable'
+
+REMINDER_CLASSES = (STATUS_NORMAL, STATUS_WARNING, STATUS_EXPIRED, STATUS_RENEWABLE)
+
+
+class ReminderEvaluation:
+    """
+    某一天、某个数据版本下的评估结果（只读，多个线程共享）
+
+    :ivar today: 评估的基准日期
+    :ivar version: reminders 数据版本号
+    :ivar stats: 统计，见 fetch_reminder_stats，另加 renewable 数量
+    :ivar due: 到期窗口内的提醒项字典列表，按实际提醒日期排序
+    :ivar renewable_ids: 需要续期的提醒项 ID 集合
+    """
+
+    def __init__(self, today, version, stats, due, renewable_ids):
+        self.today = today
+        self.version = version
+        self.stats = stats
+        self.due = due
+        self.renewable_ids = renewable_ids
+        self._today_str = today.strftime(DATE_FORMAT)
+
+    def classify(self, reminder):
+        """
+        返回提醒项的分类（与统计和状态筛选的 SQL 条件一致）
+
+        :param reminder: 至少包含 id、end_date、actual_reminder_date 的字典
+        """
+        end_date = reminder.get('end_date')
+        if end_date and end_date < self._today_str:
+            return STATUS_RENEWABLE if reminder.get('id') in self.renewable_ids else STATUS_EXPIRED
+        actual_reminder_date = reminder.get('actual_reminder_date')
+        if end_date and actual_reminder_date and actual_reminder_date <= self._today_str:
+            return STATUS_WARNING
+        return STATUS_NORMAL
+
+    def pending_notices(self, targets):
+        """
+        各通知目标上需要发送新通知的到期提醒项
+
+        :param targets: 通知目标列表，例如 ('email', 'dingtalk')
+        :return: {通知目标: 提醒项列表（附带 notice_stage）}
+        """
+        if not self.due:
+            return {target: [] for target in targets}
+        with get_db() as conn:
+            states = fetch_notice_states(conn, targets, [reminder['id'] for reminder in self.due])
+        return {target: select_needing_notice(self.due, states[target], self.today) for target in targets}
+
+    def routed_notices(self, channels=ROUTE_CHANNELS):
+        """按路由规则分组的需要发送新通知的到期提醒项，见 fetch_routed_due_reminders"""
+        if not self.due:
+            return []
+        with get_db() as conn:
+            return fetch_routed_due_reminders(conn, self.due, self.today, channels)
+
+
+class ReminderEngine:
+    """按 (日期, 数据版本号) 缓存最近一次评估结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._evaluation = None
+        self._stats = {'evaluations': 0, 'hits': 0}
+
+    def evaluate(self, today=None, version=None):
+        """
+        获取评估结果，当天内数据版本号未变化时直接返回缓存
+
+        :param today: 基准日期，默认为今天
+        :param version: 调用方已读取的 reminders 数据版本号，不传时查询数据库
+        """
+        if today is None:
+            today = datetime.date.today()
+        if version is None:
+            version = get_data_version(data_version.REMINDERS)
+        with self._lock:
+            evaluation = self._evaluation
+            if evaluation is not None and evaluation.today == today and evaluation.version == version:
+                self._stats['hits'] += 1
+                return evaluation
+
+        evaluation = self._build(today)
+        with self._lock:
+            self._stats['evaluations'] += 1
+            self._evaluation = evaluation
+        return evaluation
+
+    def _build(self, today):
+        with get_db() as conn:
+            # 在同一个读事务（快照）中读取版本号和各项结果，版本号与内容一致
+            conn.execute('BEGIN')
+            version = get_data_version(data_version.REMINDERS, conn)
+            stats = fetch_reminder_stats(conn, today)
+            due = fetch_due_reminders(conn, today)
+            renewable_ids = set(fetch_renewable_ids(conn, today))
+        stats['renewable'] = len(renewable_ids)
+        return ReminderEvaluation(today, version, stats, due, renewable_ids)
+
+    def invalidate(self):
+        """丢弃缓存的结果（本进程内的写入后调用，不必等到下一次读取版本号）"""
+        with self._lock:
+            self._evaluation = None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+reminder_engine = ReminderEngine()
@@ -0,0 +1,371 @@
+# reminder_queries.py
+"""
+提醒项相关的公共查询
+
+日期字段统一以 ISO 格式 (YYYY-MM-DD) 存储，因此可以直接在 SQL 里按字符串
+比较日期，并利用 actual_reminder_date / end_date 上的索引，只读取需要的行。
+"""
+
+import base64
+import datetime
+import json
+
+# 数据库中日期字段的存储格式
+DATE_FORMAT = '%Y-%m-%d'
+
+# 写入时可以接受的日期格式，统一转换为 DATE_FORMAT
+ACCEPTED_DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%Y.%m.%d', '%Y%m%d']
+
+# 提醒项表上的索引
+REMINDER_INDEXES = {
+    'idx_reminders_actual_reminder_date': 'reminders(actual_reminder_date)',
+    # 到期窗口查询先按 end_date 取范围，再在索引内过滤 actual_reminder_date
+    'idx_reminders_end_date': 'reminders(end_date, actual_reminder_date)',
+    # 列表默认按实际提醒日期分页，与 SORT_KEYS 中的排序键表达式保持一致
+    'idx_reminders_sort_actual_reminder_date': "reminders(COALESCE(actual_reminder_date, ''), id)",
+    # 覆盖统计查询所需的全部列，聚合时只扫描索引而不回表
+    'idx_reminders_stats': 'reminders(type, handler, end_date, actual_reminder_date)',
+}
+
+
+def create_reminder_indexes(cursor):
+    """创建提醒项表上的索引（幂等）"""
+    for name, target in REMINDER_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+
+
+def normalize_date(value, field_name, required=False):
+    """
+    将日期值规范化为 YYYY-MM-DD 字符串
+
+    :param value: 日期字符串、date 对象或空值
+    :param field_name: 字段名，用于错误提示
+    :param required: 是否为必填字段
+    :return: 规范化后的日期字符串，空值返回 None
+    :raises ValueError: 日期格式无法识别，或必填字段为空
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise ValueError(f'缺少必填字段: {field_name}')
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date().strftime(DATE_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.strftime(DATE_FORMAT)
+
+    text = str(value).strip()
+    for fmt in ACCEPTED_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).strftime(DATE_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f'{field_name} 日期格式无效: {value}，应为 YYYY-MM-DD')
+
+
+def compute_actual_reminder_date(end_date, advance_days):
+    """根据到期日期和提前天数计算实际提醒日期"""
+    end = datetime.datetime.strptime(end_date, DATE_FORMAT).date()
+    return (end - datetime.timedelta(days=int(advance_days))).strftime(DATE_FORMAT)
+
+
+def normalize_reminder_dates(data):
+    """
+    规范化提醒项数据中的日期字段（原地修改并返回 data）
+
+    actual_reminder_date 为空时根据 end_date 和 advance_days 自动计算。
+
+    :raises ValueError: 日期格式无效
+    """
+    data['end_date'] = normalize_date(data.get('end_date'), 'end_date', required=True)
+    data['start_date'] = normalize_date(data.get('start_date'), 'start_date')
+    data['actual_reminder_date'] = normalize_date(data.get('actual_reminder_date'), 'actual_reminder_date')
+    if data['actual_reminder_date'] is None and data.get('advance_days') not in (None, ''):
+        try:
+            data['actual_reminder_date'] = compute_actual_reminder_date(data['end_date'], data['advance_days'])
+        except (TypeError, ValueError):
+            raise ValueError(f"advance_days 无效: {data.get('advance_days')}")
+    return data
+
+
+def fetch_due_reminders(conn, today=None):
+    """
+    查询已到提醒日期且尚未过期的提醒项 (actual_reminder_date <= 今天 <= end_date)
+
+    :param conn: 数据库连接
+    :param today: 基准日期，默认为今天
+    :return: 提醒项字典列表，按实际提醒日期排序
+    """
+    if today is None:
+        today = datetime.date.today()
+    today_str = today.strftime(DATE_FORMAT)
+    # 一元 + 阻止优化器为了排序去扫描 actual_reminder_date 索引：
+    # 按 (end_date, actual_reminder_date) 复合索引取范围并在索引内过滤，
+    # 只有真正到期的行才会回表，排序也只作用于这些行
+    cursor = conn.execute('''
+        SELECT * FROM reminders
+        WHERE end_date >= ? AND +actual_reminder_date <= ?
+        ORDER BY +actual_reminder_date, id
+    ''', (today_str, today_str))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def find_malformed_date_reminders(conn):
+    """
+    维护查询：找出日期字段不是合法 YYYY-MM-DD 的提醒项
+
+    这些行不会出现在到期窗口查询的结果中，需要人工修正。
+    date(x) 对非法日期返回 NULL，对 2024-02-30 这类溢出日期返回顺延后的日期，
+    两种情况都与原值不相等。
+    """
+    cursor = conn.execute('''
+        SELECT id, name, start_date, end_date, actual_reminder_date
+        FROM reminders
+        WHERE end_date IS NULL
+           OR date(end_date) IS NOT end_date
+           OR actual_reminder_date IS NULL
+           OR date(actual_reminder_date) IS NOT actual_reminder_date
+           OR (start_date IS NOT NULL AND start_date != '' AND date(start_date) IS NOT start_date)
+        ORDER BY id
+    ''')
+    return [dict(row) for row in cursor.fetchall()]
+
+
+# --- 分页、筛选和排序 ---
+
+# 可排序的列：列名 -> 排序键表达式
+# 可为空的列用 COALESCE 转成空字符串，保证 keyset 游标比较时不会遇到 NULL
+SORT_KEYS = {
+    'actual_reminder_date': "COALESCE(actual_reminder_date, '')",
+    'end_date': 'end_date',
+    'start_date': "COALESCE(start_date, '')",
+    'name': 'name',
+    'type': 'type',
+    'handler': "COALESCE(handler, '')",
+    'id': 'id',
+}
+DEFAULT_SORT = 'actual_reminder_date'
+
+# 状态筛选，与前端显示的状态一致
+REMINDER_STATUSES = ('normal', 'warning', 'expired')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# 按列精确匹配的筛选参数
+EXACT_FILTERS = ('type', 'handler', 'certifier')
+
+# 日期范围筛选参数 -> (列名, 比较符)
+DATE_RANGE_FILTERS = {
+    'end_date_from': ('end_date', '>='),
+    'end_date_to': ('end_date', '<='),
+    'reminder_date_from': ('actual_reminder_date', '>='),
+    'reminder_date_to': ('actual_reminder_date', '<='),
+}
+
+# 支持的全部查询参数（出现任意一个即启用分页响应）
+PAGE_QUERY_PARAMS = (
+    ('limit', 'page_token', 'sort', 'order', 'status')
+    + EXACT_FILTERS + tuple(DATE_RANGE_FILTERS)
+)
+
+
+def status_condition(status, today_str):
+    """
+    返回某个状态对应的 SQL 条件和参数
+
+    expired: 已过期 (end_date < 今天)
+    warning: 即将到期 (actual_reminder_date <= 今天 <= end_date)
+    normal:  未到提醒日期
+    """
+    if status == 'expired':
+        return 'end_date < ?', [today_str]
+    if status == 'warning':
+        return 'end_date >= ? AND actual_reminder_date <= ?', [today_str, today_str]
+    if status == 'normal':
+        return ('end_date >= ? AND (actual_reminder_date IS NULL OR actual_reminder_date > ?)',
+                [today_str, today_str])
+    raise ValueError(f"status 无效: {status}，可选值: {', '.join(REMINDER_STATUSES)}")
+
+
+def build_reminder_filters(args, today=None):
+    """
+    根据查询参数构造 WHERE 子句
+
+    :param args: 查询参数（dict 或 request.args）
+    :param today: 状态筛选的基准日期，默认为今天
+    :return: (where_sql, params)，没有筛选条件时 where_sql 为空字符串
+    :raises ValueError: 参数无效
+    """
+    if today is None:
+        today = datetime.date.today()
+    conditions = []
+    params = []
+
+    for field in EXACT_FILTERS:
+        value = args.get(field)
+        if value:
+            conditions.append(f'{field} = ?')
+            params.append(value)
+
+    status = args.get('status')
+    if status:
+        condition, condition_params = status_condition(status, today.strftime(DATE_FORMAT))
+        conditions.append(condition)
+        params.extend(condition_params)
+
+    for param, (column, op) in DATE_RANGE_FILTERS.items():
+        value = args.get(param)
+        if value:
+            conditions.append(f'{column} {op} ?')
+            params.append(normalize_date(value, param))
+
+    where_sql = ' AND '.join(conditions)
+    return where_sql, params
+
+
+def encode_page_token(sort, order, last_row):
+    """将当前页最后一行的排序键编码为下一页的游标"""
+    payload = {'s': sort, 'o': order, 'k': last_row['sort_key'], 'id': last_row['id']}
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_page_token(token, sort, order):
+    """
+    解码分页游标
+
+    :raises ValueError: 游标无效，或与当前的排序方式不一致
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        key, last_id = payload['k'], int(payload['id'])
+        token_sort, token_order = payload['s'], payload['o']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f'page_token 无效: {e}')
+    if token_sort != sort or token_order != order:
+        raise ValueError('page_token 与当前的排序方式不一致')
+    return key, last_id
+
+
+def fetch_reminder_page(conn, args, today=None):
+    """
+    按 keyset 游标分页查询提醒项
+
+    :param conn: 数据库连接
+    :param args: 查询参数，支持 limit、page_token、sort、order、status 以及
+                 type/handler/certifier 和日期范围筛选
+    :param today: 状态筛选的基准日期，默认为今天
+    :return: {'items': [...], 'next_page_token': str 或 None, ...}
+    :raises ValueError: 参数无效
+    """
+    sort = args.get('sort') or DEFAULT_SORT
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort 无效: {sort}，可选值: {', '.join(SORT_KEYS)}")
+    order = (args.get('order') or 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'order 无效: {order}，可选值: asc, desc')
+
+    try:
+        limit = int(args.get('limit') or DEFAULT_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise ValueError(f"limit 无效: {args.get('limit')}")
+    if limit < 1:
+        raise ValueError('limit 必须大于 0')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    where_sql, params = build_reminder_filters(args, today)
+    conditions = [where_sql] if where_sql else []
+
+    sort_key = SORT_KEYS[sort]
+    direction = 'ASC' if order == 'asc' else 'DESC'
+    page_token = args.get('page_token')
+    if page_token:
+        last_key, last_id = decode_page_token(page_token, sort, order)
+        op = '>' if order == 'asc' else '<'
+        if sort == 'id':
+            conditions.append(f'id {op} ?')
+            params.append(last_id)
+        else:
+            # 展开写法（而不是行值比较）可以让 SQLite 在排序键索引上直接定位
+            conditions.append(f'{sort_key} {op}= ? AND ({sort_key} {op} ? OR id {op} ?)')
+            params.extend([last_key, last_key, last_id])
+
+    sql = f'SELECT *, {sort_key} AS sort_key FROM reminders'
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    if sort == 'id':
+        sql += f' ORDER BY id {direction} LIMIT ?'
+    else:
+        sql += f' ORDER BY {sort_key} {direction}, id {direction} LIMIT ?'
+    # 多取一行用于判断是否还有下一页
+    params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_page_token = encode_page_token(sort, order, rows[-1]) if has_more else None
+    items = []
+    for row in rows:
+        item = dict(row)
+        item.pop('sort_key', None)
+        items.append(item)
+
+    return {
+        'items': items,
+        'next_page_token': next_page_token,
+        'limit': limit,
+        'sort': sort,
+        'order': order,
+    }
+
+
+# --- 统计 ---
+
+def fetch_reminder_stats(conn, today=None):
+    """
+    用一条聚合查询统计提醒项数量
+
+    按 (type, handler) 分组统计总数、即将到期数和已过期数，再在 Python 中
+    汇总出总计以及按类型、按办事员的分布（分组数量远小于行数）。
+
+    :return: {'total', 'normal', 'warning', 'expired', 'by_type', 'by_handler', 'date'}
+    """
+    if today is None:
+        today = datetime.date.today()
+    today_str = today.strftime(DATE_FORMAT)
+    rows = conn.execute('''
+        SELECT type, handler,
+               COUNT(*) AS total,
+               SUM(CASE WHEN end_date < :today THEN 1 ELSE 0 END) AS expired,
+               SUM(CASE WHEN end_date >= :today AND actual_reminder_date <= :today
+                        THEN 1 ELSE 0 END) AS warning
+        FROM reminders
+        GROUP BY type, handler
+    ''', {'today': today_str}).fetchall()
+
+    def empty_counts():
+        return {'total': 0, 'normal': 0, 'warning': 0, 'expired': 0}
+
+    totals = empty_counts()
+    by_type = {}
+    by_handler = {}
+    for row in rows:
+        counts = {
+            'total': row['total'],
+            'warning': row['warning'],
+            'expired': row['expired'],
+            'normal': row['total'] - row['warning'] - row['expired'],
+        }
+        handler = row['handler'] or ''
+        for bucket in (totals, by_type.setdefault(row['type'], empty_counts()),
+                       by_handler.setdefault(handler, empty_counts())):
+            for key, value in counts.items():
+                bucket[key] += value
+
+    result = dict(totals)
+    result['by_type'] = by_type
+    result['by_handler'] = by_handler
+    result['date'] = today_str
+    return result
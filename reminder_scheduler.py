@@ -0,0 +1,316 @@
+# reminder_scheduler.py
+"""
+按下一次触发时间调度的提醒调度器
+
+每个未过期的提醒项在最小堆中有一个条目，键为它下一次需要通知的时间
+（提醒窗口 actual_reminder_date ~ end_date 内每天的 NOTIFY_TIME）。
+调度线程只在堆顶到期时醒来，而不是固定间隔轮询全表；提醒项新增、修改、
+删除、导入时通过 upsert()/remove() 增量更新堆，并在必要时提前唤醒线程。
+收不到增量更新的写入（其他进程）由 reload_if_changed() 按 row_version 和墓碑
+只取回上次同步之后变化的行，开销与变更数量而不是表的大小相关。
+"""
+
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import threading
+import traceback
+
+from db import get_db
+import data_version
+from reminder_queries import DATE_FORMAT
+from reminder_changes import fetch_reminder_changes
+
+
+def _parse_time(value):
+    hour, minute = value.split(':')
+    return datetime.time(int(hour), int(minute))
+
+
+# 每天发送提醒的时间
+NOTIFY_TIME = _parse_time(os.environ.get('REMINDER_NOTIFY_TIME', '09:00'))
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, DATE_FORMAT).date()
+    except (TypeError, ValueError):
+        return None
+
+
+class ReminderScheduler:
+    """
+    基于最小堆的提醒调度器
+
+    :param on_due: 有提醒项到达通知时间时调用，参数为本次到期的提醒项 ID 列表；
+                   同一时刻到期的多个提醒项只触发一次回调（由回调统一生成汇总通知）
+    :param notify_time: 每天的通知时间
+    :param refresh_interval: 可选，最长休眠秒数；到时检查 reminders 的数据版本号，
+                             有变化才从数据库同步变化的行，用于无法收到增量更新的独立进程
+    """
+
+    def __init__(self, on_due, notify_time=NOTIFY_TIME, refresh_interval=None):
+        self.on_due = on_due
+        self.notify_time = notify_time
+        self.refresh_interval = refresh_interval
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        # 提醒项 ID -> (actual_reminder_date, end_date, fire_at)，堆中与此不一致的条目视为已失效
+        self._reminders = {}
+        # 每日任务名称 -> (执行时间, 函数, fire_at)
+        self._jobs = {}
+        self._thread = None
+        self._stopped = False
+        self._version = None
+        self._stats = {'wakeups': 0, 'fired': 0, 'reloads': 0, 'refreshes': 0}
+
+    # --- 触发时间计算 ---
+
+    def next_fire_time(self, actual_reminder_date, end_date, now=None):
+        """
+        计算提醒项下一次的通知时间，已过期或日期无效时返回 None
+
+        提醒窗口内每天在 notify_time 通知一次；当天的通知时间已过则顺延到第二天。
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        if actual_reminder_date is None or end_date is None:
+            return None
+        day = max(actual_reminder_date, now.date())
+        fire_at = datetime.datetime.combine(day, self.notify_time)
+        if fire_at <= now:
+            day += datetime.timedelta(days=1)
+            fire_at = datetime.datetime.combine(day, self.notify_time)
+        if day > end_date:
+            return None
+        return fire_at
+
+    def _push(self, fire_at, key):
+        """压入堆；如果成为新的堆顶则唤醒调度线程"""
+        heapq.heappush(self._heap, (fire_at, next(self._counter), key))
+        if self._heap[0][2] == key:
+            self._cond.notify()
+
+    # --- 增量更新 ---
+
+    def upsert(self, reminder_id, actual_reminder_date, end_date):
+        """新增或更新一个提醒项的调度（日期为 YYYY-MM-DD 字符串）"""
+        actual = _parse_date(actual_reminder_date)
+        end = _parse_date(end_date)
+        with self._cond:
+            fire_at = self.next_fire_time(actual, end)
+            if fire_at is None:
+                self._reminders.pop(reminder_id, None)
+                return
+            if self._reminders.get(reminder_id) == (actual, end, fire_at):
+                # 调度不变（例如同步时再次应用本进程已处理过的写入），不再压入重复条目
+                return
+            self._reminders[reminder_id] = (actual, end, fire_at)
+            self._push(fire_at, ('reminder', reminder_id))
+
+    def upsert_many(self, rows):
+        """批量新增或更新，rows 为包含 id、actual_reminder_date、end_date 的字典"""
+        for row in rows:
+            self.upsert(row['id'], row.get('actual_reminder_date'), row.get('end_date'))
+
+    def remove(self, reminder_id):
+        """删除一个提醒项的调度（堆中的旧条目在出堆时被丢弃）"""
+        with self._cond:
+            self._reminders.pop(reminder_id, None)
+
+    def reload(self):
+        """从数据库重新加载所有未过期的提醒项（启动时以及批量变更后调用）"""
+        today = datetime.date.today().strftime(DATE_FORMAT)
+        with get_db() as conn:
+            # 版本号和提醒项在同一个读事务中读取，之后的增量同步从这个版本号开始
+            conn.execute('BEGIN')
+            version = data_version.get_data_version(data_version.REMINDERS, conn)
+            rows = conn.execute(
+                'SELECT id, actual_reminder_date, end_date FROM reminders WHERE end_date >= ?',
+                (today,)
+            ).fetchall()
+
+        now = datetime.datetime.now()
+        reminders = {}
+        heap = []
+        counter = self._counter
+        for row in rows:
+            actual = _parse_date(row['actual_reminder_date'])
+            end = _parse_date(row['end_date'])
+            fire_at = self.next_fire_time(actual, end, now)
+            if fire_at is not None:
+                reminders[row['id']] = (actual, end, fire_at)
+                heap.append((fire_at, next(counter), ('reminder', row['id'])))
+
+        with self._cond:
+            for name, (at_time, func, fire_at) in self._jobs.items():
+                heap.append((fire_at, next(counter), ('job', name)))
+            heapq.heapify(heap)
+            self._heap = heap
+            self._reminders = reminders
+            self._version = version
+            self._stats['reloads'] += 1
+            self._cond.notify()
+        logging.info(f"提醒调度器已加载 {len(reminders)} 个待通知的提醒项")
+
+    def reload_if_changed(self):
+        """
+        reminders 的数据版本号变化时同步变更（其他进程修改了提醒项）
+
+        只取回 row_version 大于上次同步版本号的行和之后的墓碑；本进程已经增量应用过的
+        写入会再应用一次（结果相同）。变更过多或版本号回退（数据库被替换）时整体重新加载。
+        """
+        if self._version is None:
+            self.reload()
+            return
+        with get_db() as conn:
+            # 在一个读事务中读取版本号和变更，得到一致的快照
+            conn.execute('BEGIN')
+            version = data_version.get_data_version(data_version.REMINDERS, conn)
+            if version == self._version:
+                return
+            changes = fetch_reminder_changes(conn, self._version, version)
+        if changes['reset']:
+            self.reload()
+            return
+        for reminder_id in changes['deleted']:
+            self.remove(reminder_id)
+        self.upsert_many(changes['changed'])
+        with self._cond:
+            self._version = version
+            self._stats['refreshes'] += 1
+        logging.info(
+            f"提醒调度器已同步版本 {version} 的变更：{len(changes['changed'])} 个更新，{len(changes['deleted'])} 个删除"
+        )
+
+    def add_daily_job(self, name, at_time, func):
+        """添加每天在 at_time 执行一次的任务（例如自动续期）"""
+        with self._cond:
+            fire_at = self._next_job_time(at_time)
+            self._jobs[name] = (at_time, func, fire_at)
+            self._push(fire_at, ('job', name))
+
+    def _next_job_time(self, at_time, now=None):
+        if now is None:
+            now = datetime.datetime.now()
+        fire_at = datetime.datetime.combine(now.date(), at_time)
+        if fire_at <= now:
+            fire_at += datetime.timedelta(days=1)
+        return fire_at
+
+    # --- 调度循环 ---
+
+    def _is_current(self, fire_at, key):
+        kind, ident = key
+        if kind == 'reminder':
+            entry = self._reminders.get(ident)
+            return entry is not None and entry[2] == fire_at
+        job = self._jobs.get(ident)
+        return job is not None and job[2] == fire_at
+
+    def _pop_due(self, now):
+        """弹出所有已到期的条目，并为它们安排下一次触发；调用方需持有锁"""
+        due_reminders = []
+        due_jobs = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, key = heapq.heappop(self._heap)
+            if not self._is_current(fire_at, key):
+                continue
+            kind, ident = key
+            if kind == 'reminder':
+                due_reminders.append(ident)
+                actual, end, _ = self._reminders[ident]
+                next_fire = self.next_fire_time(actual, end, now)
+                if next_fire is None:
+                    del self._reminders[ident]
+                else:
+                    self._reminders[ident] = (actual, end, next_fire)
+                    heapq.heappush(self._heap, (next_fire, next(self._counter), key))
+            else:
+                at_time, func, _ = self._jobs[ident]
+                due_jobs.append((ident, func))
+                next_fire = self._next_job_time(at_time, now)
+                self._jobs[ident] = (at_time, func, next_fire)
+                heapq.heappush(self._heap, (next_fire, next(self._counter), key))
+        return due_reminders, due_jobs
+
+    def _discard_stale_head(self):
+        while self._heap and not self._is_current(self._heap[0][0], self._heap[0][2]):
+            heapq.heappop(self._heap)
+
+    def next_wakeup(self):
+        """下一次触发时间，没有待触发条目时返回 None"""
+        with self._cond:
+            self._discard_stale_head()
+            return self._heap[0][0] if self._heap else None
+
+    def run(self):
+        """调度循环：睡眠到堆顶的触发时间，然后执行到期的任务和通知"""
+        last_reload = datetime.datetime.now()
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                self._discard_stale_head()
+                now = datetime.datetime.now()
+                timeout = None
+                if self._heap:
+                    timeout = max((self._heap[0][0] - now).total_seconds(), 0)
+                if self.refresh_interval is not None:
+                    until_refresh = self.refresh_interval - (now - last_reload).total_seconds()
+                    timeout = max(until_refresh, 0) if timeout is None else min(timeout, max(until_refresh, 0))
+                if timeout is None or timeout > 0:
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                self._stats['wakeups'] += 1
+                now = datetime.datetime.now()
+                due_reminders, due_jobs = self._pop_due(now)
+
+            # 回调在锁外执行，避免阻塞增量更新
+            for name, func in due_jobs:
+                self._call(f'每日任务 {name}', func)
+            if due_reminders:
+                self._stats['fired'] += len(due_reminders)
+                logging.info(f"提醒调度器: {len(due_reminders)} 个提醒项到达通知时间")
+                self._call('提醒通知', self.on_due, due_reminders)
+
+            if self.refresh_interval is not None:
+                now = datetime.datetime.now()
+                if (now - last_reload).total_seconds() >= self.refresh_interval:
+                    self._call('重新加载提醒项', self.reload_if_changed)
+                    last_reload = now
+
+    def _call(self, description, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            logging.error(f"提醒调度器执行{description}时发生错误: {e}")
+            traceback.print_exc()
+
+    def start(self):
+        """加载全部提醒项并在后台线程中运行调度循环"""
+        self.reload()
+        self._thread = threading.Thread(target=self.run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            result = dict(self._stats)
+            result['scheduled_reminders'] = len(self._reminders)
+            result['heap_size'] = len(self._heap)
+        next_wakeup = self.next_wakeup()
+        result['next_wakeup'] = next_wakeup.isoformat(timespec='seconds') if next_wakeup else None
+        return result
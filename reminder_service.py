@@ -1,24 +1,31 @@
 #!/usr/bin/env python3
-import time
-import schedule
-import sys
 import os
+import sys
 
 # 添加项目目录到 Python 路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from email_utils import check_upcoming_reminders_for_dingtalk
+from reminder_scheduler import ReminderScheduler
+from notification_outbox import outbox_worker, WORKER_MODE
+
+# 独立进程收不到 Web 应用的增量更新，最长每隔这么多秒检查一次数据版本号，有变化时只取回变化的行
+REFRESH_INTERVAL = int(os.environ.get('REMINDER_SCHEDULER_REFRESH_SECONDS', '60'))
 
 def run_scheduler():
-    """运行定时任务调度器"""
-    # 每天上午9点执行一次检查和通知
-    schedule.every().day.at("09:00").do(check_upcoming_reminders_for_dingtalk)
+    """运行提醒调度器（阻塞）"""
+    scheduler = ReminderScheduler(
+        on_due=lambda reminder_ids: check_upcoming_reminders_for_dingtalk(),
+        refresh_interval=REFRESH_INTERVAL
+    )
+    scheduler.reload()
+    if WORKER_MODE != 'external':
+        outbox_worker.start()
     
-    print("定时任务已启动，每天上午9点将检查即将到期的项目并发送钉钉消息。")
+    next_wakeup = scheduler.next_wakeup()
+    print(f"提醒调度器已启动，下一次通知时间: {next_wakeup or '暂无待通知的项目'}")
     
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # 每分钟检查一次
+    scheduler.run()
 
 if __name__ == "__main__":
-    run_scheduler()
\ No newline at end of file
+    run_scheduler()
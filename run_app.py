@@ -1,24 +1,81 @@
 # run_app.py
 import os
-import sys
-import threading
-import time
-import schedule
-from app import app, check_upcoming_reminders_for_email
-
-def run_scheduler():
-    """运行定时任务调度器"""
-    # 每天上午9点执行一次检查和通知
-    schedule.every().day.at("09:00").do(check_upcoming_reminders_for_email)
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # 每分钟检查一次
+import datetime
+from app import app, check_upcoming_reminders_for_email, auto_renew_reminders, add_reminder_change_listener
+from reminder_scheduler import ReminderScheduler
+from notification_outbox import outbox_worker, WORKER_MODE
+from leader_lease import LeaderLease
+
+# 每天上午9点前先为已过期的自动续期项目生成下一周期
+AUTO_RENEW_TIME = datetime.time(8, 55)
+
+# 多进程部署时其他进程的写入不会通知到本进程的调度器，最长每隔这么多秒检查一次数据版本号
+REFRESH_INTERVAL = int(os.environ.get('REMINDER_SCHEDULER_REFRESH_SECONDS', '60'))
+
+# 调度器租约名：所有进程中只有持有该租约的进程运行调度器
+SCHEDULER_LEASE = 'scheduler'
+
+# 当前进程中运行的调度器（不是租约持有者时为 None）
+_current = {'scheduler': None}
+
+
+def _on_reminders_changed(upserted, deleted):
+    """本进程内的提醒项增删改增量更新到调度器"""
+    scheduler = _current['scheduler']
+    if scheduler is None:
+        return
+    if upserted is None and deleted is None:
+        scheduler.reload()
+        return
+    for reminder_id in deleted or []:
+        scheduler.remove(reminder_id)
+    scheduler.upsert_many(upserted or [])
+
+
+add_reminder_change_listener(_on_reminders_changed)
+
+
+def start_scheduler():
+    """启动提醒调度器：按每个提醒项的下一次通知时间唤醒，并随提醒项的增删改增量更新"""
+    # 同一时刻到期的提醒项汇总成一次检查和通知
+    scheduler = ReminderScheduler(
+        on_due=lambda reminder_ids: check_upcoming_reminders_for_email(),
+        refresh_interval=REFRESH_INTERVAL
+    )
+    scheduler.add_daily_job('auto_renew', AUTO_RENEW_TIME, auto_renew_reminders)
+    scheduler.start()
+    _current['scheduler'] = scheduler
+    return scheduler
+
+
+def stop_scheduler():
+    scheduler = _current['scheduler']
+    _current['scheduler'] = None
+    if scheduler is not None:
+        scheduler.stop()
+
+
+def start_background_services():
+    """
+    每个进程启动时调用一次：启动通知发件箱 worker，并参与调度器选举
+
+    发件箱任务通过租约领取，每个进程都可以运行 worker；调度器只在获得
+    SCHEDULER_LEASE 租约的进程中运行，持有者退出或崩溃后由其他进程接替。
+
+    :return: LeaderLease，进程退出时调用其 stop() 释放租约
+    """
+    # REMINDER_OUTBOX_WORKER=external 时由独立的 outbox_service.py 负责
+    if WORKER_MODE != 'external':
+        outbox_worker.start()
+
+    lease = LeaderLease(SCHEDULER_LEASE)
+    lease.start(on_elected=start_scheduler, on_lost=stop_scheduler)
+    return lease
+
 
 if __name__ == "__main__":
-    # 在单独的线程中运行定时任务调度器
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-    scheduler_thread.start()
+    # 在后台线程中运行提醒调度器（与其他实例同时运行时只有一个会执行定时任务）
+    start_background_services()
     
-    # 启动 Flask 应用
-    app.run(host='0.0.0.0', port=5009, debug=False)
\ No newline at end of file
+    # 启动 Flask 开发服务器；生产环境请使用 gunicorn -c gunicorn.conf.py app:app
+    app.run(host='0.0.0.0', port=5009, debug=False)
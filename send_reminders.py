@@ -15,6 +15,10 @@ try:
     from email_utils import check_upcoming_reminders_for_email
     print("开始执行定时邮件检查任务...")
     check_upcoming_reminders_for_email()
+    # 脚本即将退出，先把已入队的通知投递完；失败的任务留在发件箱中按退避时间重试
+    from notification_outbox import outbox_worker
+    delivered = outbox_worker.drain()
+    print(f"已处理 {delivered} 个通知任务。")
     print("定时邮件检查任务执行完毕。")
 except Exception as e:
     print(f"定时任务执行失败: {e}")
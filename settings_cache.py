@@ -0,0 +1,111 @@
+# settings_cache.py
+"""
+settings 表的进程内缓存
+
+所有配置项用一条查询一次性加载，之后的读取直接走内存；修改配置的接口
+（邮箱配置、钉钉配置、修改密码）在提交后调用 invalidate()，下一次读取时重新加载。
+app.py 和 email_utils.py 共用同一个 settings_cache 实例。
+
+快照记录加载时 settings 的数据版本号（见 data_version.py）。读取邮箱/钉钉配置
+和登录密码时先比对版本号，其他进程修改了配置时也能读到新值。
+"""
+
+import threading
+import logging
+
+from db import get_db
+import data_version
+
+# 邮箱配置项
+EMAIL_SETTING_KEYS = ['smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'recipient_email']
+
+# 钉钉配置项
+DINGTALK_SETTING_KEYS = ['dingtalk_webhook', 'dingtalk_secret']
+
+
+class SettingsCache:
+    """settings 表的只读快照，失效后在下一次读取时整体重新加载"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+        self._version = None
+        self._loads = 0
+
+    def _load(self):
+        with get_db() as conn:
+            version = data_version.get_data_version(data_version.SETTINGS, conn)
+            rows = conn.execute('SELECT key, value FROM settings').fetchall()
+        return {row['key']: row['value'] for row in rows}, version
+
+    def _snapshot(self):
+        """返回当前快照，必要时从数据库加载"""
+        values = self._values
+        if values is not None:
+            return values
+        with self._lock:
+            if self._values is None:
+                self._values, self._version = self._load()
+                self._loads += 1
+            return self._values
+
+    def invalidate(self):
+        """配置被修改后调用，丢弃缓存的快照"""
+        with self._lock:
+            self._values = None
+            self._version = None
+
+    def check_version(self, version=None):
+        """
+        快照的版本号与数据库不一致时丢弃快照（一次主键查询）
+
+        :param version: 调用方已读取的 settings 版本号，不传时查询数据库
+        """
+        if self._values is None:
+            return
+        if version is None:
+            version = data_version.get_data_version(data_version.SETTINGS)
+        if version != self._version:
+            self.invalidate()
+
+    def get(self, key, default=''):
+        """获取字符串配置，不存在或为 NULL 时返回 default"""
+        value = self._snapshot().get(key)
+        return default if value is None else value
+
+    def get_int(self, key, default=None):
+        """获取整数配置，为空或无法解析时返回 default"""
+        value = self.get(key, None)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            if value not in (None, ''):
+                logging.warning(f"配置项 {key} 不是有效的整数: {value}")
+            return default
+
+    def get_many(self, keys):
+        """按给定的键返回配置字典，缺失的键为空字符串"""
+        snapshot = self._snapshot()
+        return {key: snapshot.get(key) or '' for key in keys}
+
+    def get_email_config(self):
+        """邮箱配置（包含 sender_password）"""
+        self.check_version()
+        return self.get_many(EMAIL_SETTING_KEYS)
+
+    def get_dingtalk_config(self):
+        """钉钉配置（包含 dingtalk_secret）"""
+        self.check_version()
+        return self.get_many(DINGTALK_SETTING_KEYS)
+
+    def get_password(self):
+        """登录密码，未设置时返回 None"""
+        self.check_version()
+        return self._snapshot().get('password')
+
+    def stats(self):
+        """缓存状态，便于排查"""
+        return {'loaded': self._values is not None, 'version': self._version, 'loads': self._loads}
+
+
+settings_cache = SettingsCache()
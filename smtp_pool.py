@@ -0,0 +1,228 @@
+# smtp_pool.py
+"""
+复用 SMTP 会话的邮件发送器
+
+原先每发一封邮件都要新建连接、STARTTLS（或 SSL 握手）并登录一次。
+PooledSMTPSender 保持一个已登录的会话，在多次发送之间复用：
+- 同一批的多封邮件（按收件人或按办事员拆分）都走同一个连接；
+- 连接空闲超过 idle_timeout 秒后自动关闭，下一次发送时重新登录；
+- 服务器断开连接或会话失效时自动重连一次并重试当前邮件；
+- 邮箱配置（服务器、端口、账号、密码）变化时丢弃旧会话。
+"""
+
+import logging
+import os
+import smtplib
+import ssl
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from notification_dispatcher import DEFAULT_CHANNEL_TIMEOUTS
+
+# 会话空闲多久后关闭（秒）
+DEFAULT_IDLE_TIMEOUT = float(os.environ.get('REMINDER_SMTP_IDLE_TIMEOUT', '120'))
+
+# 连接方式：starttls（默认，端口 465 时使用 SSL）、ssl，或 none（明文 SMTP，仅用于本机中继或测试替身）
+SMTP_SECURITY = os.environ.get('REMINDER_SMTP_SECURITY', 'starttls').lower()
+
+# 为 True 时每个收件人单独发送一封邮件（同一个连接），否则一封邮件发给全部收件人
+PER_RECIPIENT = os.environ.get('REMINDER_EMAIL_PER_RECIPIENT', '').lower() in ('1', 'true', 'yes')
+
+# 这些异常说明连接已经不可用，需要重连后重试
+RECONNECT_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPSenderRefused,  # 部分服务器在会话超时后以 421 拒绝 MAIL FROM
+    ConnectionError,
+    TimeoutError,
+    ssl.SSLError,
+)
+
+
+def parse_recipients(recipient_string):
+    """将逗号分隔的收件人字符串拆分为列表，去除空白"""
+    return [email.strip() for email in (recipient_string or '').split(',') if email.strip()]
+
+
+def build_message(sender, recipients, subject, body):
+    """生成纯文本邮件（UTF-8）"""
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = ", ".join(recipients)  # 在邮件头中显示所有收件人
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain", 'utf-8'))  # 指定编码
+    return message
+
+
+class PooledSMTPSender:
+    """
+    复用已登录 SMTP 会话的发送器（线程安全，同一时刻只有一个发送在使用会话）
+
+    :param idle_timeout: 会话空闲多少秒后关闭
+    :param timeout: 套接字超时（秒）
+    """
+
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=None):
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout if timeout is not None else DEFAULT_CHANNEL_TIMEOUTS['email']
+        self._lock = threading.RLock()
+        self._server = None
+        self._key = None
+        self._last_used = 0
+        self._idle_timer = None
+        self._stats = {'connects': 0, 'reconnects': 0, 'messages_sent': 0, 'messages_failed': 0}
+
+    # --- 会话管理 ---
+
+    @staticmethod
+    def _config_key(config):
+        return (config['smtp_server'], int(config['smtp_port']), config['sender_email'], config['sender_password'])
+
+    def _connect(self, config):
+        port = int(config['smtp_port'])
+        # 创建安全的 SSL 上下文
+        context = ssl.create_default_context()
+        if port == 465 or SMTP_SECURITY == 'ssl':
+            # 使用 SMTP_SSL 连接（适用于端口 465）
+            server = smtplib.SMTP_SSL(config['smtp_server'], port, context=context, timeout=self.timeout)
+        else:
+            # 使用普通 SMTP 连接并启动 TLS（适用于端口 587 等）
+            server = smtplib.SMTP(config['smtp_server'], port, timeout=self.timeout)
+            if SMTP_SECURITY != 'none':
+                server.starttls(context=context)
+        try:
+            server.login(config['sender_email'], config['sender_password'])
+        except Exception:
+            self._quit(server)
+            raise
+        self._stats['connects'] += 1
+        logging.info(f"已建立 SMTP 会话: {config['smtp_server']}:{port}")
+        return server
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _session(self, config):
+        """返回可用的会话；配置变化或空闲过久时重新连接"""
+        key = self._config_key(config)
+        if self._server is not None and (
+            self._key != key or time.monotonic() - self._last_used > self.idle_timeout
+        ):
+            self._close_locked()
+        if self._server is None:
+            self._server = self._connect(config)
+            self._key = key
+            self._last_used = time.monotonic()
+        return self._server
+
+    def _close_locked(self):
+        if self._server is not None:
+            self._quit(self._server)
+        self._server = None
+        self._key = None
+
+    def _schedule_idle_close(self):
+        """空闲 idle_timeout 秒后在后台关闭会话，不占着服务器的连接"""
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(self.idle_timeout, self.close_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def close_if_idle(self):
+        with self._lock:
+            if self._server is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+                logging.info("SMTP 会话空闲超时，已关闭")
+                self._close_locked()
+
+    def close(self):
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            self._close_locked()
+
+    # --- 发送 ---
+
+    def send_messages(self, config, messages):
+        """
+        通过同一个会话依次发送多封邮件
+
+        :param config: 邮箱配置（smtp_server、smtp_port、sender_email、sender_password）
+        :param messages: [(收件人列表, MIME 邮件对象)]
+        :return: 与 messages 对应的结果列表，每项为 {'recipients', 'ok', ['error']}
+        """
+        results = []
+        with self._lock:
+            try:
+                for recipients, message in messages:
+                    results.append(self._send_one(config, recipients, message))
+            finally:
+                self._last_used = time.monotonic()
+                if self._server is not None:
+                    self._schedule_idle_close()
+        return results
+
+    def _send_one(self, config, recipients, message):
+        text = message.as_string()
+        for attempt in (1, 2):
+            try:
+                server = self._session(config)
+                # sendmail 的第二个参数需要一个收件人列表
+                server.sendmail(config['sender_email'], recipients, text)
+                self._last_used = time.monotonic()
+                self._stats['messages_sent'] += 1
+                return {'recipients': recipients, 'ok': True}
+            except RECONNECT_ERRORS as e:
+                # 会话失效：丢弃连接，重连后再试一次
+                self._close_locked()
+                if attempt == 2:
+                    error = e
+                    break
+                self._stats['reconnects'] += 1
+                logging.warning(f"SMTP 会话不可用 ({e})，重新连接后重试")
+            except Exception as e:
+                # 收件人被拒等与连接无关的错误，不重试；登录失败时会话也不再保留
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    self._close_locked()
+                error = e
+                break
+        self._stats['messages_failed'] += 1
+        logging.error(f"发送邮件至 {', '.join(recipients)} 失败: {error}")
+        return {'recipients': recipients, 'ok': False, 'error': str(error)}
+
+    def send_digest(self, config, subject, body, recipients=None, per_recipient=None):
+        """
+        发送一份汇总邮件
+
+        :param recipients: 收件人列表，默认取配置中的 recipient_email
+        :param per_recipient: 为 True 时每个收件人单独一封（同一个连接），默认取 PER_RECIPIENT
+        :return: send_messages() 的结果列表
+        """
+        if recipients is None:
+            recipients = parse_recipients(config.get('recipient_email'))
+        if per_recipient is None:
+            per_recipient = PER_RECIPIENT
+        sender = config['sender_email']
+        if per_recipient:
+            messages = [([recipient], build_message(sender, [recipient], subject, body)) for recipient in recipients]
+        else:
+            messages = [(recipients, build_message(sender, recipients, subject, body))]
+        return self.send_messages(config, messages)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['connected'] = self._server is not None
+        return result
+
+
+smtp_sender = PooledSMTPSender()
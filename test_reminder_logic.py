@@ -0,0 +1,309 @@
+# test_reminder_logic.py
+"""
+通知阶段、分页游标、自动续期和增量同步的单元测试
+
+只使用临时的 SQLite 数据库，不会读写项目目录中的 reminders.db：
+    python -m pytest -q test_reminder_logic.py
+"""
+
+import datetime
+import sqlite3
+
+import pytest
+
+import db
+import data_version
+from auto_renew import ensure_auto_renew_schema, run_auto_renew
+from data_version import ensure_data_version_schema, bump_data_version
+from notification_state import (
+    STAGE_FIRST, STAGE_REPEAT, STAGE_FINAL, REPEAT_DAYS,
+    ensure_notification_state_schema, fetch_notice_states, notice_stage, select_needing_notice,
+    record_notices, build_notice_record, record_delivered_notices, purge_expired_notification_state,
+)
+from reminder_changes import ensure_change_tracking_schema, record_tombstone, fetch_reminder_changes
+from reminder_queries import SORT_KEYS, create_reminder_indexes, fetch_reminder_page
+
+# 与 app.py 中 REMINDERS_TABLE_SQL 相同的基础表结构，后来增加的列由各模块的 ensure_*_schema 添加
+REMINDERS_TABLE_SQL = '''
+    CREATE TABLE reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        certifier TEXT,
+        handler TEXT,
+        period INTEGER,
+        start_date TEXT,
+        end_date TEXT NOT NULL,
+        advance_days INTEGER NOT NULL,
+        actual_reminder_date TEXT,
+        auto_renew BOOLEAN DEFAULT FALSE,
+        renew_period INTEGER
+    )
+'''
+
+TODAY = datetime.date(2026, 3, 15)
+
+
+def create_schema(conn):
+    cursor = conn.cursor()
+    cursor.execute(REMINDERS_TABLE_SQL)
+    create_reminder_indexes(cursor)
+    ensure_auto_renew_schema(cursor)
+    ensure_change_tracking_schema(cursor)
+    ensure_data_version_schema(cursor)
+    ensure_notification_state_schema(cursor)
+    conn.commit()
+
+
+def insert_reminder(conn, name, end_date, actual_reminder_date=None, advance_days=0, version=0, **columns):
+    values = dict(
+        name=name, type='证书', end_date=end_date, advance_days=advance_days,
+        actual_reminder_date=actual_reminder_date, row_version=version, **columns
+    )
+    cursor = conn.execute(
+        f"INSERT INTO reminders ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+        list(values.values())
+    )
+    return cursor.lastrowid
+
+
+@pytest.fixture
+def conn():
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    create_schema(connection)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def pooled_db(tmp_path):
+    """让 db.get_db() 指向临时数据库文件（run_auto_renew 等函数通过连接池访问数据库）"""
+    old_database = db.DATABASE
+    db.configure(database=str(tmp_path / 'reminders.db'))
+    with db.get_db() as connection:
+        create_schema(connection)
+    yield db
+    db.configure(database=old_database)
+
+
+# --- 通知阶段 ---
+
+def _state(end_date, next_notify_date):
+    return {'end_date': end_date, 'next_notify_date': next_notify_date}
+
+
+def test_notice_stage_first_when_never_notified():
+    assert notice_stage({'end_date': '2026-03-30'}, None, '2026-03-15') == STAGE_FIRST
+
+
+def test_notice_stage_final_on_end_date_even_without_state():
+    assert notice_stage({'end_date': '2026-03-15'}, None, '2026-03-15') == STAGE_FINAL
+
+
+def test_notice_stage_waits_until_next_notify_date():
+    reminder = {'end_date': '2026-03-30'}
+    assert notice_stage(reminder, _state('2026-03-30', '2026-03-16'), '2026-03-15') is None
+    assert notice_stage(reminder, _state('2026-03-30', '2026-03-15'), '2026-03-15') == STAGE_REPEAT
+
+
+def test_notice_stage_final_when_repeat_falls_on_end_date():
+    reminder = {'end_date': '2026-03-15'}
+    assert notice_stage(reminder, _state('2026-03-15', '2026-03-15'), '2026-03-15') == STAGE_FINAL
+
+
+def test_notice_stage_never_after_final_notice():
+    reminder = {'end_date': '2026-03-15'}
+    assert notice_stage(reminder, _state('2026-03-15', None), '2026-03-15') is None
+
+
+def test_notice_stage_renotifies_after_end_date_changes():
+    reminder = {'end_date': '2026-04-30'}
+    assert notice_stage(reminder, _state('2026-03-30', '2026-03-20'), '2026-03-15') == STAGE_FIRST
+
+
+def test_select_needing_notice_keeps_order_and_adds_stage():
+    reminders = [
+        {'id': 1, 'end_date': '2026-03-30'},
+        {'id': 2, 'end_date': '2026-03-15'},
+        {'id': 3, 'end_date': '2026-03-20'},
+    ]
+    states = {3: _state('2026-03-20', '2026-03-18')}
+    selected = select_needing_notice(reminders, states, TODAY)
+    assert [(item['id'], item['notice_stage']) for item in selected] == [(1, STAGE_FIRST), (2, STAGE_FINAL)]
+    assert 'notice_stage' not in reminders[0]
+
+
+def test_stage_progression_first_weekly_final(conn):
+    """一个提前 10 天进入提醒窗口的项目：首次提醒，一周后重复提醒，到期当天最后提醒"""
+    end_date = TODAY + datetime.timedelta(days=10)
+    reminder = {'id': 1, 'end_date': end_date.isoformat()}
+    notified = []
+    for offset in range(12):
+        day = TODAY + datetime.timedelta(days=offset)
+        states = fetch_notice_states(conn, ['email'], [1])['email']
+        selected = select_needing_notice([reminder], states, day)
+        if selected:
+            notified.append((offset, selected[0]['notice_stage']))
+            record_notices(conn, 'email', selected, day)
+    assert notified == [(0, STAGE_FIRST), (REPEAT_DAYS, STAGE_REPEAT), (10, STAGE_FINAL)]
+
+
+def test_delivered_notice_record_round_trip(conn):
+    reminders = [{'id': 5, 'end_date': '2026-03-30', 'notice_stage': STAGE_FIRST}]
+    record_delivered_notices(conn, build_notice_record('route:2', reminders, TODAY))
+    states = fetch_notice_states(conn, ['route:2', 'email'], [5])
+    assert states['email'] == {}
+    assert states['route:2'][5]['stage'] == STAGE_FIRST
+    assert states['route:2'][5]['last_notified'] == '2026-03-15'
+    assert states['route:2'][5]['next_notify_date'] == '2026-03-22'
+
+
+def test_fetch_notice_states_reads_only_requested_ids(conn):
+    record_notices(conn, 'email', [{'id': reminder_id, 'end_date': '2026-03-30'} for reminder_id in range(1, 1201)], TODAY)
+    states = fetch_notice_states(conn, ['email'], list(range(600, 1300)) + [600])
+    assert sorted(states['email']) == list(range(600, 1201))
+
+
+def test_purge_expired_notification_state(conn):
+    record_notices(conn, 'email', [
+        {'id': 1, 'end_date': '2026-03-14'}, {'id': 2, 'end_date': '2026-03-15'},
+    ], TODAY - datetime.timedelta(days=3))
+    assert purge_expired_notification_state(conn, TODAY) == 1
+    assert [row[0] for row in conn.execute('SELECT reminder_id FROM notification_state')] == [2]
+
+
+# --- keyset 分页游标 ---
+
+@pytest.fixture
+def paged_conn(conn):
+    # 排序键有重复值和空值，验证游标用 (排序键, id) 定位不会跳过或重复
+    for index in range(23):
+        insert_reminder(
+            conn, name=f'项目{index % 5}', end_date=f'2026-04-{index % 7 + 1:02d}',
+            actual_reminder_date=None if index % 4 == 0 else f'2026-03-{index % 6 + 1:02d}',
+            handler=None if index % 3 == 0 else f'办事员{index % 2}',
+        )
+    return conn
+
+
+@pytest.mark.parametrize('sort', sorted(SORT_KEYS))
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_page_tokens_cover_all_rows_in_order(paged_conn, sort, order):
+    direction = 'ASC' if order == 'asc' else 'DESC'
+    expected = [row[0] for row in paged_conn.execute(
+        f'SELECT id FROM reminders ORDER BY {SORT_KEYS[sort]} {direction}, id {direction}'
+    )]
+    ids = []
+    token = None
+    while True:
+        args = {'sort': sort, 'order': order, 'limit': '4'}
+        if token:
+            args['page_token'] = token
+        page = fetch_reminder_page(paged_conn, args, TODAY)
+        ids.extend(item['id'] for item in page['items'])
+        token = page['next_page_token']
+        if token is None:
+            break
+    assert ids == expected
+
+
+def test_page_token_rejected_for_other_sort(paged_conn):
+    page = fetch_reminder_page(paged_conn, {'sort': 'name', 'limit': '4'}, TODAY)
+    with pytest.raises(ValueError):
+        fetch_reminder_page(paged_conn, {'sort': 'end_date', 'limit': '4', 'page_token': page['next_page_token']}, TODAY)
+    with pytest.raises(ValueError):
+        fetch_reminder_page(paged_conn, {'sort': 'name', 'order': 'desc', 'page_token': page['next_page_token']}, TODAY)
+
+
+def test_page_token_rejects_garbage(paged_conn):
+    with pytest.raises(ValueError):
+        fetch_reminder_page(paged_conn, {'page_token': 'not-a-token'}, TODAY)
+
+
+# --- 自动续期 ---
+
+def test_auto_renew_catches_up_several_periods(pooled_db):
+    with pooled_db.get_db() as connection:
+        source_id = insert_reminder(
+            connection, '营业执照', '2026-01-10', '2026-01-05', advance_days=5, auto_renew=1, renew_period=30
+        )
+        insert_reminder(connection, '不续期', '2026-01-10', '2026-01-05', advance_days=5, auto_renew=0)
+
+    result = run_auto_renew(TODAY)
+    assert result['renewed'] == 3
+    # 每一轮续期一个周期，直到新周期未过期；最后一轮没有可续期的项目
+    assert result['passes'] == 4
+
+    with pooled_db.get_db() as connection:
+        rows = [dict(row) for row in connection.execute(
+            'SELECT id, start_date, end_date, actual_reminder_date, renewed_from FROM reminders '
+            'WHERE renewed_from IS NOT NULL ORDER BY id'
+        )]
+    assert [(row['start_date'], row['end_date'], row['actual_reminder_date']) for row in rows] == [
+        ('2026-01-11', '2026-02-09', '2026-02-04'),
+        ('2026-02-10', '2026-03-11', '2026-03-06'),
+        ('2026-03-12', '2026-04-10', '2026-04-05'),
+    ]
+    # 续期链：每个新周期都指向上一个周期
+    assert [row['renewed_from'] for row in rows] == [source_id, rows[0]['id'], rows[1]['id']]
+    assert result['new_ids'] == [row['id'] for row in rows]
+
+
+def test_auto_renew_is_idempotent(pooled_db):
+    with pooled_db.get_db() as connection:
+        insert_reminder(connection, '许可证', '2026-03-01', '2026-02-20', advance_days=9, auto_renew=1, renew_period=365)
+    assert run_auto_renew(TODAY)['renewed'] == 1
+    version = data_version.get_data_version(data_version.REMINDERS)
+    second = run_auto_renew(TODAY)
+    assert second['renewed'] == 0
+    # 没有续期时撤销版本号的递增
+    assert data_version.get_data_version(data_version.REMINDERS) == version
+
+
+# --- 增量同步和墓碑 ---
+
+def _write(conn, name, **columns):
+    version = bump_data_version(conn, data_version.REMINDERS)
+    return insert_reminder(conn, name, '2026-05-01', version=version, **columns), version
+
+
+def _delete(conn, reminder_id):
+    version = bump_data_version(conn, data_version.REMINDERS)
+    conn.execute('DELETE FROM reminders WHERE id = ?', (reminder_id,))
+    record_tombstone(conn, reminder_id, version)
+    return version
+
+
+def test_changes_since_version(conn):
+    first_id, since = _write(conn, 'a')
+    second_id, _ = _write(conn, 'b')
+    _delete(conn, first_id)
+    third_id, current = _write(conn, 'c')
+
+    changes = fetch_reminder_changes(conn, since, current)
+    assert [row['id'] for row in changes['changed']] == [second_id, third_id]
+    assert changes['deleted'] == [first_id]
+    assert not changes['reset']
+
+
+def test_changes_up_to_date_and_reset(conn):
+    _, current = _write(conn, 'a')
+    assert fetch_reminder_changes(conn, current, current)['changed'] == []
+    # 客户端的版本号比服务器新：数据库被替换过
+    assert fetch_reminder_changes(conn, current + 1, current)['reset']
+
+
+def test_changes_reset_when_too_many(conn):
+    for index in range(4):
+        _, current = _write(conn, f'r{index}')
+    assert fetch_reminder_changes(conn, 0, current, limit=3)['reset']
+    assert not fetch_reminder_changes(conn, 0, current, limit=4)['reset']
+
+
+def test_tombstone_before_since_not_returned(conn):
+    reminder_id, _ = _write(conn, 'a')
+    deleted_version = _delete(conn, reminder_id)
+    _, current = _write(conn, 'b')
+    assert fetch_reminder_changes(conn, deleted_version, current)['deleted'] == []
+    assert fetch_reminder_changes(conn, deleted_version - 1, current)['deleted'] == [reminder_id]